@@ -0,0 +1,297 @@
+"""ブログネタ生成のヘッドレスHTTP API（Streamlit UIから独立してスケール可能）
+
+起動方法:
+    uvicorn api_server:app --host 0.0.0.0 --port 8000
+
+エンドポイント:
+    GET  /health      アドミッション制御と外部APIの状態
+    GET  /categories  Qiitaのトレンドから技術分野を生成
+    POST /ideas       ブログネタをServer-Sent Eventsでストリーミング（完成したネタはideaイベントで送信）
+    POST /summary     Xポスト用の要約を生成
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from utils.agent_setup import create_blog_suggester_agent
+from utils.category_generator import generate_tech_categories
+from utils.idea_generator import generate_blog_ideas, generate_tweet_summary
+from utils.idea_parser import IdeaStreamParser, parse_idea_cards
+from utils.circuit_breaker import google_cse_breaker
+from utils.singleflight import get_coalescing_stats
+from utils.qiita_index import get_qiita_index
+from utils.tag_cooccurrence import expand_keywords, get_tag_model
+from utils.request_context import RequestContext, get_cancellation_stats
+from utils.bedrock_clients import get_region_pool
+from utils.admission import AdaptiveLimiter, AdmissionRejected
+from utils.speculation import create_speculator
+
+API_MAX_WORKERS = int(os.getenv("API_MAX_WORKERS", "4"))
+API_MAX_QUEUE = int(os.getenv("API_MAX_QUEUE", "16"))
+# /categoriesで一度に生成できる技術分野の数の上限
+MAX_CATEGORIES = 12
+
+
+# 同時実行数はBedrockのレイテンシとスロットリングに応じてAPI_MAX_WORKERSまでの範囲で調整し、
+# 待機中のリクエストはセッションごとに公平に実行する
+pool = AdaptiveLimiter(
+    initial_limit=min(float(os.getenv("ADMISSION_INITIAL_LIMIT", "4")), API_MAX_WORKERS),
+    max_limit=API_MAX_WORKERS,
+    max_queue=API_MAX_QUEUE,
+    max_wait=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "120")),
+    latency_tolerance=float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))
+)
+
+# /categoriesで返した分野の準備を先回りで始める（SPECULATION_MODEで有効化、実行枠は上と共有）
+speculator = create_speculator(admission=pool)
+
+# タグの共起モデルは最初の作成もバックグラウンドで行うため、起動時に始めておく
+get_tag_model()
+
+
+def busy_response() -> JSONResponse:
+    return JSONResponse(
+        {"error": "サーバーが混み合っています。しばらくしてから再度お試しください。"},
+        status_code=503,
+        headers={"Retry-After": "5"}
+    )
+
+
+def bad_request(message: str) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=400)
+
+
+async def read_json_body(request: Request) -> dict | None:
+    """リクエストのJSONオブジェクトを読む（JSONとして読めない、またはオブジェクトでない場合はNone）"""
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def optional_string(body: dict, key: str) -> bool:
+    """bodyのkeyが省略されているか文字列か"""
+    return body.get(key) is None or isinstance(body[key], str)
+
+
+def sse(event: str, data: dict) -> str:
+    """Server-Sent Events形式の1イベントを作成"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def health(request: Request) -> JSONResponse:
+    return JSONResponse({
+        "status": "ok",
+        "workers": pool.get_stats(),
+        "google_cse": google_cse_breaker.get_state(),
+        "coalescing": get_coalescing_stats(),
+        "cancellation": get_cancellation_stats(),
+        "bedrock_regions": get_region_pool().get_stats(),
+        "speculation": speculator.get_stats(),
+        "qiita_index": index.get_stats() if (index := get_qiita_index()) else {"enabled": False},
+    })
+
+
+async def categories(request: Request) -> JSONResponse:
+    try:
+        num = int(request.query_params.get("num", "8"))
+    except ValueError:
+        num = 0
+    if not 1 <= num <= MAX_CATEGORIES:
+        return bad_request(f"num must be an integer between 1 and {MAX_CATEGORIES}")
+    session_id = request.query_params.get("session_id")
+    try:
+        async with pool.slot_async(session_id or "anonymous"):
+            result = await asyncio.to_thread(generate_tech_categories, num)
+    except AdmissionRejected:
+        return busy_response()
+    if session_id:
+        speculator.speculate(session_id, result)
+    return JSONResponse(result)
+
+
+async def speculative_stream(run):
+    """先回りの生成の出力を/ideasと同じイベントで送る"""
+    start = time.monotonic()
+    parser = IdeaStreamParser()
+    yield sse("start", {"trace_id": run.trace_id, "session_id": run.session_id, "speculative": True})
+    try:
+        async for event, data in run.follow_async():
+            if event == "delta":
+                yield sse("delta", {"text": data})
+                for card in parser.feed(data):
+                    yield sse("idea", card.to_dict())
+            elif event == "tool":
+                yield sse("tool", {"name": data})
+    except Exception as e:
+        yield sse("error", {"message": str(e)})
+        return
+    finally:
+        # クライアントが切断した場合は、/ideasと同じく生成を止める
+        if not run.done:
+            run.cancel("client_disconnected")
+    yield sse("done", {
+        "response": run.response,
+        "ideas": [card.to_dict() for card in parse_idea_cards(run.response)],
+        "trace_id": run.trace_id,
+        "elapsed_seconds": round(time.monotonic() - start, 3),
+    })
+
+
+async def ideas(request: Request):
+    body = await read_json_body(request)
+    if body is None:
+        return bad_request("request body must be a JSON object")
+    category = body.get("category")
+    if not category or not isinstance(category, str):
+        return bad_request("category is required")
+    if body.get("keywords") is not None and not (
+        isinstance(body["keywords"], list) and all(isinstance(keyword, str) for keyword in body["keywords"])
+    ):
+        return bad_request("keywords must be a list of strings")
+    if not (optional_string(body, "session_id") and optional_string(body, "trace_id")):
+        return bad_request("session_id and trace_id must be strings")
+    keywords = body.get("keywords") or await asyncio.to_thread(expand_keywords, category)
+    session_id = body.get("session_id") or str(uuid.uuid4())
+    trace_id = body.get("trace_id") or str(uuid.uuid4())
+
+    # 先回りで始めた生成があれば、実行枠を取らずにその出力を送る
+    run = speculator.claim(session_id, category)
+    if run is not None:
+        return StreamingResponse(
+            speculative_stream(run),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    try:
+        ticket = pool.enqueue(session_id)
+    except AdmissionRejected:
+        return busy_response()
+
+    async def event_stream():
+        try:
+            # 実行枠が空くまでは待ち順を送る
+            position = None
+            while not await pool.wait_async(ticket, timeout=1.0):
+                if (current := pool.position(ticket)) != position:
+                    position = current
+                    yield sse("queued", {"position": position})
+        except AdmissionRejected as e:
+            yield sse("error", {"message": str(e)})
+            return
+        finally:
+            if not ticket.granted:
+                pool.release(ticket)
+
+        try:
+            queue: asyncio.Queue = asyncio.Queue()
+            sent = 0
+            start = time.monotonic()
+
+            def on_text(full_response: str):
+                nonlocal sent
+                queue.put_nowait(("delta", {"text": full_response[sent:]}))
+                sent = len(full_response)
+
+            def on_tool(tool_name: str):
+                queue.put_nowait(("tool", {"name": tool_name}))
+
+            def on_idea(card):
+                queue.put_nowait(("idea", card.to_dict()))
+
+            context = RequestContext()
+
+            async def run():
+                agent = create_blog_suggester_agent(
+                    session_id=session_id,
+                    tags=["blog-idea-generation", "api", category],
+                    trace_id=trace_id,
+                    context=context
+                )
+                return await generate_blog_ideas(
+                    agent, category, keywords,
+                    on_text=on_text, on_tool=on_tool, context=context, on_idea=on_idea
+                )
+
+            task = asyncio.create_task(run())
+            task.add_done_callback(lambda _: queue.put_nowait(None))
+            yield sse("start", {"trace_id": trace_id, "session_id": session_id})
+
+            try:
+                while (item := await queue.get()) is not None:
+                    yield sse(*item)
+                if task.exception() is not None:
+                    yield sse("error", {"message": str(task.exception())})
+                else:
+                    yield sse("done", {
+                        "response": task.result(),
+                        "ideas": [card.to_dict() for card in parse_idea_cards(task.result())],
+                        "trace_id": trace_id,
+                        "elapsed_seconds": round(time.monotonic() - start, 3),
+                    })
+            finally:
+                # クライアントが切断した場合は生成を止める（ツールとBedrockのストリームも打ち切る）。
+                # task.cancel()はStrandsのストリームの終了処理（スレッドのjoin）をイベントループ上で
+                # 走らせてしまうため使わず、キャンセルに気づいたタスクが自分で終わるのに任せる
+                if not task.done():
+                    context.cancel("client_disconnected")
+                    # 終わったタスクの例外（キャンセル）は受け取って捨てる
+                    task.add_done_callback(lambda done: done.exception())
+        finally:
+            pool.release(ticket)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # ストリームが始まる前に切断された場合も枠を返す（release()は2回目以降は何もしない）
+        background=BackgroundTask(pool.release, ticket)
+    )
+
+
+async def summary(request: Request) -> JSONResponse:
+    body = await read_json_body(request)
+    if body is None:
+        return bad_request("request body must be a JSON object")
+    category = body.get("category")
+    response = body.get("response")
+    if not category or not response or not isinstance(category, str) or not isinstance(response, str):
+        return bad_request("category and response are required")
+    if not (optional_string(body, "session_id") and optional_string(body, "trace_id")):
+        return bad_request("session_id and trace_id must be strings")
+
+    try:
+        async with pool.slot_async(body.get("session_id") or "anonymous"):
+            agent = create_blog_suggester_agent(
+                session_id=body.get("session_id"),
+                tags=["tweet-summary", "api", category],
+                trace_id=body.get("trace_id")
+            )
+            text = await asyncio.to_thread(generate_tweet_summary, agent, response, category)
+    except AdmissionRejected:
+        return busy_response()
+    return JSONResponse({"summary": text})
+
+
+app = Starlette(routes=[
+    Route("/health", health),
+    Route("/categories", categories),
+    Route("/ideas", ideas, methods=["POST"]),
+    Route("/summary", summary, methods=["POST"]),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "8000")))
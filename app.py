@@ -1,11 +1,14 @@
 import asyncio
+import functools
+import os
 import re
 import urllib.parse
 import uuid
 import streamlit as st
 import nest_asyncio
-from utils.agent_setup import create_blog_suggester_agent
-from utils.category_generator import generate_tech_categories
+
+# strands・boto3・Google APIクライアントなどの重い依存は初回使用時にimportする
+# （コールドスタート時に画面の描画を待たせないため）
 
 # 非同期処理の設定
 nest_asyncio.apply()
@@ -24,152 +27,307 @@ st.markdown("""
 AWS発のOSS「Strands Agents」フレームワークと、Amazon BedrockのClaudeモデルを使っています。
 """)
 
-# セッション状態の初期化
-if "selected_category" not in st.session_state:
-    st.session_state.selected_category = None
-if "agent_response" not in st.session_state:
-    st.session_state.agent_response = None
+# セッション状態の初期化（画面操作のフラグのみ。カテゴリや生成結果はセッションレジストリで保持する）
 if "is_processing" not in st.session_state:
     st.session_state.is_processing = False
-if "tech_categories" not in st.session_state:
-    st.session_state.tech_categories = None
 if "is_generating_categories" not in st.session_state:
     st.session_state.is_generating_categories = False
-if "tweet_summary" not in st.session_state:
-    st.session_state.tweet_summary = None
-if "session_id" not in st.session_state:
-    # セッションIDを生成（Langfuseのトレース用）
-    st.session_state.session_id = str(uuid.uuid4())
-if "current_trace_id" not in st.session_state:
-    # 現在の操作フローのトレースID
-    st.session_state.current_trace_id = None
 
+# セッションIDを保持するCookie（URLに載せると、共有したリンクから他人の履歴を読めてしまうため）
+SESSION_COOKIE = "blog_advisor_sid"
+SESSION_COOKIE_MAX_AGE = 30 * 24 * 3600
 
-async def process_with_agent(category: str, keywords: list):
-    """エージェントを使用してブログネタを生成"""
-    # エージェントの作成（Langfuseトレース属性を含む）
-    agent = create_blog_suggester_agent(
-        session_id=st.session_state.session_id,
-        tags=["blog-idea-generation", category],
-        trace_id=st.session_state.current_trace_id
+
+def remember_session_id(session_id: str):
+    """セッションIDをブラウザのCookieに保存（Streamlitはサーバー側からCookieを設定できないため、スクリプトで書き込む）"""
+    import streamlit.components.v1 as components
+    components.html(
+        f"<script>document.cookie = '{SESSION_COOKIE}={session_id}; path=/; "
+        f"max-age={SESSION_COOKIE_MAX_AGE}; SameSite=Strict';</script>",
+        height=0
     )
-    
-    # プロンプトの作成
-    prompt = f"""
-    技術分野「{category}」に関する最新のトレンドを調査して、ブログネタを提案してください。
-    
-    関連キーワード: {', '.join(keywords)}
-    
-    以下の手順で実行してください：
-    1. まず、関連キーワードを使って以下の検索を実行：
-       - Qiitaで記事を検索（qiita_searchツールを使用、5件程度）
-       - 必要に応じてWeb検索も実行（google_searchツールを使用、3件程度）
-    2. Qiitaの人気記事の傾向を分析し、どのような切り口が注目されているか把握
-    3. 検索結果から、エンジニアが興味を持ちそうなトピックを特定
-    4. 具体的なブログネタを3つ提案
-    
-    各ブログネタは以下の形式で簡潔に：
-    ## タイトル案
-    - 概要: 2-3文で説明
-    - 想定読者: 初心者/中級者/上級者
-    - キーポイント: 3つまで
-    
-    重要：
-    - Qiitaの記事を優先的に参考にしてください（エンジニアコミュニティの関心事を反映）
-    - 検索結果を分析した上で、実践的で価値のあるネタを提案してください
-    - すでに多く書かれているテーマでも、新しい切り口があれば提案してください
-    """
-    
-    # ストリーミングで結果を取得
-    agent_stream = agent.stream_async(prompt=prompt)
-    
+
+
+if "session_id" not in st.session_state:
+    # セッションID（Langfuseのトレースと履歴の復元用）はCookieに保持し、再読み込みや再接続後も引き継ぐ
+    try:
+        session_id = str(uuid.UUID(st.context.cookies.get(SESSION_COOKIE, "")))
+    except ValueError:
+        session_id = str(uuid.uuid4())
+        remember_session_id(session_id)
+    st.session_state.session_id = session_id
+if "sid" in st.query_params:
+    # 以前のバージョンでURLに付けていたセッションIDは使わず、リンクからも消す
+    del st.query_params["sid"]
+
+
+def get_session():
+    """このセッションの状態を取得（新規作成時・追い出された後は履歴ストアから復元）"""
+    from utils.session_state import get_session_registry
+    session, created = get_session_registry().get_or_create(st.session_state.session_id)
+    if created:
+        # 保存済みの状態があれば復元（生成済みのカテゴリやブログネタを再生成しない）
+        try:
+            from utils.history_store import get_history_store
+            saved = get_history_store().load(session.session_id)
+        except Exception as e:
+            print(f"履歴の読み込みに失敗しました: {str(e)}")
+            saved = None
+        if saved:
+            if saved["selected_category"] and saved["agent_response"]:
+                session.selected_category = saved["selected_category"]
+                session.trace_id = saved["current_trace_id"]
+                session.response = saved["agent_response"]
+                session.summary = saved["tweet_summary"]
+            # 選択中の自由入力の分野が上限で削除されないよう、選択中の分野を設定してから復元する
+            session.restore_categories(saved["tech_categories"])
+    return session
+
+
+@functools.cache
+def get_api_url() -> str | None:
+    """ヘッドレスAPIのURLを取得（設定されている場合、生成処理はAPIに任せて表示のみ行う）"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return os.getenv("BLOG_API_URL")
+
+
+# ツールごとのステータスメッセージ
+TOOL_MESSAGES = {
+    "google_search": "🔍 Web検索中...",
+    "qiita_search": "🔍 Qiitaで関連記事を検索中...",
+    "qiita_multi_search": "🔍 Qiitaで関連キーワードの記事をまとめて検索中...",
+    "format_search_results_for_blog": "📝 検索結果を分析中...",
+    "format_qiita_results_for_blog": "📝 Qiitaの記事を分析中...",
+}
+
+
+def render_idea_card(card):
+    """ブログネタのカードを表示"""
+    with st.container(border=True):
+        st.markdown(f"#### {card.title}")
+        st.markdown(card.overview)
+        st.caption(f"想定読者: {card.audience}")
+        st.markdown("\n".join(f"- {point}" for point in card.key_points))
+
+
+def render_ideas(response: str):
+    """生成済みのブログネタを表示（カードに分解できない場合はMarkdownのまま表示）"""
+    from utils.idea_parser import IdeaStreamParser
+    parser = IdeaStreamParser()
+    parser.feed(response)
+    parser.finish()
+    if not parser.cards:
+        st.markdown(response)
+        return
+    if parser.preamble.strip():
+        st.markdown(parser.preamble)
+    for card in parser.cards:
+        render_idea_card(card)
+
+
+def show_queue_position(placeholder):
+    """アドミッション制御の待ち順を表示するコールバックを作成"""
+    def on_wait(position: int):
+        placeholder.info(f"⏳ 混み合っています。順番待ち: {position}番目（順番が来ると自動で始まります）")
+    return on_wait
+
+
+def start_profiler(name: str, trace_id: str | None):
+    """リクエストのプロファイラーを作成（PROFILE_REQUESTS=true または ?profile=<PROFILE_TOKEN> で有効、無効時は何もしない）"""
+    from utils.profiling import profile_request, profile_token_matches
+    return profile_request(name, trace_id, requested=profile_token_matches(st.query_params.get("profile")))
+
+
+def follow_speculative_run(run, parser, on_text, on_idea, on_tool, profiler) -> str | None:
+    """先回りの生成の出力を表示する（何も表示する前に失敗・取り消しになった場合はNoneを返す）"""
+    session = get_session()
     full_response = ""
+    try:
+        with profiler.stage("speculative_follow"):
+            for event, data in run.follow():
+                if event == "delta":
+                    full_response += data
+                    with profiler.stage("parse_ideas"):
+                        completed = parser.feed(data)
+                    on_text(full_response)
+                    for card in completed:
+                        on_idea(card)
+                elif event == "tool":
+                    on_tool(data)
+            if not run.stopped_early:
+                for card in parser.finish():
+                    on_idea(card)
+    except Exception as e:
+        if full_response:
+            raise
+        print(f"先回りの生成を使えませんでした（{run.category}）: {str(e)}")
+        return None
+    finally:
+        # 画面の再実行・移動などで表示を途中でやめた場合は、誰も見ない生成を止めて実行枠を返す
+        if not run.done:
+            run.cancel("abandoned")
+    # 要約も先回りの生成と同じトレースにまとめる
+    session.trace_id = run.trace_id
+    # 生成側で打ち切った場合は、最終的な本文に合わせる
+    return run.response if run.response is not None else full_response
+
+
+async def process_with_agent(category: str, keywords: list, profiler=None):
+    """エージェントを使用してブログネタを生成"""
+    from utils.idea_parser import IdeaStreamParser
+    from utils.profiling import NULL_PROFILER
+    profiler = profiler or NULL_PROFILER
+    # 完成したブログネタはカードとして表示し、書きかけの部分だけをMarkdownで流す
+    parser = IdeaStreamParser()
+    cards_container = st.container()
     placeholder = st.empty()
     tool_status_placeholder = st.empty()
     
-    async for event in agent_stream:
-        if "data" in event:
-            # テキストデータを追加
-            full_response += event["data"]
-            # Markdownで表示を更新
-            placeholder.markdown(full_response)
+    def on_text(full_response: str):
+        profiler.mark("first_token")
+        with profiler.stage("render_markdown"):
+            # Markdownで表示を更新（カードになっていない部分のみ）
+            placeholder.markdown(parser.tail)
             # ツール実行ステータスをクリア
             tool_status_placeholder.empty()
-            
-        elif "current_tool_use" in event and event["current_tool_use"].get("name"):
-            # ツール使用情報を取得
-            tool_name = event["current_tool_use"]["name"]
-            
-            # ツールごとのメッセージを設定
-            tool_messages = {
-                "google_search": "🔍 Web検索中...",
-                "qiita_search": "🔍 Qiitaで関連記事を検索中...",
-                "format_search_results_for_blog": "📝 検索結果を分析中...",
-                "format_qiita_results_for_blog": "📝 Qiitaの記事を分析中...",
-            }
-            
-            message = tool_messages.get(tool_name, f"🔧 {tool_name}を実行中...")
-            
-            # ツール実行中のステータスを表示
-            tool_status_placeholder.info(message)
+    
+    def on_idea(card):
+        profiler.mark(f"idea_{len(parser.cards)}")
+        with profiler.stage("render_card"):
+            with cards_container:
+                if len(parser.cards) == 1 and parser.preamble.strip():
+                    st.markdown(parser.preamble)
+                render_idea_card(card)
+            placeholder.markdown(parser.tail)
+    
+    def on_tool(tool_name: str):
+        profiler.mark("first_tool")
+        # ツール実行中のステータスを表示
+        tool_status_placeholder.info(TOOL_MESSAGES.get(tool_name, f"🔧 {tool_name}を実行中..."))
+    
+    session = get_session()
+    api_url = get_api_url()
+    if api_url:
+        from utils import api_client
+        full_response = ""
+        for event, data in api_client.stream_ideas(
+            api_url, category, keywords,
+            session_id=session.session_id,
+            trace_id=session.trace_id
+        ):
+            if event == "delta":
+                full_response += data["text"]
+                with profiler.stage("parse_ideas"):
+                    completed = parser.feed(data["text"])
+                on_text(full_response)
+                for card in completed:
+                    on_idea(card)
+            elif event == "done":
+                # サーバー側で打ち切った場合は、最終的な本文に合わせる
+                full_response = data["response"]
+            elif event == "start" and data.get("speculative"):
+                # サーバーが先回りで始めた生成の場合、要約も同じトレースにまとめる
+                session.trace_id = data["trace_id"]
+            elif event == "queued":
+                show_queue_position(tool_status_placeholder)(data["position"])
+            elif event == "tool":
+                on_tool(data["name"])
+            elif event == "error":
+                raise RuntimeError(data["message"])
+    else:
+        from utils.speculation import get_speculator
+        # カテゴリ表示時に先回りで始めた生成があれば、それまでの出力を再生して続きを受け取る
+        run = get_speculator().claim(session.session_id, category)
+        full_response = follow_speculative_run(run, parser, on_text, on_idea, on_tool, profiler) if run else None
+    if full_response is None and not api_url:
+        from utils.admission import get_admission_controller
+        from utils.agent_setup import create_blog_suggester_agent
+        from utils.idea_generator import generate_blog_ideas
+        from utils.request_context import RequestContext
+        # プロセス全体の同時実行数を超える場合は、待ち順を表示して順番を待つ
+        admission = get_admission_controller()
+        with admission.slot(session.session_id, on_wait=show_queue_position(tool_status_placeholder)):
+            profiler.mark("admitted")
+            tool_status_placeholder.empty()
+            # 締め切りとキャンセル状態（ボタン操作やタブを閉じたことによる再実行・停止で打ち切る）
+            # プロファイル中は、エージェントとツールのスレッドも計測の対象にする
+            context = RequestContext(profiler=profiler)
+            # エージェントの作成（Langfuseトレース属性を含む）
+            agent = create_blog_suggester_agent(
+                session_id=session.session_id,
+                tags=["blog-idea-generation", category],
+                trace_id=session.trace_id,
+                context=context
+            )
+            with profiler.stage("agent_stream"):
+                full_response = await generate_blog_ideas(
+                    agent, category, keywords,
+                    on_text=on_text, on_tool=on_tool, context=context,
+                    on_idea=on_idea, parser=parser
+                )
     
     # 最後にステータスをクリア
     tool_status_placeholder.empty()
+    placeholder.empty()
     
     return full_response
 
 
 async def summarize_blog_ideas(response: str, category: str) -> str:
     """ブログネタの提案を要約してXポスト用のテキストを生成"""
+    session = get_session()
+    api_url = get_api_url()
+    if api_url:
+        from utils import api_client
+        return api_client.fetch_summary(
+            api_url, response, category,
+            session_id=session.session_id,
+            trace_id=session.trace_id
+        )
+    
+    from utils.agent_setup import create_blog_suggester_agent
+    from utils.idea_generator import generate_tweet_summary
     # エージェントを作成（Langfuseトレース属性を含む）
     agent = create_blog_suggester_agent(
-        session_id=st.session_state.session_id,
+        session_id=session.session_id,
         tags=["tweet-summary", category],
-        trace_id=st.session_state.current_trace_id  # 同じトレースIDを使用
+        trace_id=session.trace_id  # 同じトレースIDを使用
     )
     
-    # 要約プロンプト
-    prompt = f"""
-    以下のブログネタ提案から、主要なトピックを2-3個抽出して、Xポスト用の要約を作成してください。
-    ※ この出力内容はそのままポストされるため、「分かりました。〜」といった前置きや、「〜いかがでしょうか。」などの余計な文は一切不要です。
-    ポスト内容のみを出力してください。
-
-    フォーマット：
-    「#ブログネタ検討くん に技術アウトプットの題材を考えてもらいました！[トピック1]や[トピック2]についてブログを書いてみようと思います💪」
-
-    条件：
-    - 日本語120文字以内
-    - トピックは具体的な技術名やテーマを使用
-    - 絵文字は指定されたもののみ使用
-    - ハッシュタグは「#ブログネタ検討くん」のみ
-
-    ブログネタ提案：
-    {response}
-
-    分野：{category}
-
-    注意：
-    この出力内容はそのままポストされるため、「分かりました。〜」といった前置きや、「〜いかがでしょうか。」などの余計な文は一切不要です。
-    ポスト内容のみを出力してください。
-    """
-    
     # 同期的に実行
+    return generate_tweet_summary(agent, response, category)
+
+
+def save_session_history():
+    """現在のセッション状態を履歴ストアに保存（失敗しても画面の動作は止めない）"""
+    session = get_session()
     try:
-        result = agent(prompt)
-        # より安全な方法でテキストを取得
-        content = result.message.get('content', [])
-        if content and len(content) > 0:
-            # 'text'属性を安全に取得
-            text_content = content[0].get('text', '')
-            if text_content:
-                return text_content.strip()
-        
-        # フォールバック
-        return f"#ブログネタ検討くん に技術アウトプットの題材を考えてもらいました！{category}についてブログを書いてみようと思います💪"
+        from utils.history_store import get_history_store
+        get_history_store().save_session(
+            session.session_id,
+            session.categories,
+            session.selected_category,
+            session.trace_id
+        )
     except Exception as e:
-        # エラーログを出力してフォールバック
-        print(f"要約生成エラー: {str(e)}")
-        return f"#ブログネタ検討くん に技術アウトプットの題材を考えてもらいました！{category}についてブログを書いてみようと思います💪"
+        print(f"履歴の保存に失敗しました: {str(e)}")
+
+
+def save_result_history(response: str | None = None, summary: str | None = None):
+    """生成結果を履歴ストアに保存（失敗しても画面の動作は止めない）"""
+    session = get_session()
+    try:
+        from utils.history_store import get_history_store
+        get_history_store().save_result(
+            session.session_id,
+            session.trace_id,
+            session.selected_category,
+            response=response,
+            summary=summary
+        )
+    except Exception as e:
+        print(f"履歴の保存に失敗しました: {str(e)}")
 
 
 def create_twitter_share_url(text: str) -> str:
@@ -180,41 +338,73 @@ def create_twitter_share_url(text: str) -> str:
 
 def main():
     """メイン処理"""
+    session = get_session()
     
     # 初回起動時もQiitaトレンドから生成
-    if st.session_state.tech_categories is None:
+    if session.categories is None:
         st.session_state.is_generating_categories = True
     
+    # 技術分野の選択（見出しはカテゴリ生成より先に描画する）
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.subheader("🎯 興味のある技術分野を選択してください")
+    with col2:
+        if st.button("🎲 シャッフル", 
+                    disabled=st.session_state.is_processing or st.session_state.is_generating_categories,
+                    help="新しい技術分野を生成します"):
+            st.session_state.is_generating_categories = True
+            session.selected_category = None
+            session.response = None
+            st.rerun()
+    
     # カテゴリ生成処理（初回起動時とシャッフル時）
     if st.session_state.is_generating_categories:
+        # 生成中はボタンの骨組みを表示しておく
+        skeleton = st.empty()
+        with skeleton.container():
+            cols = st.columns(2)
+            for idx in range(8):
+                with cols[idx % 2]:
+                    st.button("⏳ ...", key=f"skeleton_{idx}", use_container_width=True, disabled=True)
+        
         with st.spinner("🎲 Qiitaの最新トレンドからカテゴリを生成中..."):
             try:
-                st.session_state.tech_categories = generate_tech_categories()
+                api_url = get_api_url()
+                # カテゴリ生成はトレースIDがないため、セッションIDごとに書き出す
+                with start_profiler("generate_tech_categories", session.session_id) as profiler:
+                    if api_url:
+                        from utils import api_client
+                        with profiler.stage("api_request"):
+                            session.set_categories(api_client.fetch_categories(api_url, session_id=session.session_id))
+                    else:
+                        from utils.admission import get_admission_controller
+                        from utils.category_generator import generate_tech_categories
+                        queue_placeholder = st.empty()
+                        with get_admission_controller().slot(session.session_id, on_wait=show_queue_position(queue_placeholder)):
+                            queue_placeholder.empty()
+                            with profiler.stage("generate_tech_categories"):
+                                session.set_categories(generate_tech_categories())
+                        # 表示した分野の検索（設定によっては生成まで）を先回りで始める
+                        from utils.speculation import get_speculator
+                        get_speculator().speculate(session.session_id, session.categories)
+                        # 自由入力の分野のキーワード展開に使う共起モデルも、入力される前に作り始めておく
+                        from utils.tag_cooccurrence import get_tag_model
+                        get_tag_model()
                 st.session_state.is_generating_categories = False
+                save_session_history()
                 st.rerun()
             except Exception as e:
+                skeleton.empty()
                 st.error(f"カテゴリ生成エラー: {str(e)}")
                 st.session_state.is_generating_categories = False
     
-    # 技術分野の選択
-    col1, col2 = st.columns([3, 1])
-    with col1:
-        st.subheader("🎯 興味のある技術分野を選択してください")
-    with col2:
-        if st.button("🎲 シャッフル", 
-                    disabled=st.session_state.is_processing,
-                    help="新しい技術分野を生成します"):
-            st.session_state.is_generating_categories = True
-            st.session_state.selected_category = None
-            st.session_state.agent_response = None
-            st.rerun()
-    
     # カテゴリが存在する場合のみ表示
-    if st.session_state.tech_categories:
+    categories = session.categories
+    if categories:
         # ボタンを2列に配置
         cols = st.columns(2)
         
-        for idx, (category, info) in enumerate(st.session_state.tech_categories.items()):
+        for idx, (category, info) in enumerate(categories.items()):
             col = cols[idx % 2]
             with col:
                 if st.button(
@@ -223,10 +413,10 @@ def main():
                     use_container_width=True,
                     disabled=st.session_state.is_processing
                 ):
-                    st.session_state.selected_category = category
-                    st.session_state.agent_response = None
+                    session.selected_category = category
+                    session.response = None
                     # 新しい操作フローのためにトレースIDを生成
-                    st.session_state.current_trace_id = str(uuid.uuid4())
+                    session.trace_id = str(uuid.uuid4())
         
         # 自由記入フィールド
         st.divider()
@@ -242,21 +432,21 @@ def main():
             if st.button("🚀 検索", 
                         disabled=st.session_state.is_processing or not custom_category,
                         use_container_width=True):
-                st.session_state.selected_category = custom_category
-                st.session_state.agent_response = None
+                session.selected_category = custom_category
+                session.response = None
                 # 新しい操作フローのためにトレースIDを生成
-                st.session_state.current_trace_id = str(uuid.uuid4())
+                session.trace_id = str(uuid.uuid4())
                 # カスタムカテゴリをセッションに追加（再利用可能にする）
-                if custom_category not in st.session_state.tech_categories:
-                    st.session_state.tech_categories[custom_category] = {
-                        "keywords": [custom_category],  # カテゴリ名をキーワードとして使用
-                        "emoji": "🔍"
-                    }
+                if custom_category not in categories:
+                    from utils.tag_cooccurrence import expand_keywords
+                    # Qiitaのタグ共起から関連キーワードを補う（検索の往復を減らすため）
+                    session.add_custom_category(custom_category, expand_keywords(custom_category))
+                    categories = session.categories
         
         # 選択された分野がある場合
-        if st.session_state.selected_category and not st.session_state.agent_response:
-            category = st.session_state.selected_category
-            keywords = st.session_state.tech_categories[category]["keywords"]
+        if session.selected_category and not session.response:
+            category = session.selected_category
+            keywords = categories[category]["keywords"]
             
             st.divider()
             st.subheader(f"🔍 「{category}」のブログネタを生成中...")
@@ -269,11 +459,24 @@ def main():
             asyncio.set_event_loop(loop)
             
             try:
-                response = loop.run_until_complete(
-                    process_with_agent(category, keywords)
-                )
-                st.session_state.agent_response = response
+                generating_session = session
+                with start_profiler("process_with_agent", session.trace_id) as profiler:
+                    response = loop.run_until_complete(
+                        process_with_agent(category, keywords, profiler)
+                    )
+                # 生成中にセッションが追い出された場合、手元のレコードはもう使われないため取り直す
+                session = get_session()
+                if session is not generating_session:
+                    # 作り直されたレコードに、生成中のレコードの状態を引き継ぐ
+                    # （トレースIDは先回りの生成を使った場合に生成中に変わるため、生成後の値を使う）
+                    if category not in (session.categories or {}):
+                        session.add_custom_category(category, keywords)
+                    session.selected_category = category
+                    session.trace_id = generating_session.trace_id
+                session.response = response
                 st.session_state.is_processing = False
+                save_result_history(response=response)
+                save_session_history()
                 st.rerun()
             except Exception as e:
                 st.error(f"エラーが発生しました: {str(e)}")
@@ -282,10 +485,10 @@ def main():
                 loop.close()
         
         # 結果の表示
-        if st.session_state.agent_response:
+        if session.response:
             st.divider()
-            st.subheader(f"✨ 「{st.session_state.selected_category}」のブログネタ提案")
-            st.markdown(st.session_state.agent_response)
+            st.subheader(f"✨ 「{session.selected_category}」のブログネタ提案")
+            render_ideas(session.response)
             
             # アクションボタン
             st.divider()
@@ -294,16 +497,17 @@ def main():
             with col1:
                 # リセットボタン
                 if st.button("🔄 別の分野を選択", type="secondary", use_container_width=True):
-                    st.session_state.selected_category = None
-                    st.session_state.agent_response = None
-                    st.session_state.tweet_summary = None
+                    session.selected_category = None
+                    session.response = None
+                    session.summary = None
                     # トレースIDもリセット
-                    st.session_state.current_trace_id = None
+                    session.trace_id = None
+                    save_session_history()
                     st.rerun()
             
             with col2:
                 # Xにポストするボタン（要約生成付き）
-                if st.session_state.tweet_summary is None:
+                if session.summary is None:
                     if st.button("🐦 Xにポストする", type="primary", use_container_width=True):
                         with st.spinner("ポスト用テキストを生成中..."):
                             # 非同期処理を実行
@@ -311,13 +515,17 @@ def main():
                             asyncio.set_event_loop(loop)
                             
                             try:
-                                summary_text = loop.run_until_complete(
-                                    summarize_blog_ideas(
-                                        st.session_state.agent_response, 
-                                        st.session_state.selected_category
+                                with start_profiler("summarize_blog_ideas", session.trace_id):
+                                    summary_text = loop.run_until_complete(
+                                        summarize_blog_ideas(
+                                            session.response, 
+                                            session.selected_category
+                                        )
                                     )
-                                )
-                                st.session_state.tweet_summary = summary_text
+                                # 要約の生成中に追い出された場合に備えて取り直す
+                                session = get_session()
+                                session.summary = summary_text
+                                save_result_history(summary=summary_text)
                                 st.rerun()
                                 
                             except Exception as e:
@@ -326,7 +534,7 @@ def main():
                                 loop.close()
                 else:
                     # 要約が生成済みの場合、リンクボタンを表示
-                    twitter_url = create_twitter_share_url(st.session_state.tweet_summary)
+                    twitter_url = create_twitter_share_url(session.summary)
                     st.markdown(
                         f'<a href="{twitter_url}" target="_blank" style="text-decoration: none;">'
                         f'<button style="background-color: #1DA1F2; color: white; border: none; '
@@ -337,7 +545,7 @@ def main():
                     
                     # 要約テキストを表示
                     with st.expander("投稿内容を確認"):
-                        st.text(st.session_state.tweet_summary)
+                        st.text(session.summary)
 
 
 if __name__ == "__main__":
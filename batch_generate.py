@@ -0,0 +1,245 @@
+"""複数の技術分野のブログネタをまとめて生成するバッチコマンド
+
+使い方:
+    python batch_generate.py categories.json -o results.jsonl --concurrency 3 --rate 10
+
+入力ファイルは以下のいずれかの形式に対応：
+    - JSON: generate_tech_categories() と同じ {"分野名": {"keywords": [...], "emoji": "..."}} 形式
+    - JSONL: 1行に1件 {"category": "分野名", "keywords": [...]}
+    - テキスト: 1行に1件 "分野名: キーワード1, キーワード2"
+--from-qiita を指定すると、入力ファイルの代わりにQiitaのトレンドから分野を生成する。
+
+出力は1行に1件のJSONLで、中断後に同じコマンドを再実行すると
+成功済みの分野をスキップして続きから再開する。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Dict, Any
+
+from utils.agent_setup import create_blog_suggester_agent
+from utils.idea_generator import generate_blog_ideas, generate_tweet_summary
+from utils.idea_parser import parse_idea_cards
+from utils.request_context import RequestContext
+
+
+class RateLimiter:
+    """全ワーカーで共有するレート制限（1分あたりの開始数）"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def load_categories(path: str) -> List[Dict[str, Any]]:
+    """
+    入力ファイルから分野とキーワードのリストを読み込む
+
+    Args:
+        path: 入力ファイルのパス
+
+    Returns:
+        {"category": 分野名, "keywords": [...]} のリスト
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = None
+    if isinstance(data, dict) and "category" not in data:
+        return [
+            {"category": name, "keywords": info.get("keywords", [name])}
+            for name, info in data.items()
+        ]
+
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            record = json.loads(line)
+            items.append({
+                "category": record["category"],
+                "keywords": record.get("keywords") or [record["category"]]
+            })
+        else:
+            name, _, keywords = line.partition(":")
+            keyword_list = [k.strip() for k in keywords.replace("、", ",").split(",") if k.strip()]
+            items.append({"category": name.strip(), "keywords": keyword_list or [name.strip()]})
+    return items
+
+
+def load_completed(path: str) -> set:
+    """出力ファイルから成功済みの分野を取得（再開用）"""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断時に書きかけになった行は無視する
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["category"])
+    return completed
+
+
+async def run_one(item: Dict[str, Any], session_id: str, with_summary: bool) -> Dict[str, Any]:
+    """1つの分野についてブログネタを生成し、結果とタイミングを返す"""
+    category = item["category"]
+    keywords = item["keywords"]
+    trace_id = str(uuid.uuid4())
+    record = {
+        "category": category,
+        "keywords": keywords,
+        "trace_id": trace_id,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+    start = time.monotonic()
+    first_token = None
+    tool_calls = []
+
+    def on_text(_full_response: str):
+        nonlocal first_token
+        if first_token is None:
+            first_token = time.monotonic() - start
+
+    def on_tool(tool_name: str):
+        if not tool_calls or tool_calls[-1] != tool_name:
+            tool_calls.append(tool_name)
+
+    try:
+        # 1件ごとに締め切りを設け、止まった分野がバッチ全体を待たせないようにする
+        context = RequestContext()
+        agent = create_blog_suggester_agent(
+            session_id=session_id,
+            tags=["blog-idea-generation", "batch", category],
+            trace_id=trace_id,
+            context=context
+        )
+        response = await generate_blog_ideas(agent, category, keywords, on_text=on_text, on_tool=on_tool, context=context)
+        record["response"] = response
+        record["ideas"] = [card.to_dict() for card in parse_idea_cards(response)]
+        record["generation_seconds"] = round(time.monotonic() - start, 3)
+
+        if with_summary:
+            summary_start = time.monotonic()
+            summary_agent = create_blog_suggester_agent(
+                session_id=session_id,
+                tags=["tweet-summary", "batch", category],
+                trace_id=trace_id
+            )
+            record["tweet_summary"] = await asyncio.to_thread(
+                generate_tweet_summary, summary_agent, response, category
+            )
+            record["summary_seconds"] = round(time.monotonic() - summary_start, 3)
+
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+
+    record["first_token_seconds"] = round(first_token, 3) if first_token is not None else None
+    record["tool_calls"] = tool_calls
+    record["elapsed_seconds"] = round(time.monotonic() - start, 3)
+    return record
+
+
+async def run_batch(items: List[Dict[str, Any]], output: str, concurrency: int, rate: float, with_summary: bool) -> int:
+    """
+    有限の並列数と共有レート制限でバッチを実行
+
+    Returns:
+        失敗した件数
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+    session_id = f"batch-{uuid.uuid4()}"
+    failures = 0
+
+    with open(output, "a", encoding="utf-8") as out:
+        async def worker(item: Dict[str, Any]):
+            nonlocal failures
+            async with semaphore:
+                await limiter.acquire()
+                print(f"▶ {item['category']}", file=sys.stderr)
+                record = await run_one(item, session_id, with_summary)
+
+            # 1件ごとに書き込んで、中断しても完了分が残るようにする
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+
+            if record["status"] == "ok":
+                print(f"✔ {item['category']} ({record['elapsed_seconds']}s)", file=sys.stderr)
+            else:
+                failures += 1
+                print(f"✖ {item['category']}: {record['error']}", file=sys.stderr)
+
+        await asyncio.gather(*(worker(item) for item in items))
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数の技術分野のブログネタをまとめて生成")
+    parser.add_argument("input", nargs="?", help="分野とキーワードの入力ファイル（JSON/JSONL/テキスト）")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="結果を書き込むJSONLファイル")
+    parser.add_argument("--concurrency", type=int, default=3, help="同時に実行するエージェント数")
+    parser.add_argument("--rate", type=float, default=10, help="1分あたりに開始するエージェント数の上限")
+    parser.add_argument("--summary", action="store_true", help="Xポスト用の要約も生成する")
+    parser.add_argument("--from-qiita", action="store_true", help="Qiitaのトレンドから分野を生成して使用する")
+    parser.add_argument("--no-resume", action="store_true", help="成功済みの分野もスキップせずに再生成する")
+    args = parser.parse_args()
+
+    if args.from_qiita:
+        from utils.category_generator import generate_tech_categories
+        items = [
+            {"category": name, "keywords": info.get("keywords", [name])}
+            for name, info in generate_tech_categories().items()
+        ]
+    elif args.input:
+        items = load_categories(args.input)
+    else:
+        parser.error("入力ファイルまたは --from-qiita を指定してください")
+
+    if not args.no_resume:
+        completed = load_completed(args.output)
+        skipped = [item for item in items if item["category"] in completed]
+        items = [item for item in items if item["category"] not in completed]
+        if skipped:
+            print(f"{len(skipped)}件は生成済みのためスキップします", file=sys.stderr)
+
+    if not items:
+        print("生成する分野がありません", file=sys.stderr)
+        return
+
+    failures = asyncio.run(
+        run_batch(items, args.output, max(args.concurrency, 1), args.rate, args.summary)
+    )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
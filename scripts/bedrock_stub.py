@@ -0,0 +1,109 @@
+"""リージョンのフェイルオーバーを検証するための、Bedrock ConverseStreamのローカルスタブ
+
+使い方:
+    python scripts/bedrock_stub.py --port 9001 --throttle-rate 1.0   # 常にスロットリングを返す
+    python scripts/bedrock_stub.py --port 9002 --latency 0.3          # 0.3秒後に応答を返す
+
+アプリ側では、ダミーの認証情報とエンドポイント付きのリージョンを指定する:
+    AWS_ACCESS_KEY_ID=dummy AWS_SECRET_ACCESS_KEY=dummy \\
+    BEDROCK_REGIONS=us-west-2=http://localhost:9001,us-east-1=http://localhost:9002 \\
+    streamlit run app.py
+
+応答はAWSのイベントストリーム形式（application/vnd.amazon.eventstream）で返すため、
+boto3のconverse_streamからそのまま読める。
+"""
+
+import argparse
+import binascii
+import json
+import random
+import struct
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TEXT = """## スタブのブログネタ1
+- 概要: ローカルのスタブから返した応答です。
+- 想定読者: 中級者
+- キーポイント:
+  - フェイルオーバー
+  - スロットリング
+  - レイテンシ
+"""
+
+
+def encode_event(event_type: str, payload: dict) -> bytes:
+    """イベントストリームの1メッセージを組み立てる（プレリュード・ヘッダー・本文・CRC）"""
+    headers = b""
+    for name, value in ((":event-type", event_type), (":content-type", "application/json"), (":message-type", "event")):
+        name_bytes, value_bytes = name.encode(), value.encode()
+        # 型7は文字列
+        headers += struct.pack(">B", len(name_bytes)) + name_bytes + struct.pack(">BH", 7, len(value_bytes)) + value_bytes
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    total_length = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack(">II", total_length, len(headers))
+    message = prelude + struct.pack(">I", binascii.crc32(prelude)) + headers + body
+    return message + struct.pack(">I", binascii.crc32(message))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    throttle_rate = 0.0
+    latency = 0.0
+    text = DEFAULT_TEXT
+    counts = {"requests": 0, "throttled": 0}
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StubHandler.counts["requests"] += 1
+        if random.random() < self.throttle_rate:
+            StubHandler.counts["throttled"] += 1
+            body = json.dumps({"message": "Too many requests, please wait before trying again."}).encode()
+            self.send_response(429)
+            self.send_header("x-amzn-ErrorType", "ThrottlingException")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = [("messageStart", {"role": "assistant"})]
+        events += [
+            ("contentBlockDelta", {"contentBlockIndex": 0, "delta": {"text": line + "\n"}})
+            for line in self.text.splitlines()
+        ]
+        events += [
+            ("contentBlockStop", {"contentBlockIndex": 0}),
+            ("messageStop", {"stopReason": "end_turn"}),
+            ("metadata", {"usage": {"inputTokens": 1, "outputTokens": 1, "totalTokens": 2}, "metrics": {"latencyMs": 1}}),
+        ]
+        for event_type, payload in events:
+            chunk = encode_event(event_type, payload)
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        print(f"[{self.server.server_port}] {format % args} {StubHandler.counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bedrock ConverseStreamのローカルスタブ")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="スロットリングを返す割合（0〜1）")
+    parser.add_argument("--latency", type=float, default=0.0, help="応答を返すまでの秒数")
+    args = parser.parse_args()
+
+    StubHandler.throttle_rate = args.throttle_rate
+    StubHandler.latency = args.latency
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    print(f"Bedrockスタブを起動しました: http://127.0.0.1:{args.port} "
+          f"(throttle_rate={args.throttle_rate}, latency={args.latency})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""コールドスタート時のimport時間を計測し、予算を超えたら失敗するチェック
+
+使い方:
+    python scripts/import_profile.py                  # app.pyのモジュールレベルのimportを計測
+    python scripts/import_profile.py --budget-ms 800  # 予算（ミリ秒）を指定
+    python scripts/import_profile.py --target utils/search_tools.py --top 30
+
+対象ファイルのモジュールレベルにあるimport文だけを新しいPythonプロセスで実行し、
+`python -X importtime` の結果から合計時間と重いモジュールを表示する。
+合計が予算を超えた場合や、遅延させるべき重い依存（--forbid）が
+読み込まれていた場合は終了コード1を返す。
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.pyの起動時に読み込まれてはいけない重い依存
+DEFAULT_FORBIDDEN = ["strands", "boto3", "botocore", "googleapiclient", "requests", "opentelemetry", "dotenv"]
+
+
+def module_level_imports(path: str) -> str:
+    """ファイルのモジュールレベルにあるimport文を抜き出す"""
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source)
+    lines = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            lines.append(ast.get_source_segment(source, node))
+    return "\n".join(lines)
+
+
+def run_importtime(code: str) -> tuple:
+    """新しいプロセスで -X importtime を実行して (計測結果, 実時間ms) を返す"""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise SystemExit(f"importに失敗しました（終了コード {completed.returncode}）")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # 形式: "import time:  self [us] | cumulative [us] | module（階層ごとに2文字インデント）"
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append({
+            "module": name.strip(),
+            "self_ms": int(self_us.strip()) / 1000,
+            "cumulative_ms": int(cumulative_us.strip()) / 1000,
+            "depth": depth,
+        })
+    return rows, wall_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コールドスタート時のimport時間を計測")
+    parser.add_argument("--target", default="app.py", help="計測するファイル（モジュールレベルのimportのみ実行）")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1500")), help="importの合計時間の予算（ミリ秒）")
+    parser.add_argument("--forbid", default=",".join(DEFAULT_FORBIDDEN), help="読み込まれてはいけないトップレベルパッケージ（カンマ区切り、空で無効）")
+    parser.add_argument("--top", type=int, default=15, help="表示する重いモジュールの数")
+    args = parser.parse_args()
+
+    code = module_level_imports(os.path.join(ROOT, args.target))
+    rows, wall_ms = run_importtime(code)
+
+    # トップレベル（depth 0）の累積時間の合計がimport全体の時間
+    total_ms = sum(row["cumulative_ms"] for row in rows if row["depth"] == 0)
+
+    print(f"対象: {args.target}")
+    print(f"import合計: {total_ms:.1f} ms（予算: {args.budget_ms:.0f} ms、プロセス全体の実時間: {wall_ms:.1f} ms）")
+    print()
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for row in sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:args.top]:
+        print(f"{row['cumulative_ms']:>10.1f}ms {row['self_ms']:>8.1f}ms  {row['module']}")
+
+    failed = False
+    forbidden = [name for name in args.forbid.split(",") if name]
+    loaded = sorted({row["module"].split(".")[0] for row in rows} & set(forbidden))
+    if loaded:
+        print(f"\n✖ 起動時に重い依存が読み込まれています: {', '.join(loaded)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\n✖ import時間が予算を超えています: {total_ms:.1f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("\n✔ 予算内です")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""記録した外部API呼び出しを再生して、検索・トレンド取得・エージェントの処理時間の回帰を調べる
+
+使い方:
+    # 1. 実際のAPIを呼び出してフィクスチャを記録（APIキーとAWSの認証情報が必要）
+    python scripts/perf_regression.py record
+
+    # 2. オフラインで再生して計測し、基準として保存
+    python scripts/perf_regression.py replay --repeat 5 --save-baseline perf_baseline.json
+
+    # 3. CIなどで再生して、基準より遅くなっていたら終了コード1
+    python scripts/perf_regression.py replay --baseline perf_baseline.json --tolerance 0.2
+    python scripts/perf_regression.py replay --speed 0 --only qiita_search,agent  # 待ち時間なしでPythonの処理だけを計測
+
+シナリオはすべて決まった入力で実行する（Qiitaのローカルインデックスは使わず、乱数は固定する）。
+再生はutils/transport.pyの記録をそのまま返すため、APIキーがない環境でも実行でき、
+--speedで記録時の到着時刻を何倍速で再現するかを選べる（0で待たない）。
+記録のない呼び出しがあった場合は、入力や処理の流れが記録時から変わっているため失敗にする。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_FIXTURE_DIR = os.path.join(ROOT, "fixtures", "perf")
+
+# シナリオの入力（変えた場合は記録し直す）
+QIITA_QUERIES = ["Python", "AWS Lambda", "React hooks"]
+QIITA_MULTI_KEYWORDS = ["生成AI", "LLM", "RAG", "Bedrock"]
+WEB_QUERIES = ["Strands Agents", "Amazon Bedrock 最新"]
+AGENT_CATEGORY = "生成AI"
+AGENT_KEYWORDS = ["LLM", "RAG", "Bedrock"]
+
+
+def scenario_qiita_search():
+    from utils.search_tools import qiita_search
+    for query in QIITA_QUERIES:
+        qiita_search(query, num_results=10)
+
+
+def scenario_qiita_multi_search():
+    from utils.search_tools import qiita_multi_search
+    qiita_multi_search(QIITA_MULTI_KEYWORDS)
+
+
+def scenario_qiita_trends():
+    from utils.qiita_trends import get_qiita_trending_categories
+    get_qiita_trending_categories()
+
+
+def scenario_web_search():
+    from utils.search_tools import google_search
+    for query in WEB_QUERIES:
+        google_search(query, num_results=5)
+
+
+def scenario_categories():
+    from utils.category_generator import generate_tech_categories
+    generate_tech_categories()
+
+
+def scenario_agent():
+    """ブログネタ生成の全体（Bedrockのストリーム・ツール呼び出しを含む）。最初のテキストまでの時間も返す"""
+    from utils.agent_setup import create_blog_suggester_agent
+    from utils.idea_generator import generate_blog_ideas
+    from utils.request_context import RequestContext
+
+    start = time.perf_counter()
+    first_text = []
+
+    def on_text(full_response: str):
+        if not first_text:
+            first_text.append(time.perf_counter() - start)
+
+    context = RequestContext()
+    agent = create_blog_suggester_agent(tags=["perf-regression"], context=context)
+    asyncio.run(generate_blog_ideas(agent, AGENT_CATEGORY, AGENT_KEYWORDS, on_text=on_text, context=context))
+    return {"first_text_ms": first_text[0] * 1000} if first_text else {}
+
+
+SCENARIOS = {
+    "qiita_search": scenario_qiita_search,
+    "qiita_multi_search": scenario_qiita_multi_search,
+    "qiita_trends": scenario_qiita_trends,
+    "web_search": scenario_web_search,
+    "categories": scenario_categories,
+    "agent": scenario_agent,
+}
+
+
+def prepare_environment(mode: str) -> None:
+    """決まった入力で実行するための環境変数を設定（utilsのimport前に呼ぶ）"""
+    os.environ["QIITA_INDEX_ENABLED"] = "false"
+    os.environ["SEARCH_HEDGING"] = "false"
+    # 計測中のトレースは送らない
+    os.environ["LANGFUSE_PUBLIC_KEY"] = ""
+    os.environ["LANGFUSE_SECRET_KEY"] = ""
+    if mode == "replay":
+        # 再生では呼び出さないため、キーの有無で検索の経路が変わらないようにダミーを入れる
+        for name in ("GOOGLE_API_KEY", "GOOGLE_CSE_ID", "TAVILY_API_KEY"):
+            os.environ.setdefault(name, "replay")
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "replay")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "replay")
+
+
+def run_scenario(name: str, repeat: int, warmup: int = 0) -> dict:
+    """シナリオをwarmup回実行してから（importなどの初回だけの処理を除くため）repeat回計測し、所要時間の中央値・最小・最大を返す"""
+    for _ in range(warmup):
+        random.seed(0)
+        SCENARIOS[name]()
+    times = []
+    extras = {}
+    for _ in range(repeat):
+        random.seed(0)
+        start = time.perf_counter()
+        extra = SCENARIOS[name]() or {}
+        times.append((time.perf_counter() - start) * 1000)
+        for key, value in extra.items():
+            extras.setdefault(key, []).append(value)
+    result = {
+        "median_ms": round(statistics.median(times), 1),
+        "min_ms": round(min(times), 1),
+        "max_ms": round(max(times), 1),
+    }
+    for key, values in extras.items():
+        result[key] = round(statistics.median(values), 1)
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    """基準より遅くなったシナリオを返す（中央値が 基準×(1+tolerance)+slack_ms を超えたもの）"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        limit = base["median_ms"] * (1 + tolerance) + slack_ms
+        if result["median_ms"] > limit:
+            regressions.append(f"{name}: {result['median_ms']:.1f}ms（基準 {base['median_ms']:.1f}ms、上限 {limit:.1f}ms）")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記録した外部API呼び出しを再生して処理時間の回帰を調べる")
+    parser.add_argument("mode", choices=["record", "replay"], help="record: 実際のAPIで記録 / replay: 記録を再生して計測")
+    parser.add_argument("--fixture-dir", default=DEFAULT_FIXTURE_DIR, help="フィクスチャのディレクトリ")
+    parser.add_argument("--only", help="実行するシナリオ（カンマ区切り）")
+    parser.add_argument("--repeat", type=int, default=3, help="再生の繰り返し回数（中央値を使う）")
+    parser.add_argument("--warmup", type=int, default=1, help="計測前に実行する回数")
+    parser.add_argument("--speed", type=float, default=1.0, help="再生の速さ（記録時の何倍速か、0で待たない）")
+    parser.add_argument("--baseline", help="比較する基準のJSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="基準から許容する遅れの割合")
+    parser.add_argument("--slack-ms", type=float, default=20.0, help="基準から許容する遅れ（ミリ秒、短いシナリオの揺れを吸収）")
+    parser.add_argument("--save-baseline", help="計測結果を基準として保存するパス")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"不明なシナリオ: {', '.join(unknown)}（{', '.join(SCENARIOS)}）")
+
+    prepare_environment(args.mode)
+    from utils.transport import Transport, set_transport
+    transport = Transport(mode=args.mode, fixture_dir=args.fixture_dir, speed=args.speed)
+    set_transport(transport)
+
+    if args.mode == "record":
+        for name in names:
+            start = time.perf_counter()
+            run_scenario(name, repeat=1)
+            print(f"✔ {name}: {(time.perf_counter() - start) * 1000:.0f}ms")
+        stats = transport.get_stats()
+        print(f"{stats['recorded']}件の呼び出しを {args.fixture_dir} に記録しました")
+        return
+
+    print(f"再生: {args.speed:g}倍速, {args.repeat}回")
+    print(f"{'シナリオ':<20}{'中央値':>10}{'最小':>10}{'最大':>10}")
+    results = {}
+    for name in names:
+        results[name] = result = run_scenario(name, args.repeat, args.warmup)
+        extra = "".join(f"  {key}={value}" for key, value in result.items() if key not in ("median_ms", "min_ms", "max_ms"))
+        print(f"{name:<20}{result['median_ms']:>8.1f}ms{result['min_ms']:>8.1f}ms{result['max_ms']:>8.1f}ms{extra}")
+
+    stats = transport.get_stats()
+    if stats["missing"]:
+        raise SystemExit(f"記録のない呼び出しが{stats['missing']}件ありました。入力や処理の流れが変わった場合は record で記録し直してください")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"speed": args.speed, "repeat": args.repeat, "scenarios": results}, f, ensure_ascii=False, indent=2)
+        print(f"基準を {args.save_baseline} に保存しました")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("speed") != args.speed:
+            print(f"⚠ 基準の再生速度（{baseline.get('speed')}倍速）と異なります")
+        regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+        if regressions:
+            raise SystemExit("処理時間が基準より遅くなりました:\n" + "\n".join(f"- {line}" for line in regressions))
+        print("✔ 基準の範囲内です")
+
+
+if __name__ == "__main__":
+    main()
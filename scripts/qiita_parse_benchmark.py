@@ -0,0 +1,128 @@
+"""Qiita APIの記事一覧の解析方法を比較するベンチマーク（ピークメモリと解析時間）
+
+使い方:
+    python scripts/qiita_parse_benchmark.py                     # 100件・本文100KBの疑似データ
+    python scripts/qiita_parse_benchmark.py --body-kb 300       # 本文の大きさを変える
+    python scripts/qiita_parse_benchmark.py --file page.json    # 保存したAPIの応答を使う
+        （例: curl -o page.json "https://qiita.com/api/v2/items?per_page=100"）
+
+応答をファイルから受信と同じ大きさのチャンクで読み、
+- json: 全体を読み込んでからjson.loadsで解析し、必要なフィールドに整形（従来のresponse.json()）
+- stream: チャンクを受け取りながら必要なフィールドだけを取り出す（utils/qiita_stream.py）
+のピークメモリ（tracemalloc）と時間を比較する。
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.qiita_stream import iter_qiita_articles  # noqa: E402
+from utils.qiita_trends import format_qiita_article  # noqa: E402
+
+
+def make_page(items: int, body_kb: int) -> list:
+    """Qiita APIと同じ構造の疑似記事を作る（rendered_bodyは本文の約1.5倍）"""
+    random.seed(0)
+    words = ["Python", "の", "実装", "を", "解説", "します", "。", "\n", "```python\nprint('hello')\n```\n", "\"引用\"", "\\"]
+    articles = []
+    for i in range(items):
+        body = "".join(random.choice(words) for _ in range(body_kb * 1024 // 6))
+        articles.append({
+            "rendered_body": "<p>" + body.replace("\n", "</p><p>") + "</p>" + "<span class=\"x\"></span>" * (len(body) // 60),
+            "body": body,
+            "coediting": False,
+            "comments_count": i % 5,
+            "created_at": f"2025-06-{i % 28 + 1:02d}T12:00:00+09:00",
+            "group": None,
+            "id": f"{i:020x}",
+            "likes_count": random.randint(0, 500),
+            "private": False,
+            "reactions_count": 0,
+            "stocks_count": random.randint(0, 500),
+            "tags": [{"name": name, "versions": []} for name in random.sample(["Python", "AWS", "LLM", "React", "Docker", "Rust"], 3)],
+            "title": f"記事タイトル{i}",
+            "updated_at": "2025-06-30T12:00:00+09:00",
+            "url": f"https://qiita.com/user{i}/items/{i:020x}",
+            "user": {"description": "自己紹介" * 20, "id": f"user{i}", "name": "", "followers_count": 10},
+            "page_views_count": None,
+            "team_membership": None,
+            "organization_url_name": None,
+            "slide": False,
+        })
+    return articles
+
+
+def read_chunks(path: str, chunk_size: int):
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def parse_json(path: str, chunk_size: int) -> list:
+    content = b"".join(read_chunks(path, chunk_size))
+    return [format_qiita_article(article) for article in json.loads(content)]
+
+
+def parse_stream(path: str, chunk_size: int) -> list:
+    return list(iter_qiita_articles(read_chunks(path, chunk_size)))
+
+
+def measure(func, path: str, chunk_size: int, repeat: int) -> tuple:
+    """(結果, ピークメモリ[バイト], 最短時間[秒]) を返す"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path, chunk_size)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = func(path, chunk_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak, min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qiita APIの記事一覧の解析方法を比較")
+    parser.add_argument("--file", help="保存したAPIの応答（省略時は疑似データ）")
+    parser.add_argument("--items", type=int, default=100, help="疑似データの記事数")
+    parser.add_argument("--body-kb", type=int, default=100, help="疑似データの本文の大きさ（KB）")
+    parser.add_argument("--chunk-kb", type=int, default=64, help="受信チャンクの大きさ（KB）")
+    parser.add_argument("--repeat", type=int, default=3, help="時間の計測回数（最短を表示）")
+    args = parser.parse_args()
+
+    path = args.file
+    temp = None
+    if not path:
+        temp = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+        temp.write(json.dumps(make_page(args.items, args.body_kb), ensure_ascii=False).encode("utf-8"))
+        temp.close()
+        path = temp.name
+
+    try:
+        size = os.path.getsize(path)
+        chunk_size = args.chunk_kb * 1024
+        print(f"応答の大きさ: {size / 1024 / 1024:.1f}MB, チャンク: {args.chunk_kb}KB")
+        print(f"{'方式':<8}{'ピークメモリ':>14}{'時間':>12}")
+        results = {}
+        for name, func in (("json", parse_json), ("stream", parse_stream)):
+            result, peak, seconds = measure(func, path, chunk_size, args.repeat)
+            results[name] = result
+            print(f"{name:<8}{peak / 1024 / 1024:>12.2f}MB{seconds * 1000:>10.1f}ms")
+        if results["json"] != results["stream"]:
+            raise SystemExit("解析結果が一致しません")
+        print(f"✔ 解析結果は一致しました（{len(results['stream'])}件）")
+    finally:
+        if temp:
+            os.unlink(temp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""エージェント実行のアドミッション制御（AIMDで調整する同時実行数とセッションごとの公平なキュー）
+
+アクセスが集中したときに全セッションが一斉にSonnetのエージェントを走らせると、Bedrockの
+スループットを超えて全員のレイテンシが同時に悪化する。ここでは同時に実行できる数を
+プロセス全体で制限し、その上限を観測したレイテンシとスロットリングから調整する。
+
+- 加算増加: 上限いっぱいまで使われていて、最初のトークンまでの時間が基準内なら少しずつ増やす
+- 乗算減少: スロットリングが起きたら半分に、レイテンシが基準の`latency_tolerance`倍を超えたら1割減らす
+
+待機中のリクエストはセッションごとのキューに入れ、セッション間はラウンドロビンで
+実行枠を割り当てる（1つのセッションが大量に送っても他のセッションを待たせない）。
+待機中は順番（何番目か）を返せるため、UIはスピナーの代わりに待ち順を表示できる。
+"""
+
+import asyncio
+import itertools
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Callable, List, Optional
+
+
+class AdmissionRejected(Exception):
+    """待機数の上限・待ち時間の上限を超えたため受け付けなかった"""
+
+
+class Ticket:
+    """1件の実行待ち（または実行中）のリクエスト"""
+
+    __slots__ = ("id", "session_id", "enqueued_at", "granted_at", "throttles_at_start", "done")
+
+    def __init__(self, ticket_id: int, session_id: str):
+        self.id = ticket_id
+        self.session_id = session_id
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.throttles_at_start = 0
+        self.done = False
+
+    @property
+    def granted(self) -> bool:
+        return self.granted_at is not None
+
+
+# Bedrockからの信号（bedrock_clients.pyから呼ばれる）をすべての制御器に伝える
+_limiters: "weakref.WeakSet[AdaptiveLimiter]" = weakref.WeakSet()
+
+
+def record_throttle() -> None:
+    """Bedrockのスロットリングを記録（リージョンのフェイルオーバーで回避できた場合も含む）"""
+    for limiter in list(_limiters):
+        limiter.observe_throttle()
+
+
+def record_model_latency(seconds: float) -> None:
+    """Bedrockの最初のトークンまでの時間を記録"""
+    for limiter in list(_limiters):
+        limiter.observe_latency(seconds)
+
+
+class AdaptiveLimiter:
+    """
+    AIMDで同時実行数を調整するアドミッション制御器
+
+    Args:
+        initial_limit: 同時実行数の初期値
+        min_limit: 同時実行数の下限
+        max_limit: 同時実行数の上限
+        max_queue: 待機できるリクエスト数（超えたら即座に拒否）
+        max_wait: 待機できる秒数（超えたら拒否）
+        latency_tolerance: 最初のトークンまでの時間が、直近の最小値のこの倍数を超えたら減らす
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        max_queue: int = 64,
+        max_wait: float = 120.0,
+        latency_tolerance: float = 2.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.latency_tolerance = latency_tolerance
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._in_flight = 0
+        self._ids = itertools.count(1)
+        self._throttles = 0
+        self._latency: Optional[float] = None
+        self._latency_window: deque = deque(maxlen=100)
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._stats = {
+            "accepted": 0, "rejected": 0, "timed_out": 0, "cancelled": 0, "completed": 0,
+            "increases": 0, "decreases": 0,
+        }
+        _limiters.add(self)
+
+    # --- Bedrockからの信号 ---
+
+    def observe_throttle(self) -> None:
+        with self._condition:
+            self._throttles += 1
+
+    def observe_latency(self, seconds: float) -> None:
+        with self._condition:
+            self._latency_window.append(seconds)
+            self._latency = seconds if self._latency is None else 0.8 * self._latency + 0.2 * seconds
+
+    # --- キュー ---
+
+    def enqueue(self, session_id: str) -> Ticket:
+        """
+        リクエストをセッションのキューに入れる（空きがあればその場で実行枠を割り当てる）
+
+        Raises:
+            AdmissionRejected: 待機数が上限に達している場合
+        """
+        with self._condition:
+            if self._queued >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise AdmissionRejected("サーバーが混み合っています。しばらくしてから再度お試しください。")
+            ticket = Ticket(next(self._ids), session_id)
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._queued += 1
+            self._stats["accepted"] += 1
+            self._grant()
+            return ticket
+
+    def _grant(self) -> None:
+        """空いている実行枠を、セッション間でラウンドロビンに割り当てる（_conditionを保持していること）"""
+        granted = False
+        while self._queues and self._in_flight < int(self.limit):
+            session_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                # 同じセッションの次のリクエストは、他のセッションの後に回す
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self._queued -= 1
+            self._in_flight += 1
+            ticket.granted_at = time.monotonic()
+            ticket.throttles_at_start = self._throttles
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _service_order(self) -> List[Ticket]:
+        """待機中のリクエストが実行される順序（_conditionを保持していること）"""
+        queues = list(self._queues.values())
+        order = []
+        for depth in range(max((len(queue) for queue in queues), default=0)):
+            order.extend(queue[depth] for queue in queues if len(queue) > depth)
+        return order
+
+    def position(self, ticket: Ticket) -> int:
+        """待ち順（1始まり、実行中なら0）"""
+        with self._condition:
+            if ticket.granted or ticket.done:
+                return 0
+            for index, queued in enumerate(self._service_order()):
+                if queued is ticket:
+                    return index + 1
+            return 0
+
+    def _check_wait(self, ticket: Ticket) -> None:
+        """待ち時間の上限を超えていればキューから外して例外を送出（_conditionを保持していること）"""
+        if not ticket.granted and time.monotonic() - ticket.enqueued_at > self.max_wait:
+            self._remove(ticket)
+            self._stats["timed_out"] += 1
+            raise AdmissionRejected(f"混み合っているため、{self.max_wait:g}秒待っても実行できませんでした。時間をおいて再度お試しください。")
+
+    def _remove(self, ticket: Ticket) -> None:
+        queue = self._queues.get(ticket.session_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._queues[ticket.session_id]
+        ticket.done = True
+
+    def wait(self, ticket: Ticket, timeout: Optional[float] = None) -> bool:
+        """
+        実行枠が割り当てられるまで待つ（スレッド用）
+
+        Returns:
+            割り当てられたらTrue、timeout秒以内に割り当てられなければFalse
+
+        Raises:
+            AdmissionRejected: 待ち時間の上限を超えた場合
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: ticket.granted, timeout=timeout if timeout is not None else self.max_wait)
+            self._check_wait(ticket)
+            return ticket.granted
+
+    async def wait_async(self, ticket: Ticket, timeout: Optional[float] = None) -> bool:
+        """実行枠が割り当てられるまで待つ（asyncio用、イベントループをブロックしないよう短い間隔で確認する）"""
+        end = time.monotonic() + (timeout if timeout is not None else self.max_wait)
+        while True:
+            with self._condition:
+                self._check_wait(ticket)
+                if ticket.granted:
+                    return True
+            if time.monotonic() >= end:
+                return False
+            await asyncio.sleep(0.1)
+
+    def release(self, ticket: Ticket) -> None:
+        """実行を終えた（または待機をやめた）リクエストの枠を返し、同時実行数を調整する"""
+        with self._condition:
+            if ticket.done:
+                return
+            if not ticket.granted:
+                self._remove(ticket)
+                self._stats["cancelled"] += 1
+                return
+            ticket.done = True
+            self._in_flight -= 1
+            self._stats["completed"] += 1
+            self._adjust(ticket)
+            self._grant()
+
+    def _adjust(self, ticket: Ticket) -> None:
+        """AIMDで同時実行数を調整（_conditionを保持していること）"""
+        # 直前の減少より前に始まったリクエストの結果では、続けて減らさない
+        can_decrease = ticket.granted_at > self._last_decrease
+        baseline = min(self._latency_window) if self._latency_window else None
+        if self._throttles > ticket.throttles_at_start:
+            if can_decrease:
+                self._decrease(0.5)
+        elif baseline and self._latency and self._latency > baseline * self.latency_tolerance:
+            if can_decrease:
+                self._decrease(0.9)
+        elif self._in_flight + 1 >= int(self.limit) and self.limit < self.max_limit:
+            # 上限いっぱいまで使われているときだけ増やす（空いているときに上限だけ膨らませない）
+            self.limit = min(self.limit + 1 / self.limit, float(self.max_limit))
+            self._stats["increases"] += 1
+
+    def _decrease(self, factor: float) -> None:
+        self.limit = max(self.limit * factor, float(self.min_limit))
+        self._last_decrease = time.monotonic()
+        self._stats["decreases"] += 1
+
+    @contextmanager
+    def slot(self, session_id: str, on_wait: Optional[Callable[[int], None]] = None):
+        """
+        実行枠を確保して処理する（スレッド用）
+
+        Args:
+            session_id: セッションID（公平なキューの単位）
+            on_wait: 待機中に待ち順を受け取るコールバック（順番が変わったときに呼ばれる）
+        """
+        ticket = self.enqueue(session_id)
+        try:
+            last_position = None
+            while not self.wait(ticket, timeout=0.5):
+                position = self.position(ticket)
+                if on_wait and position != last_position:
+                    on_wait(position)
+                last_position = position
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def slot_async(self, session_id: str):
+        """実行枠を確保して処理する（asyncio用）"""
+        ticket = self.enqueue(session_id)
+        try:
+            # 割り当てられるまで実行しない（待ち時間の上限を超えたらwait_asyncがAdmissionRejectedを送出する）
+            while not await self.wait_async(ticket):
+                pass
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """現在の同時実行数の上限・実行中・待機中の数（監視・デバッグ用）"""
+        with self._condition:
+            return {
+                "limit": round(self.limit, 2),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "queued_sessions": len(self._queues),
+                "max_queue": self.max_queue,
+                "latency_ms": round(self._latency * 1000) if self._latency is not None else None,
+                "baseline_latency_ms": round(min(self._latency_window) * 1000) if self._latency_window else None,
+                "throttles": self._throttles,
+                **self._stats,
+            }
+
+
+_controller: Optional[AdaptiveLimiter] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdaptiveLimiter:
+    """プロセス内で共有するアドミッション制御器を取得"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdaptiveLimiter(
+                initial_limit=float(os.getenv("ADMISSION_INITIAL_LIMIT", "4")),
+                min_limit=int(os.getenv("ADMISSION_MIN_LIMIT", "1")),
+                max_limit=int(os.getenv("ADMISSION_MAX_LIMIT", "16")),
+                max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+                max_wait=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "120")),
+                latency_tolerance=float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))
+            )
+        return _controller
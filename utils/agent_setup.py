@@ -1,10 +1,9 @@
 """Strands Agentの設定"""
 
-import os
-import boto3
 from strands import Agent
-from strands.models import BedrockModel
-from utils.search_tools import google_search, qiita_search, format_qiita_results_for_blog
+from utils.bedrock_clients import get_bedrock_model
+from utils.search_tools import create_search_tools
+from utils.request_context import RequestContext
 from utils.langfuse_setup import setup_langfuse_tracing, get_trace_attributes
 from dotenv import load_dotenv
 
@@ -15,7 +14,7 @@ load_dotenv()
 LANGFUSE_ENABLED = setup_langfuse_tracing()
 
 
-def create_blog_suggester_agent(session_id: str | None = None, user_id: str | None = None, tags: list | None = None, trace_id: str | None = None):
+def create_blog_suggester_agent(session_id: str | None = None, user_id: str | None = None, tags: list | None = None, trace_id: str | None = None, context: RequestContext | None = None):
     """ブログネタ提案用のエージェントを作成
     
     Args:
@@ -23,22 +22,15 @@ def create_blog_suggester_agent(session_id: str | None = None, user_id: str | No
         user_id: Langfuse用のユーザーID（オプション）
         tags: Langfuse用のタグリスト（オプション）
         trace_id: Langfuse用のトレースID（一連の操作をまとめるため）
+        context: 締め切りとキャンセル状態（指定時はキャンセル後にモデルのストリームとツールを打ち切る）
     
     Returns:
         Agent: 設定されたStrands Agent
     """
     
-    # boto3セッションの作成
-    session = boto3.Session(
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=os.getenv("AWS_REGION", "us-west-2")
-    )
-    
-    # Bedrock Claude 3.7 Sonnetの設定（USクロスリージョン）
-    bedrock_model = BedrockModel(
+    # Bedrock Claude 3.7 Sonnetの設定（USクロスリージョン、クライアントはプロセス内で共有）
+    bedrock_model = get_bedrock_model(
         model_id="us.anthropic.claude-3-7-sonnet-20250219-v1:0",  # Claude 3.7 Sonnet (US cross-region)
-        boto_session=session,
         temperature=0.7,  # クリエイティブな提案のために少し高めに設定
         max_tokens=1500  # タイムアウト対策のため、少し短めに設定
     )
@@ -56,8 +48,9 @@ def create_blog_suggester_agent(session_id: str | None = None, user_id: str | No
     # エージェントの作成
     agent = Agent(
         model=bedrock_model,
-        tools=[google_search, qiita_search, format_qiita_results_for_blog],  # Qiita検索ツールを追加
-        callback_handler=None,  # Streamlitで独自に処理するため無効化
+        tools=create_search_tools(context=context),  # 検索結果の重複排除はエージェント単位で行う
+        # 表示はStreamlitで独自に処理するため、キャンセルの確認にのみ使う
+        callback_handler=context.callback_handler if context else None,
         trace_attributes=trace_attributes,  # Langfuseトレース属性を追加
         system_prompt="""あなたはエンジニア向けのブログネタを提案する専門家です。
         
@@ -0,0 +1,76 @@
+"""ヘッドレスAPI（api_server.py）のクライアント"""
+
+import json
+import requests
+from typing import Dict, Any, Iterator, Tuple
+
+
+def fetch_categories(api_url: str, num_categories: int = 8, session_id: str | None = None) -> Dict[str, Any]:
+    """APIから技術分野を取得（session_idを渡すと、サーバー側で表示する分野の準備を先回りで始められる）"""
+    params = {"num": num_categories}
+    if session_id:
+        params["session_id"] = session_id
+    response = requests.get(f"{api_url}/categories", params=params, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+
+def stream_ideas(api_url: str, category: str, keywords: list, session_id: str | None = None, trace_id: str | None = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    APIからブログネタをServer-Sent Eventsで受信
+
+    Args:
+        api_url: APIのベースURL
+        category: 技術分野
+        keywords: 関連キーワード
+        session_id: セッションID
+        trace_id: トレースID
+
+    Yields:
+        (イベント名, データ) のタプル
+    """
+    with requests.post(
+        f"{api_url}/ideas",
+        json={
+            "category": category,
+            "keywords": keywords,
+            "session_id": session_id,
+            "trace_id": trace_id
+        },
+        stream=True,
+        timeout=(10, 300)
+    ) as response:
+        response.raise_for_status()
+        response.encoding = "utf-8"
+
+        event = "message"
+        data_lines = []
+        for line in response.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line == "":
+                # 空行でイベントが確定する
+                if data_lines:
+                    yield event, json.loads("\n".join(data_lines))
+                event = "message"
+                data_lines = []
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
+
+
+def fetch_summary(api_url: str, response_text: str, category: str, session_id: str | None = None, trace_id: str | None = None) -> str:
+    """APIからXポスト用の要約を取得"""
+    response = requests.post(
+        f"{api_url}/summary",
+        json={
+            "response": response_text,
+            "category": category,
+            "session_id": session_id,
+            "trace_id": trace_id
+        },
+        timeout=120
+    )
+    response.raise_for_status()
+    return response.json()["summary"]
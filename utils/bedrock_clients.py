@@ -0,0 +1,362 @@
+"""Bedrockクライアントの共有（リクエストごとに作り直さない）とリージョン間のフェイルオーバー
+
+BEDROCK_REGIONSに複数のリージョン（またはエンドポイント）を指定すると、リージョンごとの
+エラー率・レイテンシ・実行中のリクエスト数から送信先を選んで負荷を分散する。
+スロットリングなどの一時的なエラーは、最初のトークンを受け取る前であれば
+同じリクエストのまま別のリージョンに送り直す。
+"""
+
+import os
+import random
+import threading
+import time
+import functools
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config as BotocoreConfig
+from botocore.exceptions import BotoCoreError, ClientError, EventStreamError
+from strands.models import BedrockModel
+from strands.types.exceptions import ContextWindowOverflowException, ModelThrottledException
+from strands.types.models import Model
+from dotenv import load_dotenv
+from utils import admission
+from utils.transport import get_transport
+
+# 環境変数を読み込む
+load_dotenv()
+
+# 別のリージョンに送り直すエラーコード（それ以外は入力の問題などのため、そのまま返す）
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "ServiceUnavailable",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+    "TooManyRequestsException",
+}
+MAX_COOLDOWN_SECONDS = 300
+# レイテンシ・エラー率の指数移動平均の重み
+EWMA_ALPHA = 0.2
+
+
+def parse_regions(value: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """
+    BEDROCK_REGIONSを解析
+
+    Args:
+        value: "us-west-2,us-east-1" のようなカンマ区切り。"us-west-2=http://localhost:9001"
+            のように書くとエンドポイントを指定できる（ローカルのスタブでの検証用）
+
+    Returns:
+        (リージョン, エンドポイントURL) のリスト
+    """
+    regions = []
+    for entry in (value or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        region, _, endpoint_url = entry.partition("=")
+        regions.append((region.strip(), endpoint_url.strip() or None))
+    return regions or [(os.getenv("AWS_REGION", "us-west-2"), None)]
+
+
+def classify_bedrock_error(error: BaseException) -> Optional[str]:
+    """
+    Bedrockの例外を分類
+
+    Returns:
+        "throttled" / "unavailable"（別のリージョンに送り直す）、またはNone（送り直さない）
+    """
+    if isinstance(error, ContextWindowOverflowException):
+        return None
+    if isinstance(error, ModelThrottledException):
+        return "throttled"
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        if code in ("ThrottlingException", "TooManyRequestsException"):
+            return "throttled"
+        if code in RETRYABLE_ERROR_CODES:
+            return "unavailable"
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if status == 429:
+            return "throttled"
+        return "unavailable" if status and status >= 500 else None
+    if isinstance(error, EventStreamError):
+        return "throttled" if "ThrottlingException" in str(error) else "unavailable"
+    if isinstance(error, BotoCoreError):
+        # 接続エラー・タイムアウト
+        return "unavailable"
+    return None
+
+
+class RegionState:
+    """1リージョン分の健全性（レイテンシとエラー率の移動平均、スロットリング後のクールダウン）"""
+
+    __slots__ = (
+        "region", "endpoint_url", "latency", "error_rate", "in_flight",
+        "cooldown_until", "consecutive_errors", "counts",
+    )
+
+    def __init__(self, region: str, endpoint_url: Optional[str] = None):
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.latency: Optional[float] = None  # 最初のトークンまでの秒数
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_errors = 0
+        self.counts = {"requests": 0, "successes": 0, "throttled": 0, "unavailable": 0, "failovers": 0}
+
+    @property
+    def key(self) -> str:
+        return f"{self.region}={self.endpoint_url}" if self.endpoint_url else self.region
+
+    def score(self, default_latency: float) -> float:
+        """小さいほど優先（レイテンシ×実行中の数×エラー率）"""
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (1 + self.in_flight) * (1 + 4 * self.error_rate)
+
+
+class BedrockRegionPool:
+    """
+    Bedrockのリージョン（エンドポイント）のプール
+
+    Args:
+        regions: (リージョン, エンドポイントURL) のリスト
+        cooldown_seconds: スロットリング・障害後にそのリージョンを避ける秒数（連続するほど延ばす）
+    """
+
+    def __init__(self, regions: List[Tuple[str, Optional[str]]], cooldown_seconds: float = 30.0):
+        self.regions = [RegionState(region, endpoint_url) for region, endpoint_url in regions]
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+
+    def ranked(self) -> List[RegionState]:
+        """
+        送信を試す順序
+
+        先頭はクールダウン中でないリージョンからスコアの逆数で重み付けして選び（負荷分散）、
+        残りはスコア順、クールダウン中のリージョンは最後の手段として後ろに回す。
+        """
+        now = time.monotonic()
+        with self._lock:
+            known = [state.latency for state in self.regions if state.latency is not None]
+            default_latency = sum(known) / len(known) if known else 1.0
+            available = [state for state in self.regions if state.cooldown_until <= now]
+            cooling = sorted(
+                (state for state in self.regions if state.cooldown_until > now),
+                key=lambda state: state.cooldown_until
+            )
+            if not available:
+                return cooling
+            weights = [1.0 / max(state.score(default_latency), 1e-3) for state in available]
+            first = random.choices(available, weights=weights)[0]
+            rest = sorted(
+                (state for state in available if state is not first),
+                key=lambda state: state.score(default_latency)
+            )
+            return [first] + rest + cooling
+
+    def begin(self, state: RegionState) -> None:
+        with self._lock:
+            state.in_flight += 1
+            state.counts["requests"] += 1
+
+    def end(self, state: RegionState) -> None:
+        with self._lock:
+            state.in_flight -= 1
+
+    def record_success(self, state: RegionState, latency: float) -> None:
+        """最初のトークンを受け取った時点で成功として記録"""
+        # 同時実行数の調整にも使う
+        admission.record_model_latency(latency)
+        with self._lock:
+            state.counts["successes"] += 1
+            state.latency = latency if state.latency is None else (
+                (1 - EWMA_ALPHA) * state.latency + EWMA_ALPHA * latency
+            )
+            state.error_rate *= 1 - EWMA_ALPHA
+            state.consecutive_errors = 0
+            state.cooldown_until = 0.0
+
+    def record_error(self, state: RegionState, error_class: str, failover: bool) -> None:
+        """エラーを記録し、そのリージョンをしばらく避ける"""
+        if error_class == "throttled":
+            admission.record_throttle()
+        with self._lock:
+            state.counts[error_class] += 1
+            if failover:
+                state.counts["failovers"] += 1
+            state.error_rate = (1 - EWMA_ALPHA) * state.error_rate + EWMA_ALPHA
+            state.cooldown_until = time.monotonic() + min(
+                self.cooldown_seconds * (2 ** state.consecutive_errors), MAX_COOLDOWN_SECONDS
+            )
+            state.consecutive_errors += 1
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """リージョンごとの状態（監視・デバッグ用）"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "region": state.region,
+                    "endpoint_url": state.endpoint_url,
+                    "latency_ms": round(state.latency * 1000) if state.latency is not None else None,
+                    "error_rate": round(state.error_rate, 3),
+                    "in_flight": state.in_flight,
+                    "cooldown_seconds": round(max(state.cooldown_until - now, 0.0), 1),
+                    **state.counts,
+                }
+                for state in self.regions
+            ]
+
+
+@functools.lru_cache(maxsize=None)
+def get_boto_session(region_name: Optional[str] = None) -> boto3.Session:
+    """プロセス内で共有するboto3セッションを取得（リージョンごと）"""
+    return boto3.Session(
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=region_name or os.getenv("AWS_REGION", "us-west-2")
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_region_pool() -> BedrockRegionPool:
+    """プロセス内で共有するリージョンのプールを取得"""
+    return BedrockRegionPool(
+        parse_regions(os.getenv("BEDROCK_REGIONS")),
+        cooldown_seconds=float(os.getenv("BEDROCK_REGION_COOLDOWN_SECONDS", "30"))
+    )
+
+
+def _create_region_model(state: RegionState, model_config: Dict[str, Any], retry: bool) -> BedrockModel:
+    client_config = BotocoreConfig(user_agent_extra="strands-agents")
+    if not retry:
+        # 送り先が複数ある場合は、同じリージョンでの再試行を待たずに次のリージョンへ送る
+        client_config = client_config.merge(BotocoreConfig(retries={"total_max_attempts": 1, "mode": "standard"}))
+    model = BedrockModel(boto_session=get_boto_session(state.region), boto_client_config=client_config, **model_config)
+    if state.endpoint_url:
+        # BedrockModelはエンドポイントを指定できないため、クライアントだけ差し替える
+        model.client = get_boto_session(state.region).client(
+            service_name="bedrock-runtime",
+            endpoint_url=state.endpoint_url,
+            config=client_config
+        )
+    return model
+
+
+class FailoverBedrockModel(Model):
+    """
+    プールのリージョンに振り分けるBedrockModel
+
+    リクエストの組み立てとチャンクの変換はBedrockModelに任せ、streamだけを
+    リージョンごとのBedrockModelに振り分ける。最初のトークン（テキストかツール呼び出し）
+    が届くまでのイベントは手元に溜めておき、それまでに送り直せるエラーが起きたら
+    次のリージョンで同じリクエストを送り直す。全リージョンで失敗した場合や
+    トークンの受信後に失敗した場合は、最後の例外をそのまま返す
+    （スロットリングはStrandsのイベントループがバックオフして再試行する）。
+
+    Args:
+        pool: リージョンのプール
+        **model_config: BedrockModelの設定（model_id・temperature・max_tokensなど）
+    """
+
+    def __init__(self, pool: BedrockRegionPool, **model_config):
+        self.pool = pool
+        self._model_config = model_config
+        self._models: Dict[str, BedrockModel] = {}
+        self._models_lock = threading.Lock()
+        self._primary = self._model_for(pool.regions[0])
+
+    def _model_for(self, state: RegionState) -> BedrockModel:
+        with self._models_lock:
+            model = self._models.get(state.key)
+            if model is None:
+                model = _create_region_model(state, self._model_config, retry=len(self.pool.regions) == 1)
+                self._models[state.key] = model
+            return model
+
+    def update_config(self, **model_config) -> None:
+        self._model_config.update(model_config)
+        with self._models_lock:
+            for model in self._models.values():
+                model.update_config(**model_config)
+
+    def get_config(self):
+        return self._primary.get_config()
+
+    def format_request(self, messages, tool_specs=None, system_prompt=None):
+        return self._primary.format_request(messages, tool_specs, system_prompt)
+
+    def format_chunk(self, event):
+        return self._primary.format_chunk(event)
+
+    def stream(self, request: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        # TRANSPORT_MODE=record/replayでは、フェイルオーバー後のイベント列を記録・再生する
+        return get_transport().stream("bedrock", request, lambda: self._stream_with_failover(request))
+
+    def _stream_with_failover(self, request: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        last_error: Optional[BaseException] = None
+        for attempt, state in enumerate(self.pool.ranked()):
+            started = time.monotonic()
+            pending = []
+            first_token = False
+            self.pool.begin(state)
+            try:
+                for event in self._model_for(state).stream(request):
+                    if first_token:
+                        yield event
+                        continue
+                    pending.append(event)
+                    if "contentBlockDelta" in event or "contentBlockStart" in event:
+                        first_token = True
+                        self.pool.record_success(state, time.monotonic() - started)
+                        yield from pending
+                        pending = []
+                # 本文のないまま終わった応答（空の応答など）も成功として扱う
+                if not first_token:
+                    self.pool.record_success(state, time.monotonic() - started)
+                    yield from pending
+                return
+            except Exception as e:
+                error_class = classify_bedrock_error(e)
+                if error_class is None:
+                    raise
+                self.pool.record_error(state, error_class, failover=not first_token)
+                if first_token:
+                    raise
+                print(f"Bedrockエラーのため別のリージョンで再試行します（{state.region}: {error_class}, {attempt + 1}回目）")
+                last_error = e
+            finally:
+                self.pool.end(state)
+        if last_error is not None:
+            raise last_error
+
+
+@functools.lru_cache(maxsize=None)
+def get_bedrock_model(model_id: str, temperature: float, max_tokens: int) -> FailoverBedrockModel:
+    """
+    設定ごとに共有するBedrockモデルを取得
+
+    BedrockModelは会話状態を持たないため、エージェント間で共有しても問題ない。
+    boto3クライアント（HTTPコネクションプール）を使い回すことで、
+    リクエストごとのクライアント生成とTLSハンドシェイクを省く。
+    リージョンのプール（BEDROCK_REGIONS）もプロセス内で共有する。
+
+    Args:
+        model_id: BedrockのモデルID（プールの全リージョンで使えるもの）
+        temperature: 生成時の温度
+        max_tokens: 最大出力トークン数
+
+    Returns:
+        FailoverBedrockModel: 共有のモデルインスタンス
+    """
+    return FailoverBedrockModel(
+        get_region_pool(),
+        model_id=model_id,
+        temperature=temperature,
+        max_tokens=max_tokens
+    )
@@ -2,10 +2,8 @@
 
 import random
 from strands import Agent
-from strands.models import BedrockModel
-import boto3
-import os
 from dotenv import load_dotenv
+from .bedrock_clients import get_bedrock_model
 from .qiita_trends import get_qiita_trending_categories
 
 # 環境変数を読み込む
@@ -18,17 +16,9 @@ def generate_tech_categories(num_categories: int = 8):
     # Qiitaのトレンド情報を取得
     qiita_trends = get_qiita_trending_categories()
     
-    # Bedrockセッションの作成
-    session = boto3.Session(
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=os.getenv("AWS_REGION", "us-west-2")
-    )
-    
-    # Bedrockモデルを初期化
-    bedrock_model = BedrockModel(
+    # Bedrockモデルを取得（クライアントはプロセス内で共有）
+    bedrock_model = get_bedrock_model(
         model_id="us.anthropic.claude-3-haiku-20240307-v1:0",
-        boto_session=session,
         temperature=0.9,  # 多様性のために高めに設定
         max_tokens=1000
     )
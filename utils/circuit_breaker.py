@@ -0,0 +1,192 @@
+"""外部APIのエラーを記憶して無駄なリクエストを止めるサーキットブレーカー"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional
+
+try:
+    from zoneinfo import ZoneInfo
+    _PACIFIC = ZoneInfo("America/Los_Angeles")
+except Exception:
+    # tzdataがない環境ではPST固定で近似
+    _PACIFIC = timezone(timedelta(hours=-8))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# エラー種別ごとの遮断時間（秒）。quotaは次のリセット時刻まで遮断する
+OPEN_SECONDS = {
+    "rate_limit": 60,
+    "auth": 3600,
+    "server": 30,
+}
+MAX_OPEN_SECONDS = 600
+PROBE_TIMEOUT = 60
+
+
+def next_quota_reset(now: Optional[datetime] = None) -> datetime:
+    """
+    Google APIの日次クォータがリセットされる時刻（太平洋時間の0時）を返す
+
+    Args:
+        now: 基準時刻（省略時は現在時刻）
+
+    Returns:
+        次のリセット時刻（UTC）
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(_PACIFIC)
+    tomorrow = (now + timedelta(days=1)).date()
+    reset = datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=_PACIFIC)
+    return reset.astimezone(timezone.utc)
+
+
+def classify_google_error(error: Exception) -> str:
+    """
+    Google APIの例外をエラー種別に分類
+
+    Returns:
+        "quota" / "rate_limit" / "auth" / "bad_request" / "server" のいずれか
+    """
+    status = getattr(getattr(error, "resp", None), "status", None)
+    try:
+        status = int(status) if status is not None else None
+    except (TypeError, ValueError):
+        status = None
+
+    content = getattr(error, "content", b"") or b""
+    if isinstance(content, bytes):
+        content = content.decode("utf-8", errors="ignore")
+    text = f"{error} {content}".lower()
+
+    # 1日のクォータ切れはHTTP 429・reason rateLimitExceeded（メッセージは"Queries per day"）で返るため、
+    # レート制限より先に判定する
+    if "dailylimitexceeded" in text or "per day" in text:
+        return "quota"
+    # 分単位の制限もメッセージに"quota"を含むため、"quota"より先に判定する
+    if "ratelimitexceeded" in text or "rate limit" in text or "per minute" in text:
+        return "rate_limit"
+    if "quota" in text:
+        return "quota"
+    if status == 429:
+        return "rate_limit"
+    if status in (401, 403) or "keyinvalid" in text or "accessnotconfigured" in text or "api key" in text:
+        return "auth"
+    # 400（不正なクエリなど）はそのリクエストだけの問題のため、遮断の判断には使わない
+    if status == 400:
+        return "bad_request"
+    return "server"
+
+
+class CircuitBreaker:
+    """
+    エラー種別を記憶するサーキットブレーカー
+
+    - closed: 通常通りリクエストを送る
+    - open: 遮断期限まですべてのリクエストを止める
+    - half_open: 期限後、1件だけ試行（プローブ）して結果で状態を決める
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, probe_interval: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._error_class: Optional[str] = None
+        self._open_until = 0.0
+        self._consecutive_failures = 0
+        self._open_count = 0
+        self._probe_started: Optional[float] = None
+        self._last_probe = 0.0
+        self._counts = {"allowed": 0, "short_circuited": 0, "successes": 0, "failures": 0, "probes": 0}
+        self._failures_by_class: Dict[str, int] = {}
+
+    def allow_request(self) -> bool:
+        """リクエストを送ってよいかを判定（half_openでは1件だけ許可）"""
+        now = time.time()
+        with self._lock:
+            if self._state == OPEN and now >= self._open_until:
+                self._state = HALF_OPEN
+                self._probe_started = None
+
+            if self._state == CLOSED:
+                self._counts["allowed"] += 1
+                return True
+
+            if self._state == HALF_OPEN:
+                probe_running = self._probe_started is not None and now - self._probe_started < PROBE_TIMEOUT
+                if not probe_running and now - self._last_probe >= self.probe_interval:
+                    self._probe_started = now
+                    self._last_probe = now
+                    self._counts["probes"] += 1
+                    self._counts["allowed"] += 1
+                    return True
+
+            self._counts["short_circuited"] += 1
+            return False
+
+    def record_success(self) -> None:
+        """成功を記録してclosedに戻す"""
+        with self._lock:
+            self._counts["successes"] += 1
+            self._state = CLOSED
+            self._error_class = None
+            self._consecutive_failures = 0
+            self._open_count = 0
+            self._probe_started = None
+
+    def record_failure(self, error_class: str) -> None:
+        """
+        失敗を記録し、必要に応じて遮断する
+
+        Args:
+            error_class: classify_google_errorなどで分類したエラー種別
+        """
+        now = time.time()
+        with self._lock:
+            self._counts["failures"] += 1
+            self._failures_by_class[error_class] = self._failures_by_class.get(error_class, 0) + 1
+            self._probe_started = None
+            # リクエスト自体の誤りはAPIの状態を表さないため、連続失敗に数えない
+            if error_class == "bad_request":
+                return
+            self._consecutive_failures += 1
+
+            # 一時的なエラーは連続回数が閾値に達するまで遮断しない
+            if error_class == "server" and self._state == CLOSED and self._consecutive_failures < self.failure_threshold:
+                return
+
+            if error_class == "quota":
+                self._open_until = next_quota_reset().timestamp()
+            else:
+                # 遮断が続くほど期限を延ばす（指数バックオフ）
+                base = OPEN_SECONDS.get(error_class, OPEN_SECONDS["server"])
+                self._open_until = now + min(base * (2 ** self._open_count), max(base, MAX_OPEN_SECONDS))
+            self._open_count += 1
+            self._state = OPEN
+            self._error_class = error_class
+
+    def get_state(self) -> Dict[str, Any]:
+        """現在の状態を取得（監視・デバッグ用）"""
+        with self._lock:
+            state = self._state
+            if state == OPEN and time.time() >= self._open_until:
+                state = HALF_OPEN
+            return {
+                "name": self.name,
+                "state": state,
+                "error_class": self._error_class,
+                "open_until": (
+                    datetime.fromtimestamp(self._open_until, timezone.utc).isoformat()
+                    if self._state != CLOSED else None
+                ),
+                "consecutive_failures": self._consecutive_failures,
+                "failures_by_class": dict(self._failures_by_class),
+                **self._counts,
+            }
+
+
+# Google Custom Search用のブレーカー（プロセス内の全セッションで共有）
+google_cse_breaker = CircuitBreaker("google_cse")
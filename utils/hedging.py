@@ -0,0 +1,165 @@
+"""遅い検索リクエストに対するヘッジ（並行実行）の仕組み"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Any, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 本来のリクエストとヘッジのスレッドプール（Streamlitの全セッションで共有）。
+# 同じプールにすると、遅いリクエストで埋まったときにヘッジもキューで待つことになるため分ける
+_primary_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search-primary")
+_hedge_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="search-hedge")
+
+
+class LatencyTracker:
+    """直近のレイテンシを保持してパーセンタイルを計算する"""
+
+    def __init__(self, window: int = 100, min_samples: int = 5, default_delay: float = 2.0, min_delay: float = 0.3):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q（0〜1）パーセンタイルを返す（サンプル不足の場合はNone）"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        index = min(int(q * len(samples)), len(samples) - 1)
+        return samples[index]
+
+    def hedge_delay(self, q: float) -> float:
+        """ヘッジを発行するまでの待ち時間（秒）"""
+        value = self.percentile(q)
+        if value is None:
+            return self.default_delay
+        return max(value, self.min_delay)
+
+
+class HedgeBudget:
+    """
+    ヘッジの発行数を制限するバジェット
+
+    リクエストごとに ratio 分のトークンを積み立て、ヘッジ1回につき1トークン消費する。
+    これによりヘッジによる追加リクエストは全体の ratio 倍以内に収まる。
+    """
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+_stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "primary_wins": 0, "budget_denied": 0, "primaries_cancelled": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_hedging_stats() -> Dict[str, Any]:
+    """ヘッジの統計情報を取得"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _outcome(future: Future, is_good: Callable[[Any], bool]) -> tuple:
+    """Futureの結果を (成功したか, 結果, 例外) で返す"""
+    try:
+        result = future.result()
+    except Exception as e:
+        return False, None, e
+    return is_good(result), result, None
+
+
+def hedged_call(
+    primary: Callable[[], T],
+    hedge: Callable[[], T],
+    delay: float,
+    budget: HedgeBudget,
+    is_good: Callable[[Any], bool] = lambda result: True,
+) -> T:
+    """
+    primaryを実行し、delay秒以内に応答がなければhedgeを並行実行する
+
+    先に良い結果を返した方を採用し、もう一方はキャンセルする
+    （実行中のスレッドは止められないため、結果を破棄する）。
+    primaryがdelay以内に完了した場合は、その結果（例外を含む）をそのまま返す。
+
+    delayはprimaryが実行を始めた時点から数える（スレッドプールのキューで待った時間は含めない）。
+    ただしdelayが過ぎても実行が始まらない場合はその時点でヘッジし、ヘッジが先に返れば
+    まだ始まっていないprimaryはキャンセルする（GoogleのAPIのクォータを使わない）。
+
+    Args:
+        primary: 本来のリクエスト
+        hedge: 遅延時に並行実行するリクエスト
+        delay: ヘッジを発行するまでの待ち時間（秒）
+        budget: ヘッジの発行数を制限するバジェット
+        is_good: 結果が有効かどうかを判定する関数
+
+    Returns:
+        採用された結果
+    """
+    _count("requests")
+    budget.deposit()
+    started = threading.Event()
+
+    def run_primary():
+        started.set()
+        return primary()
+
+    primary_future = _primary_executor.submit(run_primary)
+
+    done = set()
+    if started.wait(timeout=delay):
+        done, _ = wait([primary_future], timeout=delay)
+    if done or not budget.try_acquire():
+        if not done:
+            _count("budget_denied")
+        return primary_future.result()
+
+    _count("hedges")
+    hedge_future = _hedge_executor.submit(hedge)
+    pending = {primary_future, hedge_future}
+    outcomes = {}
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            good, result, error = _outcome(future, is_good)
+            outcomes[future] = (result, error)
+            if good:
+                for other in pending:
+                    if other.cancel() and other is primary_future:
+                        _count("primaries_cancelled")
+                _count("hedge_wins" if future is hedge_future else "primary_wins")
+                return result
+
+    # どちらも失敗した場合はヘッジ側の結果（フォールバックと同じ形式）を返す
+    result, error = outcomes[hedge_future]
+    if error is not None:
+        raise error
+    return result
+
@@ -0,0 +1,223 @@
+"""セッションごとの生成結果をSQLiteに保存する履歴ストア
+
+ブラウザの再読み込みやWebSocketの再接続でst.session_stateが失われても、
+保存済みのカテゴリ・ブログネタ・要約を復元して再生成を避ける。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Any, Optional
+
+DEFAULT_DB_PATH = os.path.join(".cache", "history.sqlite3")
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    categories BLOB,
+    selected_category TEXT,
+    trace_id TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    trace_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    category TEXT,
+    response BLOB,
+    summary BLOB,
+    size INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at);
+CREATE INDEX IF NOT EXISTS idx_results_updated ON results(updated_at);
+CREATE INDEX IF NOT EXISTS idx_results_session ON results(session_id);
+"""
+
+
+def _pack(text: Optional[str]) -> Optional[bytes]:
+    """テキストを圧縮して保存用のバイト列にする"""
+    if text is None:
+        return None
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def _unpack(blob: Optional[bytes]) -> Optional[str]:
+    if blob is None:
+        return None
+    return zlib.decompress(blob).decode("utf-8")
+
+
+def _blob_size(*blobs) -> int:
+    return sum(len(blob) for blob in blobs if blob)
+
+
+class HistoryStore:
+    """セッションの状態と生成結果を保存するSQLiteストア（サイズ上限付き）"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """接続を取得（初回のみ作成、呼び出し元で_lockを保持していること）"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def save_session(self, session_id: str, categories: Optional[Dict[str, Any]], selected_category: Optional[str], trace_id: Optional[str]) -> None:
+        """
+        セッションの状態（カテゴリ一覧、選択中の分野、トレースID）を保存
+
+        Args:
+            session_id: セッションID
+            categories: 技術分野の辞書
+            selected_category: 選択中の分野
+            trace_id: 現在の操作フローのトレースID
+        """
+        blob = _pack(json.dumps(categories, ensure_ascii=False)) if categories is not None else None
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO sessions (session_id, categories, selected_category, trace_id, size, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET categories=excluded.categories, "
+                "selected_category=excluded.selected_category, trace_id=excluded.trace_id, "
+                "size=excluded.size, updated_at=excluded.updated_at",
+                (session_id, blob, selected_category, trace_id, _blob_size(blob), time.time())
+            )
+            conn.commit()
+            self._evict(conn)
+
+    def save_result(self, session_id: str, trace_id: str, category: str, response: Optional[str] = None, summary: Optional[str] = None) -> None:
+        """
+        生成結果（ブログネタと要約）を保存（Noneの項目は既存の値を残す）
+
+        Args:
+            session_id: セッションID
+            trace_id: 生成時のトレースID
+            category: 技術分野
+            response: ブログネタの提案
+            summary: Xポスト用の要約
+        """
+        response_blob = _pack(response)
+        summary_blob = _pack(summary)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO results (trace_id, session_id, category, response, summary, size, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(trace_id) DO UPDATE SET "
+                "response=COALESCE(excluded.response, results.response), "
+                "summary=COALESCE(excluded.summary, results.summary), "
+                "size=LENGTH(COALESCE(excluded.response, results.response, '')) "
+                "+ LENGTH(COALESCE(excluded.summary, results.summary, '')), "
+                "updated_at=excluded.updated_at",
+                (trace_id, session_id, category, response_blob, summary_blob,
+                 _blob_size(response_blob, summary_blob), time.time())
+            )
+            conn.commit()
+            self._evict(conn)
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        セッションの状態と現在のトレースの生成結果を読み込む
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            保存済みの状態（なければNone）
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT categories, selected_category, trace_id FROM sessions WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            categories_blob, selected_category, trace_id = row
+            state = {
+                "tech_categories": json.loads(_unpack(categories_blob)) if categories_blob else None,
+                "selected_category": selected_category,
+                "current_trace_id": trace_id,
+                "agent_response": None,
+                "tweet_summary": None,
+            }
+            if trace_id:
+                result = conn.execute(
+                    "SELECT response, summary FROM results WHERE trace_id = ?",
+                    (trace_id,)
+                ).fetchone()
+                if result:
+                    state["agent_response"] = _unpack(result[0])
+                    state["tweet_summary"] = _unpack(result[1])
+
+            # 読み込んだセッションは最近使われたものとして扱う
+            conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+            conn.commit()
+            return state
+
+    def total_bytes(self) -> int:
+        """保存データの合計サイズ（圧縮後）"""
+        with self._lock:
+            return self._total_bytes(self._connect())
+
+    def _total_bytes(self, conn: sqlite3.Connection) -> int:
+        sessions = conn.execute("SELECT COALESCE(SUM(size), 0) FROM sessions").fetchone()[0]
+        results = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        return sessions + results
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """合計サイズが上限を超えた場合、古いものから削除する"""
+        total = self._total_bytes(conn)
+        if total <= self.max_bytes:
+            return
+
+        # 上限の9割まで減らして、毎回の削除を避ける
+        target = int(self.max_bytes * 0.9)
+        rows = conn.execute(
+            "SELECT 'results', trace_id, size, updated_at FROM results "
+            "UNION ALL SELECT 'sessions', session_id, size, updated_at FROM sessions "
+            "ORDER BY updated_at"
+        ).fetchall()
+        for table, key, size, _ in rows:
+            if total <= target:
+                break
+            column = "trace_id" if table == "results" else "session_id"
+            conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+            total -= size
+        conn.commit()
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """プロセス内で共有する履歴ストアを取得"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            # app.pyの起動を遅らせないよう、.envの読み込みは初回使用時に行う
+            from dotenv import load_dotenv
+            load_dotenv()
+            _store = HistoryStore(
+                path=os.getenv("HISTORY_DB_PATH", DEFAULT_DB_PATH),
+                max_bytes=int(os.getenv("HISTORY_MAX_BYTES", str(DEFAULT_MAX_BYTES)))
+            )
+        return _store
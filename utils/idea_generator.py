@@ -0,0 +1,203 @@
+"""ブログネタ生成と要約のプロンプト・実行ロジック（UIに依存しない）"""
+
+import asyncio
+from typing import Callable, Optional
+
+from .idea_parser import IdeaCard, IdeaStreamParser, parse_idea_cards
+from .request_context import RequestCancelled, RequestContext
+
+# 提案するブログネタの数（この数のカードがそろった時点で生成を打ち切る）
+NUM_IDEAS = 3
+
+
+def build_idea_prompt(category: str, keywords: list, num_ideas: int = NUM_IDEAS) -> str:
+    """ブログネタ生成用のプロンプトを作成"""
+    return f"""
+    技術分野「{category}」に関する最新のトレンドを調査して、ブログネタを提案してください。
+
+    関連キーワード: {', '.join(keywords)}
+
+    以下の手順で実行してください：
+    1. まず、関連キーワードを使って以下の検索を実行：
+       - Qiitaで記事を検索（qiita_multi_searchツールで関連キーワードをまとめて1回で検索、5件程度）
+       - 必要に応じてWeb検索も実行（google_searchツールを使用、3件程度）
+    2. Qiitaの人気記事の傾向を分析し、どのような切り口が注目されているか把握
+    3. 検索結果から、エンジニアが興味を持ちそうなトピックを特定
+    4. 具体的なブログネタを{num_ideas}つ提案
+
+    各ブログネタは以下の形式で簡潔に：
+    ## タイトル案
+    - 概要: 2-3文で説明
+    - 想定読者: 初心者/中級者/上級者
+    - キーポイント: 3つまで
+
+    重要：
+    - Qiitaの記事を優先的に参考にしてください（エンジニアコミュニティの関心事を反映）
+    - 検索結果を分析した上で、実践的で価値のあるネタを提案してください
+    - すでに多く書かれているテーマでも、新しい切り口があれば提案してください
+    """
+
+
+def build_summary_prompt(response: str, category: str) -> str:
+    """Xポスト用の要約プロンプトを作成"""
+    # カードに分解できる場合は、タイトルと概要だけを渡して入力を短くする
+    cards = parse_idea_cards(response)
+    if cards:
+        response = "\n".join(f"- {card.title}: {card.overview}" for card in cards)
+    return f"""
+    以下のブログネタ提案から、主要なトピックを2-3個抽出して、Xポスト用の要約を作成してください。
+    ※ この出力内容はそのままポストされるため、「分かりました。〜」といった前置きや、「〜いかがでしょうか。」などの余計な文は一切不要です。
+    ポスト内容のみを出力してください。
+
+    フォーマット：
+    「#ブログネタ検討くん に技術アウトプットの題材を考えてもらいました！[トピック1]や[トピック2]についてブログを書いてみようと思います💪」
+
+    条件：
+    - 日本語120文字以内
+    - トピックは具体的な技術名やテーマを使用
+    - 絵文字は指定されたもののみ使用
+    - ハッシュタグは「#ブログネタ検討くん」のみ
+
+    ブログネタ提案：
+    {response}
+
+    分野：{category}
+
+    注意：
+    この出力内容はそのままポストされるため、「分かりました。〜」といった前置きや、「〜いかがでしょうか。」などの余計な文は一切不要です。
+    ポスト内容のみを出力してください。
+    """
+
+
+def fallback_summary(category: str) -> str:
+    """要約に失敗した場合の定型文"""
+    return f"#ブログネタ検討くん に技術アウトプットの題材を考えてもらいました！{category}についてブログを書いてみようと思います💪"
+
+
+def _close_stream(agent_stream) -> None:
+    """エージェントのストリームを閉じる（終了処理でawaitしないため、イベントループの外で実行できる）"""
+    closing = agent_stream.aclose()
+    try:
+        closing.send(None)
+    except StopIteration:
+        return
+    closing.close()
+
+
+async def generate_blog_ideas(
+    agent,
+    category: str,
+    keywords: list,
+    on_text: Optional[Callable[[str], None]] = None,
+    on_tool: Optional[Callable[[str], None]] = None,
+    context: Optional[RequestContext] = None,
+    on_idea: Optional[Callable[[IdeaCard], None]] = None,
+    parser: Optional[IdeaStreamParser] = None,
+    num_ideas: int = NUM_IDEAS,
+) -> str:
+    """
+    エージェントを使用してブログネタを生成
+
+    Args:
+        agent: create_blog_suggester_agentで作成したエージェント
+        category: 技術分野
+        keywords: 関連キーワード
+        on_text: テキストを受信するたびに、それまでの全文を受け取るコールバック
+        on_tool: ツールの実行開始時に、ツール名を受け取るコールバック
+        context: エージェント作成時に渡したRequestContext（途中で抜けた場合はキャンセル扱いにする）
+        on_idea: ブログネタのカードが1件完成するたびに呼ばれるコールバック
+        parser: ストリームを解析するパーサー（表示側で組み立て中のテキストを参照する場合に渡す）
+        num_ideas: 提案するブログネタの数（contextがある場合、この数がそろった時点で生成を打ち切る）
+
+    Returns:
+        生成されたブログネタ（Markdown）
+
+    Raises:
+        RequestCancelled: キャンセルされた、または締め切りを過ぎた場合
+    """
+    prompt = build_idea_prompt(category, keywords, num_ideas)
+    parser = parser or IdeaStreamParser()
+
+    # ストリーミングで結果を取得
+    agent_stream = agent.stream_async(prompt=prompt)
+
+    full_response = ""
+
+    try:
+        async for event in agent_stream:
+            if context:
+                context.check()
+
+            if "data" in event:
+                # テキストデータを追加
+                full_response += event["data"]
+                completed = parser.feed(event["data"])
+                if on_text:
+                    on_text(full_response)
+                for card in completed:
+                    if on_idea:
+                        on_idea(card)
+
+                # 指定数のネタがそろったら、まとめの文章などを待たずに打ち切る
+                if context and len(parser.cards) >= num_ideas:
+                    context.stop_early()
+                    # 最後のカードより後ろの書きかけのテキストは除く
+                    full_response = full_response[:len(full_response) - len(parser.tail)].rstrip()
+                    break
+
+            elif "current_tool_use" in event and event["current_tool_use"].get("name"):
+                if on_tool:
+                    on_tool(event["current_tool_use"]["name"])
+        else:
+            for card in parser.finish():
+                if on_idea:
+                    on_idea(card)
+
+        if context:
+            context.finish()
+    except RequestCancelled:
+        raise
+    except Exception:
+        # エラーで抜けた場合もエージェントのスレッドは止めるが、キャンセルとしては数えない
+        if context:
+            context.cancel("failed")
+        raise
+    finally:
+        # 画面の再実行・切断などで途中で抜けた場合も、エージェントのスレッドを止めてから戻る
+        if context:
+            context.cancel("abandoned")
+        # Strandsのstream_asyncは終了時にエージェントのスレッドをjoinするため、
+        # イベントループを止めないよう別スレッドで閉じる
+        await asyncio.to_thread(_close_stream, agent_stream)
+
+    return full_response
+
+
+def generate_tweet_summary(agent, response: str, category: str) -> str:
+    """
+    ブログネタの提案を要約してXポスト用のテキストを生成
+
+    Args:
+        agent: create_blog_suggester_agentで作成したエージェント
+        response: ブログネタの提案
+        category: 技術分野
+
+    Returns:
+        ポスト用のテキスト（失敗時は定型文）
+    """
+    try:
+        result = agent(build_summary_prompt(response, category))
+        # より安全な方法でテキストを取得
+        content = result.message.get('content', [])
+        if content and len(content) > 0:
+            # 'text'属性を安全に取得
+            text_content = content[0].get('text', '')
+            if text_content:
+                return text_content.strip()
+
+        # フォールバック
+        return fallback_summary(category)
+    except Exception as e:
+        # エラーログを出力してフォールバック
+        print(f"要約生成エラー: {str(e)}")
+        return fallback_summary(category)
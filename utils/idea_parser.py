@@ -0,0 +1,189 @@
+"""ストリーミング中のMarkdownからブログネタ（アイデアカード）を逐次取り出すパーサー
+
+プロンプトで指定した形式:
+    ## タイトル案
+    - 概要: 2-3文で説明
+    - 想定読者: 初心者/中級者/上級者
+    - キーポイント: 3つまで
+
+受信したテキストを行単位で処理し、カードが完成した時点で取り出せるようにする。
+指定数のカードがそろったら、それ以降の生成（まとめの文章など）を待たずに打ち切れる。
+"""
+
+import re
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Any, Optional
+
+# 見出しはモデルによって"### 1. タイトル"のように深くなることがあるため、2〜4階層を受け付ける
+_HEADING = re.compile(r"^#{2,4}\s+(.+?)\s*#*\s*$")
+_FIELD = re.compile(r"^\s*[-*・]?\s*\**\s*(概要|想定読者|キーポイント)\s*\**\s*[:：]\s*\**\s*(.*)$")
+_BULLET = re.compile(r"^\s*(?:[-*・]|\d+[.)．])\s+(.+)$")
+# "タイトル案1:" "1." "タイトル:" などの見出しの前置きを除く（"1. タイトル案: X"のように重なることもある）
+_TITLE_PREFIX = re.compile(r"^(?:タイトル案\s*\d*\s*[:：]?\s*|タイトル\s*[:：]\s*|\d+[.)．:：]\s*)")
+# "/"は"CI/CD"・"async/await"のように語の一部として使われるため区切りにしない
+_INLINE_SPLIT = re.compile(r"\s*[、,，]\s*")
+
+FIELD_NAMES = {"概要": "overview", "想定読者": "audience", "キーポイント": "key_points"}
+
+
+@dataclass
+class IdeaCard:
+    """1件のブログネタ"""
+
+    title: str
+    overview: str = ""
+    audience: str = ""
+    key_points: List[str] = field(default_factory=list)
+
+    def is_filled(self) -> bool:
+        return bool(self.title and self.overview and self.audience and self.key_points)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def to_markdown(self) -> str:
+        lines = [f"## {self.title}"]
+        if self.overview:
+            lines.append(f"- 概要: {self.overview}")
+        if self.audience:
+            lines.append(f"- 想定読者: {self.audience}")
+        if self.key_points:
+            lines.append("- キーポイント:")
+            lines.extend(f"  - {point}" for point in self.key_points)
+        return "\n".join(lines)
+
+
+class IdeaStreamParser:
+    """
+    ストリームのテキストからIdeaCardを逐次組み立てる
+
+    Args:
+        max_key_points: キーポイントの最大数（この数に達したカードは次の見出しを待たずに完成とする）
+    """
+
+    def __init__(self, max_key_points: int = 3):
+        self.max_key_points = max_key_points
+        self.cards: List[IdeaCard] = []
+        self.preamble = ""
+        self._buffer = ""
+        self._current: Optional[IdeaCard] = None
+        self._field: Optional[str] = None
+        self._points_closed = False
+        self._consumed = 0
+        self._tail_start = 0
+        self._text = ""
+
+    @property
+    def tail(self) -> str:
+        """最後に完成したカードより後ろのテキスト（組み立て中のカードを含む）"""
+        return self._text[self._tail_start:]
+
+    def feed(self, delta: str) -> List[IdeaCard]:
+        """
+        受信したテキストの差分を追加
+
+        Args:
+            delta: 前回からの追加分のテキスト
+
+        Returns:
+            今回の追加で完成したカードのリスト
+        """
+        self._text += delta
+        self._buffer += delta
+        completed = []
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            self._consumed += len(line) + 1
+            card = self._process_line(line)
+            if card:
+                completed.append(card)
+        return completed
+
+    def finish(self) -> List[IdeaCard]:
+        """ストリームの終了時に、残りのテキストと組み立て中のカードを確定"""
+        completed = []
+        if self._buffer:
+            self._consumed += len(self._buffer)
+            card = self._process_line(self._buffer)
+            self._buffer = ""
+            if card:
+                completed.append(card)
+        card = self._complete_current()
+        if card:
+            completed.append(card)
+        return completed
+
+    def _complete_current(self, end: Optional[int] = None) -> Optional[IdeaCard]:
+        card, self._current = self._current, None
+        self._field = None
+        # 概要のない見出し（"## まとめ" など）はカードとして扱わない
+        if card is None or not (card.title and card.overview):
+            return None
+        self.cards.append(card)
+        self._tail_start = self._consumed if end is None else end
+        return card
+
+    def _process_line(self, line: str) -> Optional[IdeaCard]:
+        completed = None
+        heading = _HEADING.match(line)
+        if heading:
+            # 新しい見出しで、組み立て中のカードを確定する
+            completed = self._complete_current(end=self._consumed - len(line) - 1)
+            # "## タイトル案"だけの見出しの場合、タイトルは次の行から取る
+            self._current = IdeaCard(title=_clean_title(heading.group(1)))
+            self._points_closed = False
+            return completed
+
+        if self._current is None:
+            if not self.cards:
+                self.preamble += line + "\n"
+            return None
+
+        card = self._current
+        field_match = _FIELD.match(line)
+        if not card.title and not field_match:
+            if line.strip():
+                bullet = _BULLET.match(line)
+                card.title = _clean_title(bullet.group(1) if bullet else line)
+            return None
+        if field_match:
+            name, value = FIELD_NAMES[field_match.group(1)], field_match.group(2).strip().rstrip("*").strip()
+            self._field = name
+            if name == "key_points":
+                if value:
+                    # "キーポイント: A、B、C" の形式
+                    card.key_points = [point for point in _INLINE_SPLIT.split(value) if point][:self.max_key_points]
+                    self._points_closed = True
+            else:
+                setattr(card, name, value)
+        elif self._field == "key_points" and not self._points_closed:
+            bullet = _BULLET.match(line)
+            if bullet and len(card.key_points) < self.max_key_points:
+                card.key_points.append(bullet.group(1).strip())
+            elif not line.strip() and card.key_points:
+                self._points_closed = True
+        elif self._field in ("overview", "audience") and line.strip() and not _BULLET.match(line):
+            # 複数行にわたる概要
+            setattr(card, self._field, (getattr(card, self._field) + " " + line.strip()).strip())
+
+        if card.is_filled() and (self._points_closed or len(card.key_points) >= self.max_key_points):
+            return self._complete_current()
+        return None
+
+
+def _clean_title(text: str) -> str:
+    """見出しの前置きと強調の記号を除いたタイトル"""
+    title = text.strip().strip("*").strip()
+    while True:
+        stripped = _TITLE_PREFIX.sub("", title).strip("*").strip()
+        if stripped == title:
+            return title
+        title = stripped
+
+
+def parse_idea_cards(text: str) -> List[IdeaCard]:
+    """生成済みのMarkdown全体からカードを取り出す"""
+    parser = IdeaStreamParser()
+    parser.feed(text)
+    parser.finish()
+    return parser.cards
@@ -36,6 +36,14 @@ def setup_langfuse_tracing():
     os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = otel_endpoint
     os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {auth_token}"
     
+    # サンプリングと上限付きのバッチエクスポートを行うプロバイダーを先に設定
+    # （タグごとのサンプリング率はTRACE_SAMPLE_RATESで指定）
+    from .trace_sampling import install_sampled_tracer_provider
+    install_sampled_tracer_provider(
+        endpoint=otel_endpoint,
+        headers={"Authorization": f"Basic {auth_token}"}
+    )
+    
     print(f"Langfuse tracing enabled. Endpoint: {langfuse_host}")
     return True
 
@@ -0,0 +1,267 @@
+"""1リクエスト単位のプロファイリング（サンプリングプロファイラーと区間タイマー）
+
+遅いリクエストの時間が、PythonのCPU処理（JSON解析・Markdownの再描画・文字列の連結）、
+ブロッキングI/O、モデルの応答待ちのどれに使われたかを切り分けるためのもの。
+
+有効時はリクエストに属するスレッド（リクエストを処理するスレッドと、RequestContextを通じて
+登録されたエージェント・ツールのスレッド）のスタックを一定間隔でサンプリングし、トレースIDごとに
+    <PROFILE_DIR>/<trace_id>/<name>.collapsed  （flamegraph.pl・speedscopeで読める折りたたみ形式）
+    <PROFILE_DIR>/<trace_id>/<name>.json       （区間ごとの時間とCPU/待ちの内訳）
+を書き出す。無効時は何もしないNullProfilerを返すため、オーバーヘッドはほぼない。
+"""
+
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+DEFAULT_PROFILE_DIR = os.path.join(".cache", "profiles")
+
+# 葉のフレームがこれらの関数なら、CPUではなくI/O・待ちのサンプルとみなす
+_WAIT_FUNCTIONS = {
+    "recv", "recv_into", "read", "readinto", "readline", "sendall", "send", "connect",
+    "select", "poll", "epoll", "wait", "acquire", "sleep", "getaddrinfo", "do_handshake",
+    "_wait_for_tstate_lock", "join", "result",
+}
+
+
+def profiling_enabled(requested: bool = False) -> bool:
+    """環境変数PROFILE_REQUESTS、または呼び出し元の指定（クエリパラメータなど）で有効"""
+    return requested or os.getenv("PROFILE_REQUESTS", "false").lower() in ("1", "true", "yes")
+
+
+def profile_token_matches(value: Optional[str]) -> bool:
+    """
+    クエリパラメータの値がPROFILE_TOKENと一致するか（未設定の場合は常にFalse）
+
+    URLからの有効化は誰でもできてしまうため、サーバー側で設定したトークンを知っている場合だけ認める。
+    """
+    token = os.getenv("PROFILE_TOKEN", "")
+    return bool(token and value) and hmac.compare_digest(value.encode("utf-8"), token.encode("utf-8"))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    一定間隔で指定したスレッドのスタックを記録するサンプリングプロファイラー
+
+    Args:
+        thread_ids: サンプリングするスレッドのID（threading.get_ident()の値）の集合。
+            サンプリング中に追加されたスレッドも対象にする
+        interval: サンプリング間隔（秒）
+        max_depth: 記録するスタックの深さの上限
+    """
+
+    def __init__(self, thread_ids: set, interval: float = 0.005, max_depth: int = 128):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.categories: Counter = Counter()
+        self.self_samples: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self) -> None:
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            # 他のリクエストやスレッドプールのスタックは記録しない
+            for thread_id in tuple(self.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                if thread_id not in names:
+                    names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                labels = []
+                leaf = frame
+                while frame is not None and len(labels) < self.max_depth:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.reverse()
+                category = "wait" if leaf.f_code.co_name in _WAIT_FUNCTIONS else "cpu"
+                # リクエストを処理するスレッド・エージェントのスレッド・ツールのスレッドを区別できるようにする
+                self.stacks[";".join([f"[{names.get(thread_id, thread_id)}]"] + labels)] += 1
+                self.categories[category] += 1
+                self.self_samples[labels[-1]] += 1
+                self.samples += 1
+
+
+class RequestProfiler:
+    """
+    1リクエスト分のプロファイル
+
+    Args:
+        name: 計測対象の名前（ファイル名に使う）
+        trace_id: トレースID（出力先のディレクトリ名に使う）
+        output_dir: 出力先のディレクトリ
+        interval: サンプリング間隔（秒）
+    """
+
+    enabled = True
+
+    def __init__(self, name: str, trace_id: str, output_dir: str = DEFAULT_PROFILE_DIR, interval: float = 0.005):
+        self.name = name
+        self.trace_id = trace_id
+        self.output_dir = output_dir
+        self.interval = interval
+        self.sampler: Optional[StackSampler] = None
+        self._thread_ids: set = set()
+        self.stages: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "seconds": 0.0})
+        self.marks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._start = 0.0
+        self._cpu_start = 0.0
+        self.summary: Optional[Dict[str, Any]] = None
+
+    def __enter__(self) -> "RequestProfiler":
+        self._start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        # with文に入ったスレッド（リクエストを処理するスレッド）と、後から登録されたスレッドをサンプリングする
+        self._thread_ids.add(threading.get_ident())
+        self.sampler = StackSampler(self._thread_ids, interval=self.interval)
+        self.sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.sampler.stop()
+        wall = time.perf_counter() - self._start
+        cpu = time.process_time() - self._cpu_start
+        try:
+            self.summary = self._write(wall, cpu, error=repr(exc) if exc else None)
+        except OSError as e:
+            print(f"プロファイルの書き出しに失敗しました: {str(e)}")
+
+    def register_thread(self) -> None:
+        """呼び出したスレッドをこのリクエストのスレッドとしてサンプリングの対象にする"""
+        self._thread_ids.add(threading.get_ident())
+
+    def unregister_thread(self) -> None:
+        """呼び出したスレッドをサンプリングの対象から外す（スレッドIDは再利用されるため、終わる前に呼ぶ）"""
+        self._thread_ids.discard(threading.get_ident())
+
+    @contextmanager
+    def stage(self, name: str):
+        """区間の経過時間を計測（同じ名前の区間は回数と合計時間を集計）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name]["count"] += 1
+            self.stages[name]["seconds"] += seconds
+
+    def mark(self, name: str) -> None:
+        """開始からの経過時間を記録（最初の1回のみ、例: 最初のトークン）"""
+        with self._lock:
+            self.marks.setdefault(name, time.perf_counter() - self._start)
+
+    def _write(self, wall: float, cpu: float, error: Optional[str] = None) -> Dict[str, Any]:
+        directory = os.path.join(self.output_dir, self.trace_id)
+        os.makedirs(directory, exist_ok=True)
+
+        with open(os.path.join(directory, f"{self.name}.collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        samples = self.sampler.samples
+        summary = {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "wall_seconds": round(wall, 4),
+            # time.process_time()はプロセス全体の値のため、同時に動いている他のセッションのCPU時間も含む
+            "process_cpu_seconds_all_sessions": round(cpu, 4),
+            "samples": samples,
+            "sample_interval": self.sampler.interval,
+            "sample_breakdown": {
+                category: round(count / samples, 3) for category, count in self.sampler.categories.items()
+            } if samples else {},
+            "top_self": [
+                {"function": function, "samples": count}
+                for function, count in self.sampler.self_samples.most_common(20)
+            ],
+            "stages": {
+                name: {"count": stage["count"], "seconds": round(stage["seconds"], 4)}
+                for name, stage in self.stages.items()
+            },
+            "marks": {name: round(seconds, 4) for name, seconds in self.marks.items()},
+            "error": error,
+        }
+        with open(os.path.join(directory, f"{self.name}.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+
+class NullProfiler:
+    """プロファイリング無効時に使う、何もしないプロファイラー"""
+
+    enabled = False
+
+    def __enter__(self) -> "NullProfiler":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    def register_thread(self) -> None:
+        pass
+
+    def unregister_thread(self) -> None:
+        pass
+
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+    def add(self, name: str, seconds: float) -> None:
+        pass
+
+    def mark(self, name: str) -> None:
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def profile_request(name: str, trace_id: Optional[str], requested: bool = False):
+    """
+    リクエストのプロファイラーを作成（with文で使う）
+
+    Args:
+        name: 計測対象の名前（例: "process_with_agent"）
+        trace_id: トレースID（Noneの場合は"untraced"）
+        requested: 呼び出し元からの有効化の指定（例: ?profile=<PROFILE_TOKEN>）
+
+    Returns:
+        RequestProfiler（有効時）またはNullProfiler
+    """
+    if not profiling_enabled(requested):
+        return NULL_PROFILER
+    return RequestProfiler(
+        name,
+        trace_id or "untraced",
+        output_dir=os.getenv("PROFILE_DIR", DEFAULT_PROFILE_DIR),
+        interval=float(os.getenv("PROFILE_INTERVAL", "0.005"))
+    )
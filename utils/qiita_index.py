@@ -0,0 +1,494 @@
+"""Qiita記事のローカル全文検索インデックス（SQLite FTS5）
+
+qiita_searchの問い合わせをローカルのインデックスで処理し、Qiita APIを呼ぶのは
+ローカルに十分な記事がない「コールド」なクエリのときだけにする。
+APIから取得した記事はインデックスに取り込み、新着記事はバックグラウンドの
+差分更新で追加する。
+
+使い方（手動で差分更新する場合）:
+    python -m utils.qiita_index --pages 5
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+DEFAULT_DB_PATH = os.path.join(".cache", "qiita_index.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    url TEXT UNIQUE NOT NULL,
+    title TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    likes_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    user TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+-- APIの検索結果（本文にだけ一致した記事はローカルの検索で見つからないため、クエリごとに覚えておく）
+CREATE TABLE IF NOT EXISTS query_results (
+    query TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (query, url)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+    INSERT INTO articles_fts(rowid, title, tags) VALUES (new.id, new.title, new.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+    INSERT INTO articles_fts(articles_fts, rowid, title, tags) VALUES ('delete', old.id, old.title, old.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE ON articles BEGIN
+    INSERT INTO articles_fts(articles_fts, rowid, title, tags) VALUES ('delete', old.id, old.title, old.tags);
+    INSERT INTO articles_fts(rowid, title, tags) VALUES (new.id, new.title, new.tags);
+END;
+"""
+
+# trigramトークナイザーは3文字未満の語を検索できないため、短い語はLIKEで絞り込む
+_MIN_FTS_TERM_LENGTH = 3
+
+
+def _short_term_pattern(term: str) -> "re.Pattern":
+    """
+    短い語に一致する正規表現（英数字の語の一部には一致しない）
+
+    "Go"が"Django"・"MongoDB"に、"AI"が"Rails"に一致しないよう、前後が英数字でない位置だけを見る。
+    """
+    return re.compile(rf"(?<![0-9a-z]){re.escape(term.casefold())}(?![0-9a-z])")
+
+# Qiitaの検索クエリの修飾子（tag:以外はローカル検索では無視する）
+_QUALIFIER = re.compile(r"^(-?)(\w+):(.+)$")
+
+
+def parse_query(query: str) -> Dict[str, list]:
+    """
+    Qiitaの検索クエリをキーワードとタグに分解
+
+    Args:
+        query: 例 "tag:Python 機械学習 stocks:>10"
+
+    Returns:
+        {"terms": [...], "tags": [...]}
+    """
+    terms, tags = [], []
+    for token in re.findall(r'"[^"]+"|\S+', query):
+        token = token.strip('"')
+        match = _QUALIFIER.match(token)
+        if match:
+            negated, key, value = match.groups()
+            if key == "tag" and not negated:
+                tags.append(value)
+            continue
+        if token.upper() not in ("OR", "AND"):
+            terms.append(token)
+    return {"terms": terms, "tags": tags}
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _age_days(created_at: Optional[str], now: datetime) -> float:
+    try:
+        created = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        return 365.0
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return max((now - created).total_seconds() / 86400, 0.0)
+
+
+def rank_score(likes_count: int, created_at: Optional[str], half_life_days: float, now: Optional[datetime] = None) -> float:
+    """いいね数と新しさを組み合わせたスコア（いいねの対数を経過日数の半減期で減衰）"""
+    now = now or datetime.now(timezone.utc)
+    decay = 0.5 ** (_age_days(created_at, now) / half_life_days)
+    return (1.0 + math.log1p(max(likes_count, 0))) * decay
+
+
+class QiitaIndex:
+    """Qiita記事の全文検索インデックス"""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_DB_PATH,
+        query_ttl: float = 6 * 3600,
+        refresh_interval: float = 1800,
+        half_life_days: float = 365,
+        refresh_query: str = "stocks:>10",
+        refresh_pages: int = 3,
+    ):
+        self.path = path
+        self.query_ttl = query_ttl
+        self.refresh_interval = refresh_interval
+        self.half_life_days = half_life_days
+        self.refresh_query = refresh_query
+        self.refresh_pages = refresh_pages
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._refreshing = False
+        self._stats = {"local_hits": 0, "cold_fetches": 0, "refreshes": 0, "refresh_failures": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        """接続を取得（初回のみ作成、呼び出し元で_lockを保持していること）"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5("
+                    "title, tags, content='articles', content_rowid='id', tokenize='trigram')"
+                )
+            except sqlite3.OperationalError:
+                # 古いSQLite（3.34未満）はtrigram非対応のため、既定のトークナイザーを使う
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5("
+                    "title, tags, content='articles', content_rowid='id')"
+                )
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def add_articles(self, articles: List[Dict[str, Any]]) -> int:
+        """
+        記事をインデックスに追加（同じURLの記事はいいね数などを更新）
+
+        Args:
+            articles: search_qiita_articlesと同じ形式の記事リスト
+
+        Returns:
+            追加・更新した記事数
+        """
+        rows = [
+            (
+                article["url"],
+                article.get("title", ""),
+                " ".join(article.get("tags", [])),
+                article.get("likes_count", 0) or 0,
+                article.get("created_at", ""),
+                article.get("user", ""),
+                time.time(),
+            )
+            for article in articles
+            if article.get("url") and "error" not in article
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT INTO articles (url, title, tags, likes_count, created_at, user, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET title=excluded.title, tags=excluded.tags, "
+                "likes_count=excluded.likes_count, indexed_at=excluded.indexed_at",
+                rows
+            )
+            conn.commit()
+        return len(rows)
+
+    def search(self, query: str, limit: int = 10, candidates: int = 500) -> List[Dict[str, Any]]:
+        """
+        ローカルのインデックスを検索し、いいね数と新しさの順で返す
+
+        Args:
+            query: Qiitaの検索クエリ
+            limit: 返す記事数
+            candidates: スコア計算の対象にする候補数（全文検索の関連度順）
+
+        Returns:
+            search_qiita_articlesと同じ形式の記事リスト
+        """
+        parsed = parse_query(query)
+        fts_terms, conditions, params, short_terms = [], [], [], []
+        for term in parsed["terms"]:
+            if len(term) >= _MIN_FTS_TERM_LENGTH:
+                fts_terms.append(_fts_phrase(term))
+            else:
+                # タイトルは部分一致で候補を絞り、語の区切りは取得後に確かめる。タグは完全一致
+                conditions.append("(a.title LIKE ? OR (' ' || LOWER(a.tags) || ' ') LIKE ?)")
+                params += [f"%{term}%", f"% {term.lower()} %"]
+                short_terms.append((term.casefold(), _short_term_pattern(term)))
+        for tag in parsed["tags"]:
+            # タグは完全一致（大文字小文字は区別しない）
+            conditions.append("(' ' || LOWER(a.tags) || ' ') LIKE ?")
+            params.append(f"% {tag.lower()} %")
+        if not fts_terms and not conditions:
+            return []
+
+        if fts_terms:
+            sql = (
+                "SELECT a.title, a.url, a.tags, a.likes_count, a.created_at, a.user "
+                "FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid "
+                "WHERE articles_fts MATCH ?"
+            )
+            params = [" AND ".join(fts_terms)] + params
+        else:
+            sql = "SELECT a.title, a.url, a.tags, a.likes_count, a.created_at, a.user FROM articles a WHERE 1"
+        for condition in conditions:
+            sql += f" AND {condition}"
+        sql += " ORDER BY bm25(articles_fts)" if fts_terms else " ORDER BY a.likes_count DESC"
+        sql += " LIMIT ?"
+        params.append(candidates)
+
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        if short_terms:
+            rows = [
+                row for row in rows
+                if all(
+                    term in row[2].casefold().split() or pattern.search(row[0].casefold())
+                    for term, pattern in short_terms
+                )
+            ]
+
+        now = datetime.now(timezone.utc)
+        rows.sort(key=lambda row: rank_score(row[3], row[4], self.half_life_days, now), reverse=True)
+        return [
+            {
+                "title": title,
+                "url": url,
+                "tags": tags.split(),
+                "likes_count": likes_count,
+                "created_at": created_at,
+                "user": user,
+            }
+            for title, url, tags, likes_count, created_at, user in rows[:limit]
+        ]
+
+    def all_articles(self, limit: int = 50000) -> List[Dict[str, Any]]:
+        """インデックスの記事をタイトルとタグだけで返す（新しい順、タグ共起モデルの構築用）"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT title, tags FROM articles ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [{"title": title, "tags": tags.split()} for title, tags in rows]
+
+    def _articles_for_urls(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """URLで記事を取り出す（呼び出し元で_lockを保持していること）"""
+        if not urls:
+            return []
+        rows = self._connect().execute(
+            "SELECT title, url, tags, likes_count, created_at, user FROM articles "
+            f"WHERE url IN ({','.join('?' * len(urls))})",
+            urls
+        ).fetchall()
+        return [
+            {
+                "title": title,
+                "url": url,
+                "tags": tags.split(),
+                "likes_count": likes_count,
+                "created_at": created_at,
+                "user": user,
+            }
+            for title, url, tags, likes_count, created_at, user in rows
+        ]
+
+    def _fetched_results(self, query: str) -> List[Dict[str, Any]]:
+        """前回APIから取得したときの検索結果"""
+        with self._lock:
+            urls = [row[0] for row in self._connect().execute(
+                "SELECT url FROM query_results WHERE query = ?", (query,)
+            )]
+            return self._articles_for_urls(urls)
+
+    def _merge_ranked(self, *lists: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        """複数の検索結果をURLで重複を除き、いいね数と新しさの順に並べる"""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for articles in lists:
+            for article in articles:
+                merged.setdefault(article.get("url", ""), article)
+        now = datetime.now(timezone.utc)
+        ranked = sorted(
+            merged.values(),
+            key=lambda article: rank_score(article.get("likes_count", 0) or 0, article.get("created_at"), self.half_life_days, now),
+            reverse=True
+        )
+        return ranked[:limit]
+
+    def _is_warm(self, query: str) -> bool:
+        """同じクエリをTTL以内にAPIから取得済みならTrue"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT fetched_at FROM queries WHERE query = ?", (query,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] < self.query_ttl
+
+    def _mark_fetched(self, query: str, articles: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM query_results WHERE query = ?", (query,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO query_results (query, url) VALUES (?, ?)",
+                [(query, article["url"]) for article in articles if article.get("url")]
+            )
+            conn.execute(
+                "INSERT INTO queries (query, fetched_at) VALUES (?, ?) "
+                "ON CONFLICT(query) DO UPDATE SET fetched_at=excluded.fetched_at",
+                (query, time.time())
+            )
+            conn.commit()
+
+    def search_or_fetch(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        ローカルで検索し、件数が足りないコールドなクエリのみQiita APIから取得
+
+        Args:
+            query: Qiitaの検索クエリ
+            limit: 返す記事数
+
+        Returns:
+            search_qiita_articlesと同じ形式の記事リスト
+        """
+        from .qiita_trends import search_qiita_articles
+
+        self.maybe_refresh()
+        results = self.search(query, limit)
+        if self._is_warm(query):
+            self._stats["local_hits"] += 1
+            # 本文にだけ一致してローカルの検索では見つからない記事も、前回のAPIの結果から補う
+            return self._merge_ranked(results, self._fetched_results(query), limit=limit)
+        if len(results) >= limit:
+            self._stats["local_hits"] += 1
+            return results
+
+        self._stats["cold_fetches"] += 1
+        articles = search_qiita_articles(query, per_page=limit)
+        if not articles:
+            # API障害時はローカルの結果だけでも返す
+            return results
+        self.add_articles(articles)
+        self._mark_fetched(query, articles)
+        # ローカルの検索はタイトルとタグしか見ないため、APIの結果を捨てずにローカルの結果と合わせる
+        return self._merge_ranked(articles, results, limit=limit)
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (key, value)
+            )
+            conn.commit()
+
+    def refresh(self, max_pages: Optional[int] = None) -> int:
+        """
+        新着記事を差分で取り込む
+
+        新しい順にページを取得し、前回の更新で取り込んだ最新記事より古い記事に
+        到達したら止める。
+
+        Args:
+            max_pages: 取得する最大ページ数
+
+        Returns:
+            取り込んだ記事数
+        """
+        from .qiita_trends import fetch_qiita_items
+
+        high_water = self._get_meta("latest_created_at") or ""
+        newest = high_water
+        total = 0
+        for page in range(1, (max_pages or self.refresh_pages) + 1):
+            articles = fetch_qiita_items(self.refresh_query, page=page, per_page=100)
+            total += self.add_articles(articles)
+            created = [article.get("created_at", "") for article in articles]
+            if created:
+                newest = max([newest] + created)
+            if not articles or (high_water and min(created) <= high_water):
+                break
+        if newest:
+            self._set_meta("latest_created_at", newest)
+        self._set_meta("refreshed_at", str(time.time()))
+        self._stats["refreshes"] += 1
+        return total
+
+    def maybe_refresh(self) -> None:
+        """前回の差分更新から一定時間が経っていれば、バックグラウンドで更新する"""
+        if self.refresh_interval <= 0 or self._refreshing:
+            return
+        refreshed_at = float(self._get_meta("refreshed_at") or 0)
+        if time.time() - refreshed_at < self.refresh_interval:
+            return
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                self._stats["refresh_failures"] += 1
+                print(f"Qiitaインデックスの更新に失敗しました: {str(e)}")
+                # 失敗時も間隔を空けて再試行する
+                self._set_meta("refreshed_at", str(time.time()))
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="qiita-index-refresh", daemon=True).start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._connect().execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        return {"articles": count, **self._stats}
+
+
+_index: Optional[QiitaIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_qiita_index() -> Optional[QiitaIndex]:
+    """プロセス内で共有するインデックスを取得（QIITA_INDEX_ENABLED=falseの場合はNone）"""
+    global _index
+    if os.getenv("QIITA_INDEX_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = QiitaIndex(
+                path=os.getenv("QIITA_INDEX_PATH", DEFAULT_DB_PATH),
+                query_ttl=float(os.getenv("QIITA_INDEX_QUERY_TTL", str(6 * 3600))),
+                refresh_interval=float(os.getenv("QIITA_INDEX_REFRESH_INTERVAL", "1800")),
+                half_life_days=float(os.getenv("QIITA_INDEX_HALF_LIFE_DAYS", "365"))
+            )
+        return _index
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Qiita記事のローカルインデックスを差分更新")
+    parser.add_argument("--pages", type=int, default=5, help="取得する最大ページ数（1ページ100件）")
+    parser.add_argument("--query", default=None, help="取り込む記事の検索クエリ（デフォルト: stocks:>10）")
+    args = parser.parse_args()
+
+    index = get_qiita_index() or QiitaIndex()
+    if args.query:
+        index.refresh_query = args.query
+    added = index.refresh(max_pages=args.pages)
+    print(f"{added}件の記事を取り込みました（合計 {index.get_stats()['articles']}件）")
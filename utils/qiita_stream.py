@@ -0,0 +1,228 @@
+"""Qiita APIの記事一覧を、本文を読み込まずに逐次解析するパーサー
+
+Qiita APIの記事にはMarkdownの本文（body）とHTML（rendered_body）が含まれ、100件で
+数MB〜数十MBになる。response.json()は本文をすべて文字列として作ってから捨てることになるため、
+受信したバイト列を先頭から読み、必要なフィールド（タイトル・URL・タグ・いいね数・
+作成日時・ユーザーID）だけを取り出して、それ以外の文字列は閉じ引用符まで読み飛ばす。
+読み飛ばした部分は受信バッファごと捨てるため、メモリ使用量は受信チャンクの大きさ程度で済む。
+"""
+
+import json
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+# 記事オブジェクトからの経路 → 取り出した値の格納先
+# （"*"は配列の要素を表す）
+WANTED_PATHS = {
+    ("title",): "title",
+    ("url",): "url",
+    ("likes_count",): "likes_count",
+    ("created_at",): "created_at",
+    ("tags", "*", "name"): "tags",
+    ("user", "id"): "user",
+}
+# 値を取り出すフィールドを含むコンテナ（これ以外のオブジェクト・配列は中身を見ずに読み飛ばす）
+_WANTED_PREFIXES = {path[:i] for path in WANTED_PATHS for i in range(1, len(path))}
+
+_WHITESPACE = b" \t\r\n"
+_DELIMITERS = b" \t\r\n,]}"
+
+
+class QiitaStreamError(ValueError):
+    """JSONとして解析できない応答"""
+
+
+class _Reader:
+    """チャンクの反復子からバイト列を読む（読み終えた部分は捨てる）"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self.buf = b""
+        # bufのエスケープ（\\ と \"）を同じ長さの空白に置き換えたもの。閉じ引用符をC実装のfindで探すのに使う
+        # （バックスラッシュは文字列の中にしか現れず、bufは常にエスケープの切れ目から始まるため、
+        #   先頭から2文字ずつ対にすればJSONのエスケープと一致する）
+        self.clean = b""
+        self.pos = 0
+        self.bytes_read = 0
+
+    def _fill(self) -> bool:
+        """次のチャンクを読み込む（現在位置より前のデータは捨てる）"""
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            self.bytes_read += len(chunk)
+            self.buf = self.buf[self.pos:] + chunk
+            self.clean = self.buf.replace(b"\\\\", b"  ").replace(b'\\"', b"  ")
+            self.pos = 0
+            return True
+        return False
+
+    def next_token(self) -> int:
+        """空白を読み飛ばして次の1バイトを返す（消費しない、終端では-1）"""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return -1
+
+    def expect(self, byte: int) -> None:
+        if self.next_token() != byte:
+            raise QiitaStreamError(f"'{chr(byte)}' が必要な位置で '{self._describe()}' が見つかりました")
+        self.pos += 1
+
+    def _describe(self) -> str:
+        return self.buf[self.pos:self.pos + 20].decode("utf-8", errors="replace") or "<EOF>"
+
+    def _string_end(self, keep: bool) -> int:
+        """開き引用符の直後から閉じ引用符の位置を探す（keep=Falseなら途中のデータを捨てる）"""
+        start = self.pos
+        while True:
+            index = self.clean.find(b'"', start)
+            if index >= 0:
+                return index
+            if keep:
+                self.pos = start
+            else:
+                # 本文など不要な文字列は、末尾のバックスラッシュ（次のチャンクの文字をエスケープしうる）だけ残して捨てる
+                tail = len(self.buf)
+                while tail > start and self.buf[tail - 1] == 0x5C:
+                    tail -= 1
+                self.pos = tail
+            if not self._fill():
+                raise QiitaStreamError("文字列が閉じられていません")
+            start = self.pos
+
+    def read_string(self) -> str:
+        self.expect(0x22)
+        end = self._string_end(keep=True)
+        raw = self.buf[self.pos:end]
+        self.pos = end + 1
+        try:
+            return json.loads(b'"' + raw + b'"')
+        except ValueError as e:
+            raise QiitaStreamError(f"文字列を解析できません: {e}") from e
+
+    def skip_string(self) -> None:
+        self.expect(0x22)
+        end = self._string_end(keep=False)
+        self.pos = end + 1
+
+    def read_scalar(self) -> Any:
+        """数値・true・false・nullを読む"""
+        self.next_token()
+        while True:
+            end = self.pos
+            while end < len(self.buf) and self.buf[end] not in _DELIMITERS:
+                end += 1
+            if end < len(self.buf) or not self._fill():
+                break
+        raw, self.pos = self.buf[self.pos:end], end
+        try:
+            return json.loads(raw)
+        except ValueError as e:
+            raise QiitaStreamError(f"値を解析できません: {raw[:20]!r}") from e
+
+
+def _skip_value(reader: _Reader) -> None:
+    """値を中身を作らずに読み飛ばす（入れ子のオブジェクト・配列も含む）"""
+    depth = 0
+    while True:
+        token = reader.next_token()
+        if token == 0x22:
+            reader.skip_string()
+        elif token in (0x7B, 0x5B):  # { [
+            reader.pos += 1
+            depth += 1
+        elif token in (0x7D, 0x5D):  # } ]
+            reader.pos += 1
+            depth -= 1
+        elif token in (0x2C, 0x3A):  # , :
+            reader.pos += 1
+        elif token == -1:
+            raise QiitaStreamError("応答が途中で終わっています")
+        else:
+            reader.read_scalar()
+        if depth <= 0 and token not in (0x2C, 0x3A):
+            return
+
+
+def _parse_value(reader: _Reader, path: Tuple[str, ...], record: Dict[str, Any]) -> None:
+    """pathの値を読み、必要なフィールドならrecordに格納する"""
+    token = reader.next_token()
+    target = WANTED_PATHS.get(path)
+    if target is not None and token not in (0x7B, 0x5B):
+        value = reader.read_string() if token == 0x22 else reader.read_scalar()
+        if target == "tags":
+            record["tags"].append(value)
+        else:
+            record[target] = value
+    elif token == 0x7B and path in _WANTED_PREFIXES:
+        _parse_object(reader, path, record)
+    elif token == 0x5B and path in _WANTED_PREFIXES:
+        reader.expect(0x5B)
+        if reader.next_token() == 0x5D:
+            reader.pos += 1
+            return
+        while True:
+            _parse_value(reader, path + ("*",), record)
+            token = reader.next_token()
+            reader.pos += 1
+            if token == 0x5D:
+                return
+            if token != 0x2C:
+                raise QiitaStreamError("配列の区切りが不正です")
+    else:
+        _skip_value(reader)
+
+
+def _parse_object(reader: _Reader, path: Tuple[str, ...], record: Dict[str, Any]) -> None:
+    reader.expect(0x7B)
+    if reader.next_token() == 0x7D:
+        reader.pos += 1
+        return
+    while True:
+        key = reader.read_string()
+        reader.expect(0x3A)
+        _parse_value(reader, path + (key,), record)
+        token = reader.next_token()
+        reader.pos += 1
+        if token == 0x7D:
+            return
+        if token != 0x2C:
+            raise QiitaStreamError("オブジェクトの区切りが不正です")
+
+
+def iter_qiita_articles(chunks: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """
+    Qiita APIの記事一覧（JSON配列）を逐次解析し、必要なフィールドだけの記事を返す
+
+    Args:
+        chunks: 受信したバイト列のチャンク（例: response.iter_content(65536)）
+
+    Yields:
+        format_qiita_articleと同じ形式の記事
+        （タイトル・URL・タグ名のリスト・いいね数・作成日時・ユーザーID）
+
+    Raises:
+        QiitaStreamError: JSONとして解析できない場合
+    """
+    reader = _Reader(chunks)
+    reader.expect(0x5B)
+    if reader.next_token() == 0x5D:
+        return
+    while True:
+        record = {"title": "", "url": "", "tags": [], "likes_count": 0, "created_at": "", "user": ""}
+        if reader.next_token() == 0x7B:
+            _parse_object(reader, (), record)
+            yield record
+        else:
+            _skip_value(reader)
+        token = reader.next_token()
+        reader.pos += 1
+        if token == 0x5D:
+            return
+        if token != 0x2C:
+            raise QiitaStreamError("配列の区切りが不正です")
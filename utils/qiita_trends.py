@@ -3,8 +3,45 @@
 import requests
 from typing import List, Dict, Any, Union
 import json
+from .singleflight import coalesce
+from .qiita_stream import iter_qiita_articles, QiitaStreamError
+from .transport import get_transport
 
+QIITA_ITEMS_URL = "https://qiita.com/api/v2/items"
 
+
+def request_qiita_items(params: Dict[str, Any], timeout: float = 10) -> List[Dict[str, Any]]:
+    """
+    Qiitaの記事一覧を取得し、本文を読み込まずに必要なフィールドだけを取り出す
+    
+    response.json()は100件分の本文（body・rendered_body）をすべて読み込んでしまうため、
+    受信しながら逐次解析して、タイトル・URL・タグ・いいね数・作成日時・ユーザーIDだけを残す。
+    
+    Args:
+        params: Qiita APIのクエリパラメータ
+        timeout: タイムアウト（秒）
+        
+    Returns:
+        format_qiita_articleと同じ形式の記事リスト
+        
+    Raises:
+        requests.exceptions.RequestException: API呼び出しに失敗した場合
+        QiitaStreamError: 応答をJSONとして解析できない場合
+    """
+    with get_transport().request(
+        "GET",
+        QIITA_ITEMS_URL,
+        kind="qiita",
+        params=params,
+        headers={"Content-Type": "application/json"},
+        timeout=timeout,
+        stream=True
+    ) as response:
+        response.raise_for_status()
+        return list(iter_qiita_articles(response.iter_content(chunk_size=65536)))
+
+
+@coalesce("qiita_popular")
 def get_qiita_popular_articles(page: int = 1, per_page: int = 100) -> List[Dict]:
     """
     Qiitaの人気記事を取得
@@ -14,12 +51,9 @@ def get_qiita_popular_articles(page: int = 1, per_page: int = 100) -> List[Dict]
         per_page: 1ページあたりの記事数（最大100）
         
     Returns:
-        記事のリスト
+        記事のリスト（本文を除いた整形済みの記事）
     """
     
-    # Qiita API v2のエンドポイント
-    url = "https://qiita.com/api/v2/items"
-    
     # パラメータの設定
     # ストック数順でソート（人気記事として）
     params = {
@@ -28,19 +62,10 @@ def get_qiita_popular_articles(page: int = 1, per_page: int = 100) -> List[Dict]
         "query": "stocks:>50"  # ストック数が50以上の記事を取得
     }
     
-    # ヘッダーの設定
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        articles = response.json()
-        return articles
+        return request_qiita_items(params)
         
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, QiitaStreamError) as e:
         print(f"Qiita API エラー: {str(e)}")
         return []
 
@@ -50,7 +75,7 @@ def extract_popular_tags_from_articles(articles: List[Dict], top_n: int = 20) ->
     記事からタグを抽出して、出現頻度順に並べる
     
     Args:
-        articles: Qiitaの記事リスト
+        articles: Qiitaの記事リスト（APIの生の記事・整形済みの記事のどちらも可）
         top_n: 上位何個のタグを返すか
         
     Returns:
@@ -61,7 +86,7 @@ def extract_popular_tags_from_articles(articles: List[Dict], top_n: int = 20) ->
     for article in articles:
         # 各記事のタグを取得
         for tag in article.get("tags", []):
-            tag_name = tag.get("name", "")
+            tag_name = tag.get("name", "") if isinstance(tag, dict) else tag
             if tag_name:
                 tag_count[tag_name] = tag_count.get(tag_name, 0) + 1
     
@@ -72,6 +97,46 @@ def extract_popular_tags_from_articles(articles: List[Dict], top_n: int = 20) ->
     return [{"name": tag[0], "count": tag[1]} for tag in sorted_tags[:top_n]]
 
 
+def format_qiita_article(article: Dict) -> Dict[str, Any]:
+    """
+    Qiita APIの記事を検索結果用の形式に整形
+    
+    Args:
+        article: Qiita APIの記事
+        
+    Returns:
+        タイトル・URL・タグ・いいね数・作成日時・ユーザーIDの辞書
+    """
+    return {
+        "title": article.get("title", ""),
+        "url": article.get("url", ""),
+        "tags": [tag.get("name", "") for tag in article.get("tags", [])],
+        "likes_count": article.get("likes_count", 0),
+        "created_at": article.get("created_at", ""),
+        "user": article.get("user", {}).get("id", "")
+    }
+
+
+def fetch_qiita_items(query: str, page: int = 1, per_page: int = 100) -> List[Dict]:
+    """
+    Qiitaの記事一覧を新しい順に1ページ分取得（ローカルインデックスの更新用）
+    
+    Args:
+        query: 検索クエリ（例: "stocks:>10"）
+        page: ページ番号
+        per_page: 1ページあたりの記事数（最大100）
+        
+    Returns:
+        整形済みの記事リスト
+        
+    Raises:
+        requests.exceptions.RequestException: API呼び出しに失敗した場合
+        QiitaStreamError: 応答をJSONとして解析できない場合
+    """
+    return request_qiita_items({"page": page, "per_page": per_page, "query": query})
+
+
+@coalesce("qiita_search")
 def search_qiita_articles(query: str, per_page: int = 10) -> List[Dict]:
     """
     Qiitaで特定のキーワードで記事を検索
@@ -83,39 +148,17 @@ def search_qiita_articles(query: str, per_page: int = 10) -> List[Dict]:
     Returns:
         検索結果の記事リスト
     """
-    url = "https://qiita.com/api/v2/items"
-    
     params = {
         "page": 1,
         "per_page": per_page,
         "query": query
     }
     
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        articles = response.json()
-        
-        # 記事情報を整形
-        formatted_articles = []
-        for article in articles:
-            formatted_articles.append({
-                "title": article.get("title", ""),
-                "url": article.get("url", ""),
-                "tags": [tag.get("name", "") for tag in article.get("tags", [])],
-                "likes_count": article.get("likes_count", 0),
-                "created_at": article.get("created_at", ""),
-                "user": article.get("user", {}).get("id", "")
-            })
-        
-        return formatted_articles
+        # 本文を読み込まずに、必要な記事情報だけを取り出す
+        return request_qiita_items(params)
         
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, QiitaStreamError) as e:
         print(f"Qiita検索エラー: {str(e)}")
         return []
 
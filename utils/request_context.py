@@ -0,0 +1,219 @@
+"""リクエスト全体の締め切りとキャンセルを伝えるコンテキスト
+
+ユーザーが別の分野を選んだりタブを閉じたりした後も、エージェントのストリーム・
+検索ツールのHTTP呼び出し・Bedrockの生成が最後まで走り続けないようにする。
+RequestContextをエージェントのコールバックと各検索ツールに渡し、
+キャンセルまたは締め切り超過の時点で次のイベント・ツール呼び出しから打ち切る。
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Callable, Optional, List
+
+_stats_lock = threading.Lock()
+_stats = {
+    "runs_started": 0,
+    "runs_completed": 0,
+    "runs_stopped_early": 0,
+    "runs_cancelled": 0,
+    "runs_deadline_exceeded": 0,
+    "runs_failed": 0,
+    "model_streams_aborted": 0,
+    "tool_calls": 0,
+    "tool_calls_skipped": 0,
+    "tool_calls_abandoned": 0,
+    "tool_timeouts": 0,
+    "deadline_seconds_released": 0.0,
+}
+
+
+def _count(key: str, value: float = 1) -> None:
+    with _stats_lock:
+        _stats[key] += value
+
+
+def get_cancellation_stats() -> Dict[str, Any]:
+    """キャンセル・締め切りで打ち切った処理の統計"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["deadline_seconds_released"] = round(stats["deadline_seconds_released"], 1)
+    return stats
+
+
+def _start_tool(func: Callable[..., Any], *args, **kwargs) -> Future:
+    """
+    ツールを専用のスレッドで実行する（打ち切ったツールの完了を待たずに戻るため）
+
+    共有のスレッドプールを使うと、打ち切った後も走り続けるツールが枠を埋め、
+    後続のツールが待たされたまま自分の制限時間を使い切ってしまうため、呼び出しごとにスレッドを作る。
+    """
+    future: Future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True, name="tool").start()
+    return future
+
+
+class RequestCancelled(Exception):
+    """リクエストがキャンセルされた"""
+
+
+class DeadlineExceeded(RequestCancelled):
+    """リクエストの締め切りを過ぎた"""
+
+
+class RequestContext:
+    """
+    1回の生成リクエストの締め切りとキャンセル状態
+
+    Args:
+        deadline_seconds: リクエスト全体の制限時間（秒、省略時は環境変数REQUEST_DEADLINE_SECONDS）
+        tool_timeout: ツール1回あたりの制限時間（秒、省略時は環境変数TOOL_TIMEOUT_SECONDS）。
+            締め切りまでの残り時間が短ければそちらを優先する
+        profiler: リクエストのプロファイラー（指定時はエージェントとツールのスレッドもサンプリングの対象にする）
+    """
+
+    def __init__(self, deadline_seconds: Optional[float] = None, tool_timeout: Optional[float] = None, profiler=None):
+        if deadline_seconds is None:
+            deadline_seconds = float(os.getenv("REQUEST_DEADLINE_SECONDS", "180"))
+        if tool_timeout is None:
+            tool_timeout = float(os.getenv("TOOL_TIMEOUT_SECONDS", "20"))
+        self.deadline = time.monotonic() + deadline_seconds
+        self.tool_timeout = tool_timeout
+        self.profiler = profiler
+        self.reason: Optional[str] = None
+        self._cancelled = threading.Event()
+        self._finished = False
+        self._aborted = False
+        self._lock = threading.Lock()
+        _count("runs_started")
+
+    def remaining(self) -> float:
+        """締め切りまでの残り秒数"""
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """キャンセルする（2回目以降の呼び出しや完了後の呼び出しは無視）"""
+        with self._lock:
+            if self._finished or self._cancelled.is_set():
+                return
+            self.reason = reason
+            self._cancelled.set()
+        if reason == "deadline":
+            _count("runs_deadline_exceeded")
+        elif reason == "failed":
+            # エラーで止めた場合はキャンセルとして数えない
+            _count("runs_failed")
+        else:
+            _count("runs_cancelled")
+            _count("deadline_seconds_released", self.remaining())
+
+    def finish(self) -> None:
+        """正常に完了したことを記録"""
+        with self._lock:
+            if self._finished or self._cancelled.is_set():
+                return
+            self._finished = True
+        _count("runs_completed")
+
+    def stop_early(self) -> None:
+        """必要な結果がそろったため、残りの生成を打ち切る（完了として記録）"""
+        with self._lock:
+            if self._finished or self._cancelled.is_set():
+                return
+            self._finished = True
+            self.reason = "completed_early"
+            self._cancelled.set()
+        _count("runs_completed")
+        _count("runs_stopped_early")
+
+    def check(self) -> None:
+        """キャンセル済み、または締め切りを過ぎていれば例外を送出"""
+        if not self._cancelled.is_set() and self.remaining() <= 0:
+            self.cancel("deadline")
+        if self._cancelled.is_set():
+            if self.reason == "deadline":
+                raise DeadlineExceeded("処理の制限時間を超えました")
+            raise RequestCancelled(f"処理がキャンセルされました（{self.reason}）")
+
+    def callback_handler(self, **kwargs) -> None:
+        """
+        エージェントのcallback_handlerとして使う
+
+        Strands Agentsはモデルのストリームやツールのイベントごとに、エージェントの
+        ワーカースレッドからこの関数を呼ぶ。ここで例外を送出するとイベントループが
+        中断され、Bedrockのストリームもその時点で閉じられる。
+        """
+        if self.profiler is not None:
+            # エージェントのワーカースレッドをプロファイルの対象にする
+            self.profiler.register_thread()
+        try:
+            self.check()
+        except RequestCancelled:
+            with self._lock:
+                first_abort, self._aborted = not self._aborted, True
+            if first_abort and self.reason != "completed_early":
+                _count("model_streams_aborted")
+            raise
+
+    def _profiled(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """ツールのスレッドを実行中だけプロファイルの対象にする"""
+        if self.profiler is None:
+            return func
+
+        def run(*args, **kwargs):
+            self.profiler.register_thread()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.profiler.unregister_thread()
+
+        return run
+
+    def run_tool(self, name: str, func: Callable[..., List[Dict[str, Any]]], *args, **kwargs) -> List[Dict[str, Any]]:
+        """
+        ツールを制限時間付きで実行し、キャンセルされたら完了を待たずに戻る
+
+        Args:
+            name: ツール名（エラーメッセージ用）
+            func: 検索結果のリストを返すツール関数
+
+        Returns:
+            ツールの結果（打ち切った場合はエラーの結果）
+        """
+        if self.cancelled or self.remaining() <= 0:
+            _count("tool_calls_skipped")
+            return [{"error": f"{name}はリクエストの終了により実行しませんでした。"}]
+
+        _count("tool_calls")
+        timeout = min(self.tool_timeout, self.remaining())
+        future = _start_tool(self._profiled(func), *args, **kwargs)
+        end = time.monotonic() + timeout
+        while True:
+            # キャンセルに素早く気づけるよう、短い間隔で待つ
+            wait = min(0.1, end - time.monotonic())
+            if wait <= 0:
+                future.cancel()
+                _count("tool_timeouts")
+                return [{"error": f"{name}が制限時間（{timeout:g}秒）内に完了しませんでした。"}]
+            try:
+                return future.result(timeout=wait)
+            except FutureTimeoutError:
+                pass
+            if self.cancelled:
+                future.cancel()
+                _count("tool_calls_abandoned")
+                return [{"error": f"{name}はリクエストのキャンセルにより中断しました。"}]
@@ -0,0 +1,263 @@
+"""検索結果の重複排除（URL正規化とMinHashによる近似重複検出）"""
+
+import hashlib
+import math
+import random
+import re
+import threading
+import unicodedata
+import urllib.parse
+from typing import List, Dict, Any, Iterable, Optional
+
+# URLから取り除くトラッキング用パラメータ
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "yclid", "msclkid", "mc_cid", "mc_eid",
+    "ref", "ref_src", "source", "spm", "igshid", "amp",
+}
+TRACKING_PARAM_PREFIXES = ("utm_", "_hs", "pk_")
+
+# モバイル版・AMP版のホスト接頭辞
+HOST_PREFIXES = ("www.", "m.", "mobile.", "amp.")
+
+# タイトル末尾のサイト名（" - Qiita" など）
+SITE_SUFFIX_PATTERN = re.compile(r"\s*[-|｜:：]\s*(qiita|zenn|note|dev\.to|medium|speaker ?deck)\s*$", re.IGNORECASE)
+
+# MinHashの設定（16バンド × 4行 = 64個のハッシュ関数）
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    URLを正規化して、同じページを指すURLを同一の文字列にする
+
+    Args:
+        url: 正規化するURL
+
+    Returns:
+        正規化されたURL（空文字の場合は空文字）
+    """
+    if not url:
+        return ""
+
+    parts = urllib.parse.urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if ":" in host and host.rsplit(":", 1)[1] in ("80", "443"):
+        host = host.rsplit(":", 1)[0]
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    # Google AMPキャッシュ（example-com.cdn.ampproject.org/c/s/example.com/...）
+    if host.endswith("cdn.ampproject.org"):
+        path = re.sub(r"^/[a-z]/(s/)?", "", parts.path)
+        return canonicalize_url(f"https://{path}")
+
+    path = parts.path
+    path = re.sub(r"/amp/?$", "", path)
+    path = re.sub(r"\.amp(\.html)?$", "", path)
+    path = re.sub(r"/{2,}", "/", path).rstrip("/")
+
+    query = [
+        (key, value)
+        for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ]
+    query.sort()
+
+    # スキームは区別しない（http/httpsの両方で配信されるミラー対策）
+    canonical = f"{host}{path}"
+    if query:
+        canonical += "?" + urllib.parse.urlencode(query)
+    return canonical
+
+
+def _normalize_text(text: str) -> str:
+    """比較用にテキストを正規化（全角半角統一・小文字化・記号除去）"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = SITE_SUFFIX_PATTERN.sub("", text)
+    text = re.sub(r"[\s\W_]+", " ", text)
+    return text.strip()
+
+
+def _shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """文字単位のシングルを作成（日本語は単語区切りがないため文字n-gramを使う）"""
+    compact = text.replace(" ", "")
+    if len(compact) <= size:
+        return {compact} if compact else set()
+    return {compact[i:i + size] for i in range(len(compact) - size + 1)}
+
+
+def minhash_signature(text: str) -> Optional[tuple]:
+    """
+    テキストのMinHash署名を計算
+
+    Args:
+        text: 署名を計算するテキスト
+
+    Returns:
+        署名のタプル（シングルがない場合はNone）
+    """
+    shingles = _shingles(_normalize_text(text))
+    if not shingles:
+        return None
+
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in shingles
+    ]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimate_similarity(sig_a: tuple, sig_b: tuple) -> float:
+    """MinHash署名からJaccard係数を推定"""
+    matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return matches / NUM_PERMUTATIONS
+
+
+def record_url(record: Dict[str, Any]) -> str:
+    """検索結果のURLを取得（Qiitaは'url'、Web検索は'link'）"""
+    return record.get("url") or record.get("link") or ""
+
+
+def record_text(record: Dict[str, Any]) -> str:
+    """近似重複判定に使うテキスト（タイトル＋概要）"""
+    return f"{record.get('title', '')} {record.get('snippet', '')}"
+
+
+def record_score(record: Dict[str, Any], rank: int = 0) -> float:
+    """
+    重複時にどちらを残すかを決めるスコア
+
+    Qiitaの記事（いいね数やタグを持つ一次情報）を優先し、
+    Web検索結果は関連性スコアまたは検索順位で評価する
+    """
+    if "likes_count" in record:
+        return 1.0 + math.log1p(max(record.get("likes_count") or 0, 0))
+    if record.get("score"):
+        return float(record["score"])
+    return 0.5 / (rank + 1)
+
+
+class SearchResultMerger:
+    """
+    複数の検索ツールの結果をまたいで重複を排除する
+
+    エージェント1回分の実行で共有し、すでにモデルに渡した記事と
+    同じもの（URL一致または近似重複）を後続の検索結果から取り除く。
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._urls: Dict[str, int] = {}
+        self._signatures: List[tuple] = []
+        self._buckets: Dict[tuple, List[int]] = {}
+        self._records: List[Dict[str, Any]] = []
+        self._scores: List[float] = []
+        self.stats = {"seen": 0, "kept": 0, "url_duplicates": 0, "near_duplicates": 0}
+
+    def _find_duplicate(self, canonical: str, signature: Optional[tuple]) -> Optional[int]:
+        """既存の結果から重複を探してインデックスを返す"""
+        if canonical and canonical in self._urls:
+            self.stats["url_duplicates"] += 1
+            return self._urls[canonical]
+        if signature is None:
+            return None
+
+        candidates = set()
+        for band in range(LSH_BANDS):
+            key = (band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+            candidates.update(self._buckets.get(key, ()))
+        for index in candidates:
+            other = self._signatures[index]
+            if other is not None and estimate_similarity(signature, other) >= self.threshold:
+                self.stats["near_duplicates"] += 1
+                return index
+        return None
+
+    def _add(self, record: Dict[str, Any], canonical: str, signature: Optional[tuple], score: float) -> int:
+        index = len(self._records)
+        self._records.append(record)
+        self._signatures.append(signature)
+        self._scores.append(score)
+        if canonical:
+            self._urls[canonical] = index
+        if signature is not None:
+            for band in range(LSH_BANDS):
+                key = (band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+                self._buckets.setdefault(key, []).append(index)
+        return index
+
+    def merge(self, results: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        検索結果を取り込み、まだ返していない結果だけを返す
+
+        同じ呼び出し内で重複した場合はスコアの高い方を残す。
+        以前の呼び出しで返した結果と重複するものは除外する。
+        エラーを表す結果はそのまま返す。
+
+        Args:
+            results: 検索ツールの結果リスト
+
+        Returns:
+            重複を除いた結果リスト（入力の順序を維持）
+        """
+        with self._lock:
+            start = len(self._records)
+            output_indices: List[int] = []
+            passthrough: List[tuple] = []
+
+            for rank, record in enumerate(results):
+                if "error" in record:
+                    passthrough.append((len(output_indices), record))
+                    continue
+
+                self.stats["seen"] += 1
+                canonical = canonicalize_url(record_url(record))
+                signature = minhash_signature(record_text(record))
+                score = record_score(record, rank)
+
+                duplicate = self._find_duplicate(canonical, signature)
+                if duplicate is None:
+                    output_indices.append(self._add(record, canonical, signature, score))
+                elif duplicate >= start and score > self._scores[duplicate]:
+                    # 今回の呼び出し内の重複は、スコアの高い方に置き換える
+                    self._records[duplicate] = record
+                    self._scores[duplicate] = score
+                    if canonical:
+                        self._urls[canonical] = duplicate
+
+            merged = [self._records[i] for i in output_indices]
+            for position, record in reversed(passthrough):
+                merged.insert(position, record)
+            self.stats["kept"] += len(output_indices)
+            return merged
+
+
+def merge_search_results(*result_lists: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    複数の検索結果リストを1つにまとめて重複を排除
+
+    Args:
+        result_lists: 検索ツールの結果リスト（可変長）
+
+    Returns:
+        重複を除いた結果リスト
+    """
+    merger = SearchResultMerger()
+    combined = [record for results in result_lists for record in results]
+    return merger.merge(combined)
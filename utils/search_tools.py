@@ -1,12 +1,21 @@
 """検索APIを使用するカスタムツール"""
 
 import os
+import time
+import functools
 import requests
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable
 from strands import tool
-from googleapiclient.discovery import build
 from dotenv import load_dotenv
 from .qiita_trends import search_qiita_articles
+from .qiita_index import get_qiita_index
+from .result_merge import SearchResultMerger, canonicalize_url, merge_search_results
+from .hedging import LatencyTracker, HedgeBudget, hedged_call
+from .circuit_breaker import google_cse_breaker, classify_google_error
+from .singleflight import coalesce
+from .request_context import RequestContext
+from .transport import get_transport
 
 # 環境変数を読み込む
 load_dotenv()
@@ -15,7 +24,22 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 
+# ヘッジ設定（Googleの応答が遅い場合にTavilyを並行実行する）
+SEARCH_HEDGING = os.getenv("SEARCH_HEDGING", "false").lower() in ("1", "true", "yes")
+SEARCH_HEDGE_PERCENTILE = float(os.getenv("SEARCH_HEDGE_PERCENTILE", "0.9"))
+SEARCH_HEDGE_RATIO = float(os.getenv("SEARCH_HEDGE_RATIO", "0.1"))
 
+google_latency = LatencyTracker(
+    default_delay=float(os.getenv("SEARCH_HEDGE_DEFAULT_DELAY", "2.0"))
+)
+hedge_budget = HedgeBudget(ratio=SEARCH_HEDGE_RATIO)
+
+# qiita_multi_searchでキーワードごとの検索を並行実行する（1回にまとめて検索するキーワード数の上限も兼ねる）
+QIITA_MULTI_SEARCH_MAX_KEYWORDS = 8
+_qiita_executor = ThreadPoolExecutor(max_workers=QIITA_MULTI_SEARCH_MAX_KEYWORDS, thread_name_prefix="qiita")
+
+
+@coalesce("tavily_search")
 def tavily_search_api(query: str, num_results: int = 10) -> List[Dict[str, Any]]:
     """
     Tavily Search APIを使用してWeb検索を実行（内部関数）
@@ -28,13 +52,15 @@ def tavily_search_api(query: str, num_results: int = 10) -> List[Dict[str, Any]]
         検索結果のリスト（各結果は辞書形式）
     """
     try:
-        response = requests.post(
+        response = get_transport().request(
+            "POST",
             "https://api.tavily.com/search",
+            kind="tavily",
             headers={
                 "Authorization": f"Bearer {TAVILY_API_KEY}",
                 "Content-Type": "application/json"
             },
-            json={
+            json_body={
                 "query": query,
                 "topic": "general",
                 "search_depth": "basic",
@@ -65,7 +91,64 @@ def tavily_search_api(query: str, num_results: int = 10) -> List[Dict[str, Any]]
         }]
 
 
-@tool
+def _google_cse_search(query: str, num_results: int = 10) -> List[Dict[str, Any]]:
+    """
+    Google Custom Search APIで検索（内部関数、エラー時は例外を送出）
+    
+    Args:
+        query: 検索クエリ
+        num_results: 取得する結果数（最大10）
+    
+    Returns:
+        検索結果のリスト（各結果は辞書形式）
+    """
+    # googleapiclient.discoveryはimportが重いため、初回のGoogle検索まで遅延する
+    from googleapiclient.discovery import build
+    
+    params = {
+        "q": query,
+        "lr": 'lang_ja',  # 日本語の結果を優先
+        "num": min(num_results, 10),  # 最大10件
+        "dateRestrict": 'm1'  # 過去1ヶ月以内の結果を優先
+    }
+    
+    def execute():
+        service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
+        return service.cse().list(cx=GOOGLE_CSE_ID, **params).execute()
+    
+    start = time.monotonic()
+    try:
+        # 記録・再生のキーには検索条件だけを使う（APIキーと検索エンジンIDは含めない）
+        result = get_transport().call("google_cse", params, execute)
+    except Exception as e:
+        # エラー種別をブレーカーに記録（クォータ切れならリセット時刻まで遮断）
+        google_cse_breaker.record_failure(classify_google_error(e))
+        raise
+    
+    google_cse_breaker.record_success()
+    # ヘッジの待ち時間を決めるため、成功時のレイテンシを記録
+    google_latency.record(time.monotonic() - start)
+    
+    items = result.get('items', [])
+    
+    # 結果を整形して返す
+    formatted_results = []
+    for item in items:
+        formatted_results.append({
+            'title': item.get('title', ''),
+            'link': item.get('link', ''),
+            'snippet': item.get('snippet', ''),
+            'displayLink': item.get('displayLink', '')
+        })
+    
+    return formatted_results
+
+
+def _is_good_result(results: List[Dict[str, Any]]) -> bool:
+    """検索結果がエラーでないかを判定"""
+    return not (len(results) == 1 and "error" in results[0])
+
+
 def google_search(query: str, num_results: int = 10) -> List[Dict[str, Any]]:
     """
     Google Custom Search APIを使用してWeb検索を実行。
@@ -78,37 +161,26 @@ def google_search(query: str, num_results: int = 10) -> List[Dict[str, Any]]:
     Returns:
         検索結果のリスト（各結果は辞書形式）
     """
-    # まずGoogle検索を試す
-    if GOOGLE_API_KEY and GOOGLE_CSE_ID:
+    google_configured = bool(GOOGLE_API_KEY and GOOGLE_CSE_ID)
+    
+    # まずGoogle検索を試す（ブレーカーが開いている間はGoogleを呼ばない）
+    if google_configured and google_cse_breaker.allow_request():
         try:
-            service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
-            
-            result = service.cse().list(
-                q=query,
-                cx=GOOGLE_CSE_ID,
-                lr='lang_ja',  # 日本語の結果を優先
-                num=min(num_results, 10),  # 最大10件
-                dateRestrict='m1'  # 過去1ヶ月以内の結果を優先
-            ).execute()
-            
-            items = result.get('items', [])
-            
-            # 結果を整形して返す
-            formatted_results = []
-            for item in items:
-                formatted_results.append({
-                    'title': item.get('title', ''),
-                    'link': item.get('link', ''),
-                    'snippet': item.get('snippet', ''),
-                    'displayLink': item.get('displayLink', '')
-                })
-            
-            return formatted_results
+            if SEARCH_HEDGING and TAVILY_API_KEY:
+                # Googleの応答が遅い場合はTavily検索を並行して実行
+                return hedged_call(
+                    lambda: _google_cse_search(query, num_results),
+                    lambda: tavily_search_api(query, num_results),
+                    delay=google_latency.hedge_delay(SEARCH_HEDGE_PERCENTILE),
+                    budget=hedge_budget,
+                    is_good=_is_good_result
+                )
+            return _google_cse_search(query, num_results)
         
         except Exception as e:
             error_msg = str(e)
             # クォータ制限エラーをチェック
-            if "quota" in error_msg.lower() or "limit" in error_msg.lower():
+            if classify_google_error(e) in ("quota", "rate_limit"):
                 print(f"Google検索のクォータ制限に達しました。Tavily検索にフォールバックします。")
                 # Tavily検索にフォールバック
                 if TAVILY_API_KEY:
@@ -127,6 +199,13 @@ def google_search(query: str, num_results: int = 10) -> List[Dict[str, Any]]:
     elif TAVILY_API_KEY:
         return tavily_search_api(query, num_results)
     
+    # Google検索が遮断中で、Tavilyも設定されていない場合
+    elif google_configured:
+        state = google_cse_breaker.get_state()
+        return [{
+            "error": f"Google search is temporarily disabled ({state['error_class']}) until {state['open_until']}."
+        }]
+    
     # どちらのAPIも設定されていない場合
     else:
         return [{
@@ -162,7 +241,6 @@ def format_search_results_for_blog(search_results: List[Dict[str, Any]]) -> str:
     return formatted
 
 
-@tool
 def qiita_search(query: str, num_results: int = 10) -> List[Dict[str, Any]]:
     """
     Qiitaで記事を検索
@@ -175,8 +253,12 @@ def qiita_search(query: str, num_results: int = 10) -> List[Dict[str, Any]]:
         検索結果のリスト（各結果は辞書形式）
     """
     try:
-        # Qiitaの検索を実行
-        articles = search_qiita_articles(query, per_page=num_results)
+        # ローカルのインデックスで検索（コールドなクエリのみQiita APIを呼ぶ）
+        index = get_qiita_index()
+        if index is not None:
+            articles = index.search_or_fetch(query, limit=num_results)
+        else:
+            articles = search_qiita_articles(query, per_page=num_results)
         
         if not articles:
             return [{
@@ -191,6 +273,55 @@ def qiita_search(query: str, num_results: int = 10) -> List[Dict[str, Any]]:
         }]
 
 
+def qiita_multi_search(keywords: List[str], num_results: int = 10) -> List[Dict[str, Any]]:
+    """
+    複数のキーワードでQiitaの記事をまとめて検索（キーワードごとにqiita_searchを呼ぶ代わりに使う）
+    
+    Args:
+        keywords: 検索キーワードのリスト（最大8個）
+        num_results: 取得する結果数（全キーワード合計、最大100）
+    
+    Returns:
+        いいね数の多い順に並べ、重複を除いた検索結果のリスト。
+        各結果のmatched_keywordsに、その記事が見つかったキーワードを含む
+    """
+    keywords = list(dict.fromkeys(keyword.strip() for keyword in keywords if keyword and keyword.strip()))
+    keywords = keywords[:QIITA_MULTI_SEARCH_MAX_KEYWORDS]
+    if not keywords:
+        return [{
+            "error": "検索キーワードを1つ以上指定してください。"
+        }]
+    
+    # キーワードごとの検索を並行実行（ローカルインデックス・APIの取得はキーワード単位でキャッシュされる）
+    per_keyword = min(max(num_results, 1), 100)
+    results = list(_qiita_executor.map(lambda keyword: qiita_search(keyword, num_results=per_keyword), keywords))
+    
+    articles: Dict[str, Dict[str, Any]] = {}
+    errors = []
+    for keyword, found in zip(keywords, results):
+        for article in found:
+            if "error" in article:
+                errors.append(f"{keyword}: {article['error']}")
+                continue
+            key = canonicalize_url(article.get("url", "")) or article.get("title", "")
+            if key not in articles:
+                articles[key] = {**article, "matched_keywords": []}
+            articles[key]["matched_keywords"].append(keyword)
+    
+    if not articles:
+        return [{
+            "error": "Qiitaの検索結果が見つかりませんでした。" + (f"（{'; '.join(errors)}）" if errors else "")
+        }]
+    
+    # いいね数の多い順（同数なら多くのキーワードに一致した記事を優先）に並べ、近似重複を除く
+    ranked = sorted(
+        articles.values(),
+        key=lambda article: (article.get("likes_count", 0), len(article["matched_keywords"])),
+        reverse=True
+    )
+    return merge_search_results(ranked)[:num_results]
+
+
 @tool
 def format_qiita_results_for_blog(qiita_results: List[Dict[str, Any]]) -> str:
     """
@@ -240,13 +371,15 @@ def tavily_search(query: str, num_results: int = 10, search_depth: str = "basic"
         }]
     
     try:
-        response = requests.post(
+        response = get_transport().request(
+            "POST",
             "https://api.tavily.com/search",
+            kind="tavily",
             headers={
                 "Authorization": f"Bearer {TAVILY_API_KEY}",
                 "Content-Type": "application/json"
             },
-            json={
+            json_body={
                 "query": query,
                 "topic": "general",
                 "search_depth": search_depth,
@@ -306,3 +439,43 @@ def tavily_search(query: str, num_results: int = 10, search_depth: str = "basic"
         return [{
             "error": f"Tavily search failed: {str(e)}"
         }]
+
+
+def _merged(func: Callable[..., List[Dict[str, Any]]], merger: SearchResultMerger) -> Callable[..., List[Dict[str, Any]]]:
+    """検索関数の結果をmergerで重複排除するラッパーを作成"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return merger.merge(func(*args, **kwargs))
+    return wrapper
+
+
+def _guarded(func: Callable[..., List[Dict[str, Any]]], context: RequestContext) -> Callable[..., List[Dict[str, Any]]]:
+    """検索関数をリクエストの締め切り・キャンセルとツールごとの制限時間の下で実行するラッパーを作成"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.run_tool(func.__name__, func, *args, **kwargs)
+    return wrapper
+
+
+def create_search_tools(merger: SearchResultMerger | None = None, context: RequestContext | None = None) -> list:
+    """
+    エージェント1回分の検索ツールを作成
+    
+    qiita_search・qiita_multi_search・google_searchの結果は共通のmergerを通し、
+    すでに返した記事（URL正規化後の一致や近似重複）を後続の結果から除外する。
+    
+    Args:
+        merger: 重複排除に使うSearchResultMerger（省略時は新規作成）
+        context: リクエストの締め切りとキャンセル状態（指定時は検索ごとに制限時間を設ける）
+    
+    Returns:
+        エージェントに渡すツールのリスト
+    """
+    merger = merger or SearchResultMerger()
+    search_functions = [google_search, qiita_search, qiita_multi_search]
+    if context is not None:
+        search_functions = [_guarded(func, context) for func in search_functions]
+    return [
+        *(tool(_merged(func, merger)) for func in search_functions),
+        format_qiita_results_for_blog,
+    ]
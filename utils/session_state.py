@@ -0,0 +1,254 @@
+"""上限付き・メモリ計測付きのセッション状態
+
+Streamlitのst.session_stateはセッションが続く限り解放されないため、カテゴリの辞書・
+ブログネタのMarkdown・要約をそのまま持たせると、同時接続数に比例してメモリが増える。
+ここではセッションごとの状態を__slots__のレコードにまとめ、カテゴリ一覧は同じ内容を
+全セッションで共有（インターン）し、本文は圧縮して保持する。
+セッション数の上限とアイドル時間で古いセッションを追い出し、保持しているバイト数を集計する。
+追い出されたセッションは、次のアクセス時に履歴ストア（history_store.py）から復元する。
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+
+class CategorySet:
+    """技術分野の一覧（不変、同じ内容のものは全セッションで1つを共有する）"""
+
+    __slots__ = ("key", "items", "__weakref__")
+
+    def __init__(self, key: str, categories: Dict[str, Any]):
+        self.key = key
+        # (分野名, キーワードのタプル, 絵文字) のタプル
+        self.items = tuple(
+            (
+                sys.intern(name),
+                tuple(sys.intern(str(keyword)) for keyword in info.get("keywords", [name])),
+                sys.intern(info.get("emoji", "🔍")),
+            )
+            for name, info in categories.items()
+        )
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: {"keywords": list(keywords), "emoji": emoji} for name, keywords, emoji in self.items}
+
+    def nbytes(self) -> int:
+        size = sys.getsizeof(self.items)
+        for name, keywords, emoji in self.items:
+            size += sys.getsizeof(name) + sys.getsizeof(keywords) + sys.getsizeof(emoji)
+            size += sum(sys.getsizeof(keyword) for keyword in keywords)
+        return size
+
+
+_category_sets: "weakref.WeakValueDictionary[str, CategorySet]" = weakref.WeakValueDictionary()
+_category_lock = threading.Lock()
+
+
+def intern_categories(categories: Dict[str, Any]) -> CategorySet:
+    """同じ内容の一覧がすでにあればそれを返す（どのセッションからも参照されなくなると解放される）"""
+    # 内容のハッシュをキーにする（JSON文字列そのものを保持しないため）
+    key = hashlib.blake2b(
+        json.dumps(categories, ensure_ascii=False, sort_keys=True).encode("utf-8"), digest_size=16
+    ).hexdigest()
+    with _category_lock:
+        category_set = _category_sets.get(key)
+        if category_set is None:
+            category_set = CategorySet(key, categories)
+            _category_sets[key] = category_set
+        return category_set
+
+
+def _compress(text: Optional[str]) -> Optional[bytes]:
+    return zlib.compress(text.encode("utf-8"), 6) if text is not None else None
+
+
+def _decompress(blob: Optional[bytes]) -> Optional[str]:
+    return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+
+
+class SessionRecord:
+    """1セッション分の状態"""
+
+    __slots__ = (
+        "session_id", "category_set", "custom_categories", "selected_category",
+        "trace_id", "_response", "_summary", "last_seen", "max_custom_categories",
+    )
+
+    def __init__(self, session_id: str, max_custom_categories: int = 8):
+        self.session_id = session_id
+        self.category_set: Optional[CategorySet] = None
+        # 自由入力の分野（上限を超えたら古いものから削除）
+        self.custom_categories: "OrderedDict[str, Tuple[tuple, str]]" = OrderedDict()
+        self.selected_category: Optional[str] = None
+        self.trace_id: Optional[str] = None
+        self._response: Optional[bytes] = None
+        self._summary: Optional[bytes] = None
+        self.last_seen = time.monotonic()
+        self.max_custom_categories = max_custom_categories
+
+    @property
+    def categories(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """生成された分野と自由入力の分野を合わせた辞書（未生成ならNone、自由入力の分野は"custom"がTrue）"""
+        if self.category_set is None and not self.custom_categories:
+            return None
+        categories = self.category_set.as_dict() if self.category_set else {}
+        for name, (keywords, emoji) in self.custom_categories.items():
+            categories.setdefault(name, {"keywords": list(keywords), "emoji": emoji, "custom": True})
+        return categories
+
+    def set_categories(self, categories: Optional[Dict[str, Any]]) -> None:
+        """分野の一覧を置き換える（自由入力の分野もクリアする）"""
+        self.category_set = intern_categories(categories) if categories else None
+        self.custom_categories.clear()
+
+    def restore_categories(self, categories: Optional[Dict[str, Any]]) -> None:
+        """
+        履歴から分野の一覧を復元する
+
+        自由入力の分野をset_categoriesに渡すと共有の一覧に混ざるため、分けて設定する。
+        """
+        categories = categories or {}
+        self.set_categories({name: info for name, info in categories.items() if not info.get("custom")})
+        for name, info in categories.items():
+            if info.get("custom"):
+                self.add_custom_category(name, info.get("keywords", [name]), info.get("emoji", "🔍"))
+
+    def add_custom_category(self, name: str, keywords: list, emoji: str = "🔍") -> None:
+        """自由入力の分野を追加"""
+        self.custom_categories[name] = (tuple(keywords), emoji)
+        self.custom_categories.move_to_end(name)
+        while len(self.custom_categories) > self.max_custom_categories:
+            # 選択中の分野は残し、それ以外の古いものから削除（上限が0でも選択中の分野は残す）
+            oldest = next((existing for existing in self.custom_categories if existing != self.selected_category), None)
+            if oldest is None:
+                break
+            del self.custom_categories[oldest]
+
+    @property
+    def response(self) -> Optional[str]:
+        return _decompress(self._response)
+
+    @response.setter
+    def response(self, text: Optional[str]) -> None:
+        self._response = _compress(text)
+
+    @property
+    def summary(self) -> Optional[str]:
+        return _decompress(self._summary)
+
+    @summary.setter
+    def summary(self, text: Optional[str]) -> None:
+        self._summary = _compress(text)
+
+    def nbytes(self) -> int:
+        """このセッションが個別に保持しているバイト数（共有のカテゴリ一覧は含めない）"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.custom_categories)
+        for name, (keywords, emoji) in self.custom_categories.items():
+            size += sys.getsizeof(name) + sys.getsizeof(keywords) + sum(sys.getsizeof(k) for k in keywords)
+        for value in (self.session_id, self.selected_category, self.trace_id, self._response, self._summary):
+            if value is not None:
+                size += sys.getsizeof(value)
+        return size
+
+
+class SessionRegistry:
+    """
+    プロセス内の全セッションの状態（セッション数の上限とアイドル時間による追い出し付き）
+
+    Args:
+        max_sessions: 保持するセッション数の上限（超えたら最も長くアクセスのないものから追い出す）
+        idle_seconds: この秒数アクセスのないセッションを追い出す
+        max_custom_categories: セッションごとの自由入力の分野の上限
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_seconds: float = 1800, max_custom_categories: int = 8):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_custom_categories = max_custom_categories
+        self._sessions: "OrderedDict[str, SessionRecord]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._stats = {"created": 0, "evicted_idle": 0, "evicted_capacity": 0}
+
+    def get_or_create(self, session_id: str) -> Tuple[SessionRecord, bool]:
+        """
+        セッションの状態を取得（なければ作成）
+
+        Returns:
+            (状態, 新規作成したか) のタプル。新規の場合は呼び出し元で履歴から復元する
+        """
+        now = time.monotonic()
+        swept = False
+        with self._lock:
+            if now - self._last_sweep > min(self.idle_seconds, 60):
+                self._evict_idle(now)
+                swept = True
+            record = self._sessions.get(session_id)
+            created = record is None
+            if created:
+                record = SessionRecord(session_id, self.max_custom_categories)
+                self._sessions[session_id] = record
+                self._stats["created"] += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._stats["evicted_capacity"] += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            record.last_seen = now
+        if swept:
+            stats = self.get_stats()
+            print(f"セッション状態: {stats['sessions']}件, {stats['total_bytes']}バイト"
+                  f"（アイドルで追い出し {stats['evicted_idle']}件, 上限で追い出し {stats['evicted_capacity']}件）")
+        return record, created
+
+    def _evict_idle(self, now: float) -> None:
+        """アイドル時間を超えたセッションを追い出す（呼び出し元で_lockを保持していること）"""
+        self._last_sweep = now
+        while self._sessions:
+            session_id, record = next(iter(self._sessions.items()))
+            if now - record.last_seen <= self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            self._stats["evicted_idle"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """セッション数と保持しているバイト数"""
+        with self._lock:
+            records = list(self._sessions.values())
+            stats = dict(self._stats)
+        category_sets = {id(record.category_set): record.category_set for record in records if record.category_set}
+        session_bytes = sum(record.nbytes() for record in records)
+        shared_bytes = sum(category_set.nbytes() for category_set in category_sets.values())
+        return {
+            "sessions": len(records),
+            "shared_category_sets": len(category_sets),
+            "session_bytes": session_bytes,
+            "shared_bytes": shared_bytes,
+            "total_bytes": session_bytes + shared_bytes,
+            **stats,
+        }
+
+
+_registry: Optional[SessionRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_session_registry() -> SessionRegistry:
+    """プロセス内で共有するセッションレジストリを取得"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SessionRegistry(
+                max_sessions=int(os.getenv("SESSION_MAX_COUNT", "1000")),
+                idle_seconds=float(os.getenv("SESSION_IDLE_SECONDS", "1800")),
+                max_custom_categories=int(os.getenv("SESSION_MAX_CUSTOM_CATEGORIES", "8"))
+            )
+        return _registry
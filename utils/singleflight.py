@@ -0,0 +1,178 @@
+"""同一リクエストの同時実行をまとめる（シングルフライト）"""
+
+import asyncio
+import copy
+import functools
+import inspect
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Hashable, Awaitable, TypeVar
+
+from .request_context import RequestCancelled
+
+T = TypeVar("T")
+
+
+class _LeaderCancelled(Exception):
+    """先に実行していた呼び出しがキャンセルされた（合流した呼び出しは実行し直す）"""
+
+
+class SingleFlight:
+    """
+    同じキーの呼び出しが実行中であれば、新たに実行せずその結果を共有する
+
+    スレッドからの呼び出し（do）とコルーチンからの呼び出し（do_async）は
+    同じ実行中リクエストの表を使うため、どちらから呼ばれても1回にまとまる。
+    結果はキャッシュせず、実行が終わった時点で表から取り除く。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0, "leader_cancelled": 0}
+
+    def _join(self, key: Hashable, retry: bool = False) -> tuple:
+        """実行中のFutureに合流するか、新しく作成する（戻り値: (Future, 自分が実行するか)）"""
+        with self._lock:
+            if not retry:
+                self._stats["calls"] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                if not retry:
+                    self._stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self._stats["executions"] += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: BaseException | None = None) -> None:
+        if error is not None and (not isinstance(error, Exception) or isinstance(error, RequestCancelled)):
+            # 実行した呼び出し自身のキャンセル（画面の移動・切断など）は、合流した他のリクエストには伝えず、
+            # そのうちの1つに実行し直させる
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._stats["leader_cancelled"] += 1
+            future.set_exception(_LeaderCancelled())
+            return
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is not None:
+                self._stats["errors"] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        funcを実行する（同じキーが実行中ならその結果を待つ）
+
+        Args:
+            key: 同一リクエストを識別するキー
+            func: 実行する関数
+
+        Returns:
+            funcの結果（合流した呼び出しには複製を返す）
+        """
+        future, leader = self._join(key)
+        while not leader:
+            try:
+                return copy.deepcopy(future.result())
+            except _LeaderCancelled:
+                future, leader = self._join(key, retry=True)
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: Hashable, func: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """
+        コルーチン関数を実行する（同じキーが実行中ならその結果を待つ）
+
+        Args:
+            key: 同一リクエストを識別するキー
+            func: 実行するコルーチン関数
+
+        Returns:
+            funcの結果（合流した呼び出しには複製を返す）
+        """
+        future, leader = self._join(key)
+        while not leader:
+            try:
+                result = await asyncio.wrap_future(future)
+                return copy.deepcopy(result)
+            except _LeaderCancelled:
+                future, leader = self._join(key, retry=True)
+
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """統計情報を取得（coalescedが同時実行をまとめた件数）"""
+        with self._lock:
+            return {"name": self.name, "inflight": len(self._inflight), **self._stats}
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name: str) -> SingleFlight:
+    """名前付きのSingleFlightを取得（なければ作成）"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def get_coalescing_stats() -> Dict[str, Dict[str, Any]]:
+    """全グループの統計情報を取得"""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.get_stats() for group in groups}
+
+
+def coalesce(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """
+    関数の同時実行をまとめるデコレータ
+
+    引数が同じ呼び出しを同一リクエストとみなす。
+    コルーチン関数にも同期関数にも使用できる。
+
+    Args:
+        name: 統計情報に表示するグループ名
+    """
+    group = get_group(name)
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def make_key(args, kwargs):
+            # デフォルト引数を補完して、f("x") と f("x", 10) を同じキーにする
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return tuple(bound.arguments.items())
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await group.do_async(make_key(args, kwargs), func, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return group.do(make_key(args, kwargs), func, *args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,460 @@
+"""表示中の技術分野のブログネタを先回りして準備する（投機的実行）
+
+カテゴリを表示した後、ユーザーはほぼ必ず8つのボタンのどれかを押すが、生成はクリックまで
+始まらず、その後20秒以上待たせている。ここではカテゴリを表示した時点で、予算の範囲内で
+バックグラウンドの準備を始める。
+
+- search: 各分野の関連キーワードでQiitaを検索し、ローカルインデックスとAPIの取得をウォームにする
+  （クリック後のエージェントの検索は、実行中ならシングルフライトで合流し、完了済みならローカルで返る）
+- full: 先頭の数分野についてブログネタの生成まで済ませておく
+  （クリックした分野の生成が実行中・完了済みなら、それまでの出力を再生してから続きを受け取る）
+
+クリックの時点で準備が完了していたか・実行中だったか・なかったかを数え、
+命中率と使い捨てになった準備の数から、先回りの費用に見合っているかを判断できるようにする。
+"""
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from .request_context import RequestCancelled, RequestContext
+
+MODES = ("off", "search", "full")
+
+
+class _Budget:
+    """直近1時間に実行できる回数の上限"""
+
+    def __init__(self, per_hour: int):
+        self.per_hour = per_hour
+        self._times: deque = deque()
+
+    def take(self, count: int = 1) -> bool:
+        """count回分の予算があれば消費してTrue（呼び出し側でロックを保持していること）"""
+        now = time.monotonic()
+        while self._times and now - self._times[0] > 3600:
+            self._times.popleft()
+        if len(self._times) + count > self.per_hour:
+            return False
+        self._times.extend([now] * count)
+        return True
+
+    def remaining(self) -> int:
+        now = time.monotonic()
+        return max(self.per_hour - sum(1 for t in self._times if now - t <= 3600), 0)
+
+
+class SpeculativeRun:
+    """
+    先回りで実行しているブログネタの生成（1セッション・1分野）
+
+    出力はイベントの列として保持し、クリック後の表示は先頭から再生してから続きを待つ。
+    イベントは ("delta", テキスト) と ("tool", ツール名) の2種類。
+    """
+
+    def __init__(self, session_id: str, category: str, keywords: list):
+        self.session_id = session_id
+        self.category = category
+        self.keywords = list(keywords)
+        self.trace_id = str(uuid.uuid4())
+        # 締め切りとキャンセル状態は実行を始めるときに作る（見送った生成をキャンセルの統計に数えないため）
+        self.context: Optional[RequestContext] = None
+        self.cancel_reason: Optional[str] = None
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.response: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.claimed = False
+        self.started = False
+        self._events: List[Tuple[str, str]] = []
+        self._condition = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def emit(self, event: str, data: str) -> None:
+        with self._condition:
+            self._events.append((event, data))
+            self._condition.notify_all()
+
+    def finish(self, response: Optional[str] = None, error: Optional[BaseException] = None) -> None:
+        with self._condition:
+            self.response = response
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._condition.notify_all()
+
+    def start(self) -> Optional[RequestContext]:
+        """実行を始め、締め切りとキャンセル状態を作る（始める前に取り消されていればNone）"""
+        with self._condition:
+            if self.cancel_reason is not None:
+                return None
+            self.context = RequestContext()
+            self.started = True
+            return self.context
+
+    def cancel(self, reason: str) -> None:
+        with self._condition:
+            context = self.context
+            if context is None:
+                # まだ始まっていない場合は、始めないように理由だけ残す
+                self.cancel_reason = self.cancel_reason or reason
+                return
+        context.cancel(reason)
+
+    @property
+    def stopped_early(self) -> bool:
+        """必要な数のブログネタがそろって生成を打ち切ったか"""
+        return self.context is not None and self.context.reason == "completed_early"
+
+    def _next(self, index: int, timeout: Optional[float]) -> Tuple[Optional[Tuple[str, str]], bool]:
+        """index番目のイベントを待つ（戻り値: (イベントまたはNone, 終了したか)）"""
+        with self._condition:
+            if index >= len(self._events) and not self.done:
+                self._condition.wait(timeout)
+            if index < len(self._events):
+                return self._events[index], False
+            return None, self.done
+
+    def follow(self) -> Iterator[Tuple[str, str]]:
+        """
+        これまでのイベントを再生し、生成が終わるまで続きを返す（スレッド用）
+
+        Raises:
+            生成が失敗した場合はその例外
+        """
+        index = 0
+        while True:
+            event, finished = self._next(index, timeout=0.5)
+            if event is not None:
+                index += 1
+                yield event
+            elif finished:
+                break
+        if self.error is not None:
+            raise self.error
+
+    async def follow_async(self):
+        """followのasyncio版（イベントループをブロックしないよう短い間隔で確認する）"""
+        index = 0
+        while True:
+            event, finished = self._next(index, timeout=0)
+            if event is not None:
+                index += 1
+                yield event
+            elif finished:
+                break
+            else:
+                await asyncio.sleep(0.05)
+        if self.error is not None:
+            raise self.error
+
+
+class Speculator:
+    """
+    表示中の技術分野の準備を管理し、クリックを準備済みの結果に結びつける
+
+    Args:
+        mode: "off"（何もしない）・"search"（検索のみ）・"full"（生成まで）
+        max_full_categories: 1回のカテゴリ表示で生成まで済ませる分野の数（表示順の先頭から）
+        searches_per_hour: 検索のウォームに使える、直近1時間の分野数の上限
+        runs_per_hour: 先回りの生成に使える、直近1時間の実行数の上限
+        ttl: 完了した準備を保持する秒数
+        admission: 先回りの生成が使うアドミッション制御器（省略時はプロセス内で共有するもの）
+    """
+
+    def __init__(
+        self,
+        mode: str = "off",
+        max_full_categories: int = 2,
+        searches_per_hour: int = 200,
+        runs_per_hour: int = 20,
+        ttl: float = 600.0,
+        admission=None,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}: {mode}")
+        self.mode = mode
+        self.max_full_categories = max_full_categories
+        self.ttl = ttl
+        self.admission = admission
+        self._search_budget = _Budget(searches_per_hour)
+        self._run_budget = _Budget(runs_per_hour)
+        # セッションID → {分野名: 準備の状態}
+        self._warmed: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._runs: Dict[str, Dict[str, SpeculativeRun]] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "categories_shown": 0,
+            "searches_warmed": 0,
+            "runs_started": 0,
+            "runs_completed": 0,
+            "runs_failed": 0,
+            "runs_wasted": 0,
+            "runs_preempted": 0,
+            "skipped_budget": 0,
+            "skipped_busy": 0,
+            "clicks": 0,
+            "hits": 0,
+            "partial_hits": 0,
+            "misses": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def speculate(self, session_id: str, categories: Dict[str, Dict[str, Any]]) -> None:
+        """
+        表示した技術分野の準備を始める（以前に表示した分野の準備は取り消す）
+
+        Args:
+            session_id: セッションID
+            categories: 表示した技術分野（generate_tech_categoriesと同じ形式）
+        """
+        if not self.enabled or not categories:
+            return
+        with self._lock:
+            self._discard(session_id)
+            self._expire()
+            self._stats["categories_shown"] += 1
+            warm_targets = []
+            for category, info in categories.items():
+                if not self._search_budget.take():
+                    self._stats["skipped_budget"] += 1
+                    break
+                self._warmed.setdefault(session_id, {})[category] = {"done": False, "finished_at": None}
+                warm_targets.append((category, info.get("keywords") or [category]))
+            run_targets = []
+            if self.mode == "full":
+                for category, info in list(categories.items())[:self.max_full_categories]:
+                    if not self._run_budget.take():
+                        self._stats["skipped_budget"] += 1
+                        break
+                    run = SpeculativeRun(session_id, category, info.get("keywords") or [category])
+                    self._runs.setdefault(session_id, {})[category] = run
+                    run_targets.append(run)
+
+        if warm_targets:
+            threading.Thread(
+                target=self._warm_searches, args=(session_id, warm_targets),
+                daemon=True, name="speculative-search"
+            ).start()
+        for run in run_targets:
+            threading.Thread(target=self._run, args=(run,), daemon=True, name="speculative-run").start()
+
+    def _warm_searches(self, session_id: str, targets: List[Tuple[str, list]]) -> None:
+        """各分野の関連キーワードでQiitaを検索しておく（結果はキャッシュとローカルインデックスに残る）"""
+        from .search_tools import qiita_multi_search
+        for category, keywords in targets:
+            try:
+                qiita_multi_search(keywords)
+            except Exception as e:
+                print(f"先回りの検索に失敗しました（{category}）: {str(e)}")
+            with self._lock:
+                state = self._warmed.get(session_id, {}).get(category)
+                if state is not None:
+                    state.update(done=True, finished_at=time.monotonic())
+                    self._stats["searches_warmed"] += 1
+
+    def _run(self, run: SpeculativeRun) -> None:
+        """ブログネタの生成を先回りで実行する（実行中のユーザーのリクエストがあれば譲る）"""
+        from .admission import AdmissionRejected, get_admission_controller
+        from .agent_setup import create_blog_suggester_agent
+        from .idea_generator import generate_blog_ideas
+
+        admission = self.admission or get_admission_controller()
+
+        def skip_busy():
+            with self._lock:
+                self._stats["skipped_busy"] += 1
+            run.finish(error=RequestCancelled("混雑中のため先回りの生成を見送りました"))
+
+        stats = admission.get_stats()
+        if stats["queued"] > 0 or stats["in_flight"] >= int(stats["limit"]) - 1:
+            # 混雑中は先回りしない（ユーザーのリクエストのために実行枠を1つ以上空けておく）
+            skip_busy()
+            return
+        try:
+            ticket = admission.enqueue(f"speculative:{run.session_id}")
+        except AdmissionRejected:
+            skip_busy()
+            return
+        if not ticket.granted:
+            # 確認の後に実行枠が埋まった場合も、キューに並んでユーザーのリクエストの前に入らない
+            admission.release(ticket)
+            skip_busy()
+            return
+
+        sent = 0
+
+        def on_text(full_response: str):
+            nonlocal sent
+            run.emit("delta", full_response[sent:])
+            sent = len(full_response)
+
+        def on_tool(tool_name: str):
+            run.emit("tool", tool_name)
+
+        context = run.start()
+        if context is None:
+            admission.release(ticket)
+            run.finish(error=RequestCancelled(f"先回りの生成は始める前に取り消されました（{run.cancel_reason}）"))
+            return
+        with self._lock:
+            self._stats["runs_started"] += 1
+        threading.Thread(
+            target=self._yield_to_requests, args=(run, admission),
+            daemon=True, name="speculative-watch"
+        ).start()
+        try:
+            agent = create_blog_suggester_agent(
+                session_id=run.session_id,
+                tags=["blog-idea-generation", "speculative", run.category],
+                trace_id=run.trace_id,
+                context=context
+            )
+            response = asyncio.run(generate_blog_ideas(
+                agent, run.category, run.keywords,
+                on_text=on_text, on_tool=on_tool, context=context
+            ))
+            run.finish(response=response)
+            with self._lock:
+                self._stats["runs_completed"] += 1
+        except RequestCancelled as e:
+            run.finish(error=e)
+        except Exception as e:
+            print(f"先回りの生成に失敗しました（{run.category}）: {str(e)}")
+            run.finish(error=e)
+            with self._lock:
+                self._stats["runs_failed"] += 1
+        finally:
+            admission.release(ticket)
+
+    def _yield_to_requests(self, run: SpeculativeRun, admission, interval: float = 0.2) -> None:
+        """ユーザーのリクエストが実行枠を待ち始めたら、まだ受け取られていない先回りの生成を取り消す"""
+        while not run.done:
+            with self._lock:
+                if run.claimed:
+                    # クリックで受け取られた生成はユーザーのリクエストとして最後まで続ける
+                    return
+                if admission.get_stats()["queued"] > 0:
+                    run.cancel("speculation_preempted")
+                    self._stats["runs_preempted"] += 1
+                    return
+            time.sleep(interval)
+
+    def claim(self, session_id: str, category: str) -> Optional[SpeculativeRun]:
+        """
+        クリックした分野の準備を受け取る（同じセッションのほかの分野の実行中の生成は取り消す）
+
+        Returns:
+            実行中または完了済みの先回りの生成（なければNone。searchモードでは常にNone）
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            run = self._runs.get(session_id, {}).get(category)
+            if run is not None and run.done and run.error is not None:
+                # 失敗・見送りになった生成は使わない（通常どおり生成する）
+                run = None
+            first_click = run is None or not run.claimed
+            if first_click:
+                self._stats["clicks"] += 1
+                warmed = self._warmed.get(session_id, {}).get(category)
+                if run is not None:
+                    outcome = "hits" if run.done else "partial_hits"
+                elif warmed is not None:
+                    outcome = "hits" if warmed["done"] else "partial_hits"
+                else:
+                    outcome = "misses"
+                self._stats[outcome] += 1
+                print(f"先回りの準備（{category}）: {outcome}（命中率 {self._stats['hits'] / self._stats['clicks']:.0%}）")
+            for other, other_run in self._runs.get(session_id, {}).items():
+                if other != category and not other_run.claimed and not other_run.done:
+                    other_run.cancel("speculation_discarded")
+            if run is not None:
+                run.claimed = True
+            return run
+
+    def _discard(self, session_id: str) -> None:
+        """セッションの準備をすべて取り消す（_lockを保持していること）"""
+        self._warmed.pop(session_id, None)
+        for run in self._runs.pop(session_id, {}).values():
+            if not run.claimed:
+                if run.started:
+                    self._stats["runs_wasted"] += 1
+                run.cancel("speculation_discarded")
+
+    def _expire(self) -> None:
+        """保持期間を過ぎた準備を捨てる（_lockを保持していること）"""
+        now = time.monotonic()
+        for session_id in list(self._runs):
+            runs = self._runs[session_id]
+            for category, run in list(runs.items()):
+                if run.done and now - run.finished_at > self.ttl:
+                    if run.started and not run.claimed:
+                        self._stats["runs_wasted"] += 1
+                    del runs[category]
+            if not runs:
+                del self._runs[session_id]
+        for session_id in list(self._warmed):
+            warmed = self._warmed[session_id]
+            for category, state in list(warmed.items()):
+                if state["done"] and now - state["finished_at"] > self.ttl:
+                    del warmed[category]
+            if not warmed:
+                del self._warmed[session_id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中率と先回りに使った数（監視・デバッグ用）"""
+        with self._lock:
+            stats = dict(self._stats)
+            active = sum(1 for runs in self._runs.values() for run in runs.values() if not run.done)
+            search_remaining = self._search_budget.remaining()
+            run_remaining = self._run_budget.remaining()
+        clicks = stats["clicks"]
+        return {
+            "mode": self.mode,
+            "hit_rate": round(stats["hits"] / clicks, 3) if clicks else None,
+            # 実行中の準備に合流できたクリックも含めた割合
+            "attach_rate": round((stats["hits"] + stats["partial_hits"]) / clicks, 3) if clicks else None,
+            "active_runs": active,
+            "search_budget_remaining": search_remaining,
+            "run_budget_remaining": run_remaining,
+            **stats,
+        }
+
+
+def create_speculator(admission=None) -> Speculator:
+    """環境変数の設定で投機的実行の管理を作成（SPECULATION_MODEが未設定なら何もしない）"""
+    mode = os.getenv("SPECULATION_MODE", "off").lower()
+    if mode not in MODES:
+        print(f"SPECULATION_MODEの値が不正です（{mode}）。先回りの準備は無効にします")
+        mode = "off"
+    return Speculator(
+        mode=mode,
+        max_full_categories=int(os.getenv("SPECULATION_MAX_FULL_CATEGORIES", "2")),
+        searches_per_hour=int(os.getenv("SPECULATION_SEARCHES_PER_HOUR", "200")),
+        runs_per_hour=int(os.getenv("SPECULATION_RUNS_PER_HOUR", "20")),
+        ttl=float(os.getenv("SPECULATION_TTL_SECONDS", "600")),
+        admission=admission
+    )
+
+
+_speculator: Optional[Speculator] = None
+_speculator_lock = threading.Lock()
+
+
+def get_speculator() -> Speculator:
+    """プロセス内で共有する投機的実行の管理を取得"""
+    global _speculator
+    with _speculator_lock:
+        if _speculator is None:
+            _speculator = create_speculator()
+        return _speculator
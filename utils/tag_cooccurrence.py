@@ -0,0 +1,256 @@
+"""Qiitaのタグ共起から、自由入力の技術分野に関連するキーワードを推定する
+
+自由入力のカテゴリはキーワードがカテゴリ名だけになり、エージェントが関連語を
+探すための検索を余分に行うことになる。取得済みのQiita記事からタグの共起行列
+（疎行列）を作っておき、入力に一致するタグ・タイトルを起点に、よく一緒に
+付けられるタグをミリ秒単位で返す（LLMや検索APIを呼ばない）。
+"""
+
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Iterable, Optional
+
+# 日本語と英語の表記ゆれ（正規化後のキー同士の対応）
+ALIASES = {
+    "機械学習": ["machinelearning", "ml"],
+    "深層学習": ["deeplearning"],
+    "ディープラーニング": ["deeplearning"],
+    "生成ai": ["generativeai", "genai"],
+    "人工知能": ["ai"],
+    "自然言語処理": ["nlp"],
+    "画像認識": ["computervision"],
+    "コンテナ": ["docker", "container"],
+    "量子コンピュータ": ["quantumcomputing"],
+    "量子コンピューティング": ["quantumcomputing", "量子コンピュータ"],
+    "フロントエンド": ["frontend"],
+    "バックエンド": ["backend"],
+    "セキュリティ": ["security"],
+    "データベース": ["database"],
+    "テスト": ["test", "testing"],
+    "インフラ": ["infrastructure"],
+    "クラウド": ["cloud"],
+    "ウェブアセンブリ": ["webassembly", "wasm"],
+    "kubernetes": ["k8s"],
+}
+
+
+def _build_alias_lookup(aliases: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """表記ゆれの対応を双方向にする（"machinelearning" → "機械学習" も引けるように）"""
+    lookup: Dict[str, List[str]] = defaultdict(list)
+    for key, variants in aliases.items():
+        group = [key] + variants
+        for name in group:
+            lookup[name].extend(other for other in group if other != name and other not in lookup[name])
+    return dict(lookup)
+
+
+_ALIAS_LOOKUP = _build_alias_lookup(ALIASES)
+
+
+def normalize(text: str) -> str:
+    """比較用のキー（全角半角・大文字小文字・記号の違いを吸収）"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return re.sub(r"[\s\.\-_/・]+", "", text)
+
+
+def _spaced(text: str) -> str:
+    """normalizeと同じ正規化で、区切り記号を空白として残したもの（語の境界を調べるため）"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return re.sub(r"[\s\.\-_/・]+", " ", text).strip()
+
+
+def _contains_token(text: str, part: str) -> bool:
+    """
+    textにpartが含まれるか（partの端が英数字の場合、英数字の語の途中には一致しない）
+
+    "go"が"django"に、"ai"が"rails"に一致しないようにする。日本語の語は区切りがないため部分一致のまま。
+    """
+    if part not in text:
+        return False
+    start = r"(?<![0-9a-z])" if part[0].isascii() and part[0].isalnum() else ""
+    end = r"(?![0-9a-z])" if part[-1].isascii() and part[-1].isalnum() else ""
+    return re.search(start + re.escape(part) + end, text) is not None
+
+
+def _article_tags(article: Dict[str, Any]) -> List[str]:
+    """APIの生の記事（[{"name": ...}]）と整形済みの記事（[str]）の両方に対応"""
+    tags = []
+    for tag in article.get("tags", []):
+        name = tag.get("name", "") if isinstance(tag, dict) else tag
+        if name:
+            tags.append(name)
+    return tags
+
+
+class TagCooccurrenceModel:
+    """タグの出現回数と共起回数を持つ疎な共起モデル"""
+
+    def __init__(self, articles: Iterable[Dict[str, Any]], max_titles: int = 20000):
+        self.tag_freq: Counter = Counter()
+        self.cooccurrence: Dict[str, Counter] = defaultdict(Counter)
+        self.display: Dict[str, str] = {}
+        # タイトルに入力語を含む記事のタグも起点にする（タグ名にない日本語表記への対応）
+        self.titles: List[tuple] = []
+
+        for article in articles:
+            keys = []
+            for name in _article_tags(article):
+                key = normalize(name)
+                if key and key not in keys:
+                    keys.append(key)
+                    self.display.setdefault(key, name)
+            for key in keys:
+                self.tag_freq[key] += 1
+                for other in keys:
+                    if other != key:
+                        self.cooccurrence[key][other] += 1
+            title = article.get("title", "")
+            if title and keys and len(self.titles) < max_titles:
+                self.titles.append((normalize(title), keys))
+
+    def __len__(self) -> int:
+        return len(self.tag_freq)
+
+    def _seed_tags(self, text: str) -> Dict[str, float]:
+        """入力に対応するタグと重みを求める"""
+        key = normalize(text)
+        if not key:
+            return {}
+        keys = [key] + _ALIAS_LOOKUP.get(key, [])
+        seeds: Dict[str, float] = {}
+
+        for candidate in keys:
+            if candidate in self.tag_freq:
+                seeds[candidate] = 1.0
+        if not seeds:
+            # 部分一致（"aws lambda" → "lambda" など）は重みを下げる。入力に含まれるタグは語の境界で区切られたものだけ
+            texts = [_spaced(text)] + keys[1:]
+            for tag in self.tag_freq:
+                if len(tag) >= 2 and (
+                    any(_contains_token(candidate, tag) for candidate in texts)
+                    or any(len(candidate) >= 3 and candidate in tag for candidate in keys)
+                ):
+                    seeds[tag] = max(seeds.get(tag, 0.0), 0.5)
+
+        # タイトルに入力語を含む記事のタグ（英数字だけの2文字の語は"go"→"django"のように語の途中に一致しやすいため除く）
+        title_keys = [candidate for candidate in keys if len(candidate) >= 3 or (len(candidate) == 2 and not candidate.isascii())]
+        title_hits: Counter = Counter()
+        matched = 0
+        for title, tags in self.titles:
+            if any(candidate in title for candidate in title_keys):
+                matched += 1
+                title_hits.update(tags)
+        for tag, count in title_hits.items():
+            seeds[tag] = max(seeds.get(tag, 0.0), 0.5 * count / matched)
+        return seeds
+
+    def related(self, text: str, top_k: int = 6) -> List[str]:
+        """
+        入力に関連するタグを関連度順に返す
+
+        Args:
+            text: 自由入力の技術分野
+            top_k: 返すタグの最大数
+
+        Returns:
+            タグ名（Qiitaでの表記）のリスト（入力と同じ表記のタグは除く）
+        """
+        seeds = self._seed_tags(text)
+        if not seeds:
+            return []
+
+        scores: Counter = Counter()
+        for seed, weight in seeds.items():
+            scores[seed] += weight
+            seed_freq = self.tag_freq[seed]
+            for other, count in self.cooccurrence.get(seed, {}).items():
+                # コサイン類似度で、どの記事にも付く汎用タグの影響を抑える
+                scores[other] += weight * count / math.sqrt(seed_freq * self.tag_freq[other])
+
+        input_key = normalize(text)
+        return [
+            self.display[tag]
+            for tag, _ in scores.most_common()
+            if tag != input_key
+        ][:top_k]
+
+
+def load_articles() -> List[Dict[str, Any]]:
+    """共起モデルの元になる記事（ローカルインデックスの記事と人気記事）を集める"""
+    articles: List[Dict[str, Any]] = []
+    from .qiita_index import get_qiita_index
+    index = get_qiita_index()
+    if index is not None:
+        articles.extend(index.all_articles())
+    if len(articles) < 100:
+        # インデックスが育つまでは人気記事で補う
+        from .qiita_trends import get_qiita_popular_articles
+        articles.extend(get_qiita_popular_articles(page=1, per_page=100))
+    return articles
+
+
+_EMPTY_MODEL = TagCooccurrenceModel([])
+_model: Optional[TagCooccurrenceModel] = None
+_next_build_at = 0.0
+_building = False
+_model_lock = threading.Lock()
+
+# 記事を取得できず空のモデルになった場合に、作り直しを再試行するまでの秒数
+_RETRY_SECONDS = 60
+
+
+def _rebuild_model(max_age: float) -> None:
+    """共起モデルを作り直して差し替える（バックグラウンドのスレッドで実行）"""
+    global _model, _next_build_at, _building
+    try:
+        model = TagCooccurrenceModel(load_articles())
+    except Exception as e:
+        print(f"共起モデルの作成エラー: {str(e)}")
+        model = _EMPTY_MODEL
+    with _model_lock:
+        if len(model):
+            _model = model
+            _next_build_at = time.monotonic() + max_age
+        else:
+            # 取得に失敗した空のモデルは保存せず、前のモデルを使い続けて少し後に再試行する
+            print("共起モデルの元になる記事を取得できませんでした")
+            _next_build_at = time.monotonic() + _RETRY_SECONDS
+        _building = False
+
+
+def get_tag_model(max_age: float = 3600) -> TagCooccurrenceModel:
+    """
+    プロセス内で共有する共起モデルを取得（max_age秒ごとに作り直す）
+
+    作り直しはQiitaの取得を含むため、バックグラウンドのスレッドで行い、
+    その間は前のモデル（最初の作成中は空のモデル）を返す。
+    """
+    global _building
+    with _model_lock:
+        if not _building and time.monotonic() >= _next_build_at:
+            _building = True
+            threading.Thread(target=_rebuild_model, args=(max_age,), name="tag-model", daemon=True).start()
+        return _model or _EMPTY_MODEL
+
+
+def expand_keywords(category: str, top_k: int = 6) -> List[str]:
+    """
+    自由入力の技術分野を、関連するQiitaのタグでキーワード展開
+
+    Args:
+        category: 技術分野（自由入力）
+        top_k: 追加するキーワードの最大数
+
+    Returns:
+        先頭がカテゴリ名のキーワードリスト（失敗時はカテゴリ名のみ）
+    """
+    try:
+        related = get_tag_model().related(category, top_k=top_k)
+    except Exception as e:
+        print(f"キーワード展開エラー: {str(e)}")
+        related = []
+    return [category] + [tag for tag in related if normalize(tag) != normalize(category)]
@@ -0,0 +1,254 @@
+"""トレースのサンプリングと、上限付きのバッチエクスポート"""
+
+import os
+import threading
+from collections import deque, OrderedDict
+from typing import Dict, Any, Optional
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider, SpanProcessor, ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter
+from opentelemetry.trace import StatusCode
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """
+    "tag=rate,tag=rate" 形式のサンプリング率設定を解析
+
+    Args:
+        value: 例 "blog-idea-generation=0.05,tweet-summary=1"
+
+    Returns:
+        タグごとのサンプリング率の辞書
+    """
+    rates = {}
+    for item in value.split(","):
+        tag, _, rate = item.partition("=")
+        if tag.strip() and rate.strip():
+            rates[tag.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+class TagSamplingPolicy:
+    """
+    Langfuseのタグごとにサンプリング率を変えるポリシー
+
+    Strands Agentsはスパンの開始後にタグ（langfuse.tags）を設定するため、
+    Samplerの時点ではタグが分からない。そこでルートスパンの終了時に、
+    ルートスパンのタグとtrace_idから判定する（同じトレースは常に同じ判定になる）。
+    """
+
+    def __init__(self, rates: Dict[str, float], default_rate: float = 1.0):
+        self.rates = rates
+        self.default_rate = default_rate
+
+    def rate_for(self, tags: Any) -> float:
+        """タグの中で最も高いサンプリング率を返す（該当なしはデフォルト）"""
+        if isinstance(tags, str):
+            tags = [tags]
+        matched = [self.rates[tag] for tag in (tags or []) if tag in self.rates]
+        return max(matched) if matched else self.default_rate
+
+    def should_keep(self, trace_id: int, tags: Any) -> bool:
+        # trace_idの下位64ビットで判定
+        return (trace_id & 0xFFFFFFFFFFFFFFFF) < self.rate_for(tags) * (1 << 64)
+
+
+class BoundedBatchSpanProcessor(SpanProcessor):
+    """
+    サンプリングと上限付きキューを持つバッチスパンプロセッサー
+
+    スパンはルートスパンが終わるまでトレースごとに保留し、ルートの終了時に
+    TagSamplingPolicyで送信するかを決める（エラーを含むトレースは常に送信）。
+    on_endではリストに積むだけで、エクスポートはバックグラウンドスレッドで行う。
+    保留数・キューが上限に達した場合はスパンを捨ててカウントするため、
+    トレーシングがリクエスト処理を待たせたり、メモリを際限なく使ったりすることはない。
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        policy: TagSamplingPolicy,
+        max_queue_size: int = 2048,
+        max_export_batch_size: int = 256,
+        schedule_delay: float = 5.0,
+        max_pending_traces: int = 256,
+        max_spans_per_trace: int = 512,
+    ):
+        self.exporter = exporter
+        self.policy = policy
+        self.max_queue_size = max_queue_size
+        self.max_export_batch_size = max_export_batch_size
+        self.schedule_delay = schedule_delay
+        self.max_pending_traces = max_pending_traces
+        self.max_spans_per_trace = max_spans_per_trace
+
+        self._queue: deque = deque()
+        self._pending: "OrderedDict[int, list]" = OrderedDict()
+        self._errored: set = set()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._stats = {
+            "queued": 0,
+            "exported": 0,
+            "dropped_queue_full": 0,
+            "dropped_pending": 0,
+            "sampled_out": 0,
+            "kept_for_error": 0,
+            "export_failures": 0,
+        }
+        self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._worker.start()
+
+    def on_start(self, span, parent_context: Optional[Context] = None) -> None:
+        pass
+
+    def _enqueue(self, spans: list) -> None:
+        """キューに積む（呼び出し元で_conditionを保持していること）"""
+        for span in spans:
+            if len(self._queue) >= self.max_queue_size:
+                self._stats["dropped_queue_full"] += 1
+                continue
+            self._queue.append(span)
+            self._stats["queued"] += 1
+        if len(self._queue) >= self.max_export_batch_size:
+            self._condition.notify()
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if self._shutdown:
+            return
+        trace_id = span.get_span_context().trace_id
+        is_root = span.parent is None or not span.parent.is_valid
+
+        with self._condition:
+            if span.status.status_code == StatusCode.ERROR:
+                self._errored.add(trace_id)
+
+            pending = self._pending.get(trace_id)
+            if pending is None:
+                if len(self._pending) >= self.max_pending_traces:
+                    # 最も古い保留トレースを捨てる
+                    old_id, old_spans = self._pending.popitem(last=False)
+                    self._errored.discard(old_id)
+                    self._stats["dropped_pending"] += len(old_spans)
+                pending = self._pending[trace_id] = []
+            if len(pending) < self.max_spans_per_trace:
+                pending.append(span)
+            else:
+                self._stats["dropped_pending"] += 1
+
+            if not is_root:
+                return
+
+            spans = self._pending.pop(trace_id, [])
+            if trace_id in self._errored:
+                self._errored.discard(trace_id)
+                self._stats["kept_for_error"] += len(spans)
+                self._enqueue(spans)
+            elif self.policy.should_keep(trace_id, (span.attributes or {}).get("langfuse.tags")):
+                self._enqueue(spans)
+            else:
+                self._stats["sampled_out"] += len(spans)
+
+    def _take_batch(self) -> list:
+        batch = []
+        while self._queue and len(batch) < self.max_export_batch_size:
+            batch.append(self._queue.popleft())
+        return batch
+
+    def _export(self, batch: list) -> None:
+        try:
+            self.exporter.export(batch)
+            with self._condition:
+                self._stats["exported"] += len(batch)
+        except Exception as e:
+            with self._condition:
+                self._stats["export_failures"] += 1
+            print(f"トレースのエクスポートに失敗しました: {str(e)}")
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._shutdown and len(self._queue) < self.max_export_batch_size:
+                    self._condition.wait(self.schedule_delay)
+                batch = self._take_batch()
+                shutdown = self._shutdown
+            if batch:
+                self._export(batch)
+            if shutdown and not self._queue:
+                return
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        while True:
+            with self._condition:
+                batch = self._take_batch()
+            if not batch:
+                return True
+            self._export(batch)
+
+    def shutdown(self) -> None:
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify()
+        self._worker.join(timeout=10)
+        self.exporter.shutdown()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "queue_size": len(self._queue),
+                "pending_traces": len(self._pending),
+                **self._stats,
+            }
+
+
+_processor: Optional[BoundedBatchSpanProcessor] = None
+
+
+def install_sampled_tracer_provider(endpoint: str, headers: Dict[str, str]) -> BoundedBatchSpanProcessor:
+    """
+    サンプリングと上限付きバッチエクスポートを行うTracerProviderをグローバルに設定
+
+    Strands Agentsのトレーサーより先に設定することで、エージェントのスパンはすべて
+    このプロバイダーを通る（OpenTelemetryのグローバルプロバイダーは最初の設定のみ有効）。
+
+    Args:
+        endpoint: OTLP/HTTPのトレースエンドポイント
+        headers: エクスポート時のHTTPヘッダー
+
+    Returns:
+        設定したスパンプロセッサー（統計情報の取得用）
+    """
+    global _processor
+    if _processor is not None:
+        return _processor
+
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+    policy = TagSamplingPolicy(
+        rates=parse_sample_rates(os.getenv("TRACE_SAMPLE_RATES", "")),
+        default_rate=float(os.getenv("TRACE_SAMPLE_DEFAULT", "1.0"))
+    )
+    _processor = BoundedBatchSpanProcessor(
+        OTLPSpanExporter(endpoint=endpoint, headers=headers),
+        policy,
+        max_queue_size=int(os.getenv("TRACE_MAX_QUEUE", "2048")),
+        max_export_batch_size=int(os.getenv("TRACE_EXPORT_BATCH", "256")),
+        schedule_delay=float(os.getenv("TRACE_EXPORT_INTERVAL", "5.0"))
+    )
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "tech-blog-suggester"})
+    )
+    provider.add_span_processor(_processor)
+    trace.set_tracer_provider(provider)
+    return _processor
+
+
+def get_tracing_stats() -> Dict[str, Any]:
+    """エクスポートの統計情報（ドロップ数など）を取得"""
+    if _processor is None:
+        return {"enabled": False}
+    return {"enabled": True, **_processor.get_stats()}
@@ -0,0 +1,322 @@
+"""外部API呼び出しの記録と再生（性能の回帰テストを決まった入力でオフライン実行するため）
+
+Qiita・TavilyへのHTTP呼び出し、Google Custom Search、Bedrockのストリーミングを
+ここを経由して行う。TRANSPORT_MODEで動作を切り替える。
+
+- live（デフォルト）: そのまま呼び出す
+- record: 実際に呼び出し、応答とストリームの到着時刻をフィクスチャに書き出す
+- replay: 呼び出さずにフィクスチャから応答を返す。到着時刻はTRANSPORT_REPLAY_SPEED倍速で再現する
+  （1.0で記録時と同じ速さ、0で待たない）
+
+フィクスチャは呼び出しの種類とリクエストの内容（APIキーなどの認証情報は含めない）の
+ハッシュをファイル名にして、TRANSPORT_FIXTURE_DIR/<種類>/<ハッシュ>.json.gz に保存する。
+同じ入力で同じ呼び出しが行われれば、APIキーのない環境でも同じ応答を再生できる。
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+import requests
+
+MODES = ("live", "record", "replay")
+
+
+class FixtureNotFound(requests.exceptions.ConnectionError):
+    """replayモードで記録がない呼び出し（HTTPの呼び出し元では通信エラーとして扱われる）"""
+
+
+class RecordedCallError(Exception):
+    """記録時に失敗した呼び出しの再生（呼び出し元がエラー種別を判定できるよう、resp.statusとcontentを持つ）"""
+
+    def __init__(self, message: str, status: Optional[int] = None, content: bytes = b""):
+        super().__init__(message)
+        self.resp = type("RecordedResponse", (), {"status": status})()
+        self.content = content
+
+
+def _recorded_error(e: Exception) -> Dict[str, Any]:
+    """失敗した呼び出しの例外を、再生できる形（メッセージ・ステータス・本文）にする"""
+    content = getattr(e, "content", b"") or b""
+    status = getattr(getattr(e, "resp", None), "status", None)
+    return {
+        "message": str(e),
+        "status": int(status) if status is not None else None,
+        "content": content.decode("utf-8", errors="replace") if isinstance(content, bytes) else str(content),
+    }
+
+
+def _replayed_error(error: Dict[str, Any]) -> RecordedCallError:
+    return RecordedCallError(error["message"], error.get("status"), error.get("content", "").encode("utf-8"))
+
+
+class ReplayResponse:
+    """
+    記録したHTTP応答（requests.Responseのうち、このアプリが使う部分だけを持つ）
+
+    iter_contentは記録時の受信チャンクを、記録時の到着時刻に合わせて返す。
+    """
+
+    def __init__(self, fixture: Dict[str, Any], speed: float):
+        self.status_code = fixture["status"]
+        self.headers = fixture.get("headers", {})
+        self.url = fixture["request"]["url"]
+        self.encoding = "utf-8"
+        self._chunks = [(offset, base64.b64decode(data)) for offset, data in fixture["chunks"]]
+        self._speed = speed
+        self._start = time.monotonic()
+        # ヘッダーが届くまでの時間
+        self._wait_until(fixture.get("headers_at", 0.0))
+
+    def _wait_until(self, offset: float) -> None:
+        if self._speed > 0:
+            delay = self._start + offset / self._speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def iter_content(self, chunk_size: Optional[int] = None, decode_unicode: bool = False) -> Iterator[bytes]:
+        for offset, chunk in self._chunks:
+            self._wait_until(offset)
+            yield chunk
+
+    @property
+    def content(self) -> bytes:
+        return b"".join(self.iter_content())
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Transport:
+    """
+    外部API呼び出しの記録・再生
+
+    Args:
+        mode: "live"・"record"・"replay"
+        fixture_dir: フィクスチャを保存するディレクトリ
+        speed: 再生の速さ（記録時の何倍速か、0なら待たない）
+    """
+
+    def __init__(self, mode: str = "live", fixture_dir: str = "fixtures", speed: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}: {mode}")
+        self.mode = mode
+        self.fixture_dir = fixture_dir
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._stats = {"live": 0, "recorded": 0, "replayed": 0, "missing": 0}
+
+    # --- フィクスチャ ---
+
+    def _path(self, kind: str, key_data: Any) -> str:
+        key = hashlib.sha256(
+            json.dumps([kind, key_data], ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:32]
+        return os.path.join(self.fixture_dir, kind, f"{key}.json.gz")
+
+    def _save(self, kind: str, key_data: Any, fixture: Dict[str, Any]) -> None:
+        path = self._path(kind, key_data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(temp, "wt", encoding="utf-8") as f:
+            json.dump({"kind": kind, "request": key_data, **fixture}, f, ensure_ascii=False, default=str)
+        os.replace(temp, path)
+        self._count("recorded")
+
+    def _load(self, kind: str, key_data: Any) -> Dict[str, Any]:
+        path = self._path(kind, key_data)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            self._count("missing")
+            raise FixtureNotFound(f"{kind}の記録がありません（{path}）")
+        self._count("replayed")
+        return fixture
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _sleep_until(self, start: float, offset: float) -> None:
+        if self.speed > 0:
+            delay = start + offset / self.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    # --- 呼び出しの種類ごとの入口 ---
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        kind: str = "http",
+        params: Optional[Dict[str, Any]] = None,
+        json_body: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        stream: bool = False,
+    ):
+        """
+        HTTPリクエストを送る（requests.requestの代わり）
+
+        headersは記録のキーにもフィクスチャにも含めない（認証情報を保存しないため）。
+
+        Returns:
+            liveではrequests.Response、record・replayではReplayResponse
+        """
+        key_data = {"method": method, "url": url, "params": params, "json": json_body}
+        if self.mode == "replay":
+            return ReplayResponse(self._load(kind, key_data), self.speed)
+
+        self._count("live")
+        response = requests.request(
+            method, url, params=params, json=json_body, headers=headers, timeout=timeout, stream=stream or self.mode == "record"
+        )
+        if self.mode == "live":
+            return response
+
+        start = time.monotonic()
+        headers_at = response.elapsed.total_seconds()
+        with response:
+            chunks = [
+                (headers_at + time.monotonic() - start, base64.b64encode(chunk).decode("ascii"))
+                for chunk in response.iter_content(chunk_size=65536)
+            ]
+        fixture = {
+            "status": response.status_code,
+            "headers": {"Content-Type": response.headers.get("Content-Type", "")},
+            "headers_at": headers_at,
+            "chunks": chunks,
+        }
+        self._save(kind, key_data, fixture)
+        # 受信は済んでいるため、待たずに返す
+        return ReplayResponse({**fixture, "request": key_data}, speed=0)
+
+    def call(self, kind: str, key_data: Any, func: Callable[[], Any]) -> Any:
+        """
+        JSONで表せる結果を返す呼び出しを実行する（Google Custom Searchなど）
+
+        Args:
+            kind: 呼び出しの種類
+            key_data: 記録のキーにするリクエストの内容（認証情報を含めないこと）
+            func: 実際に呼び出す関数
+        """
+        if self.mode == "replay":
+            fixture = self._load(kind, key_data)
+            self._sleep_until(time.monotonic(), fixture["elapsed"])
+            if "error" in fixture:
+                raise _replayed_error(fixture["error"])
+            return fixture["result"]
+
+        self._count("live")
+        if self.mode == "live":
+            return func()
+
+        start = time.monotonic()
+        try:
+            result = func()
+        except Exception as e:
+            self._save(kind, key_data, {"elapsed": time.monotonic() - start, "error": _recorded_error(e)})
+            raise
+        self._save(kind, key_data, {"elapsed": time.monotonic() - start, "result": result})
+        return result
+
+    def stream(self, kind: str, key_data: Any, func: Callable[[], Iterable[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+        """
+        イベントのストリームを返す呼び出しを実行する（Bedrockのストリーミングなど）
+
+        recordでは各イベントの到着時刻も記録する。呼び出し元が途中で読むのをやめた場合
+        （必要な数のブログネタがそろって打ち切った場合など）や失敗した場合も、そこまでを
+        truncated・errorの印を付けて保存し、replayでは同じ位置まで再生する。
+        """
+        if self.mode == "replay":
+            fixture = self._load(kind, key_data)
+            start = time.monotonic()
+            for offset, event in fixture["events"]:
+                self._sleep_until(start, offset)
+                yield event
+            if "error" in fixture:
+                raise _replayed_error(fixture["error"])
+            if fixture.get("truncated"):
+                # 記録時はここで読むのをやめたため続きがない（処理の流れが記録時から変わっている）
+                self._count("missing")
+                raise FixtureNotFound(f"{kind}の記録は途中までです（{self._path(kind, key_data)}）")
+            return
+
+        self._count("live")
+        if self.mode == "live":
+            yield from func()
+            return
+
+        start = time.monotonic()
+        events = []
+        outcome: Dict[str, Any] = {"truncated": True}
+        try:
+            for event in func():
+                events.append((time.monotonic() - start, event))
+                yield event
+            outcome = {}
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            outcome = {"error": _recorded_error(e)}
+            raise
+        finally:
+            self._save(kind, key_data, {"events": events, **outcome})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """記録・再生した呼び出しの数（replayでmissingが0でなければ入力が記録時と変わっている）"""
+        with self._lock:
+            return {"mode": self.mode, "fixture_dir": self.fixture_dir, "speed": self.speed, **self._stats}
+
+
+_transport: Optional[Transport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    """プロセス内で共有する外部API呼び出しの経路を取得"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            mode = os.getenv("TRANSPORT_MODE", "live").lower()
+            if mode not in MODES:
+                print(f"TRANSPORT_MODEの値が不正です（{mode}）。liveとして動作します")
+                mode = "live"
+            _transport = Transport(
+                mode=mode,
+                fixture_dir=os.getenv("TRANSPORT_FIXTURE_DIR", "fixtures"),
+                speed=float(os.getenv("TRANSPORT_REPLAY_SPEED", "1.0"))
+            )
+        return _transport
+
+
+def set_transport(transport: Transport) -> None:
+    """プロセス内で共有する経路を置き換える（計測スクリプトで記録と再生を切り替えるため）"""
+    global _transport
+    with _transport_lock:
+        _transport = transport